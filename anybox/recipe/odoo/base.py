@@ -6,6 +6,8 @@ import re
 import urllib
 import tarfile
 import setuptools
+import json
+import hashlib
 import logging
 import stat
 import imp
@@ -23,12 +25,15 @@ from zc.buildout.easy_install import VersionConflict
 from zc.buildout.easy_install import Installer
 
 from zc.buildout.easy_install import IncompatibleConstraintError
+import zc.buildout.easy_install
 
 import zc.recipe.egg
 import httplib
 import rfc822
+
 from urlparse import urlparse
 from . import vcs
+from .vcs.base import BaseRepo
 from . import utils
 from .utils import option_splitlines, option_strip, conf_ensure_section
 
@@ -61,26 +66,72 @@ GP_VCS_EXTEND_DEVELOP = 'vcs-extend-develop'
 GP_DEVELOP_DIR = 'develop-dir'
 
 WITH_ODOO_REQUIREMENTS_FILE_OPTION = 'apply-requirements-file'
+WHEELHOUSE_OPTION = 'requirements-wheelhouse'
+
+SKIP_UNCHANGED_OPTION = 'skip-unchanged'
+
+NOT_INPUTS_BUILDOUT_OPTIONS = ('offline', 'log-level', 'log-format',
+                               'verbosity')
+"""Buildout options that don't change the outcome of an installation."""
+
+CONSTRAINT_ERROR_RE = re.compile(
+    r"The requirement \('([^']+)'\) is not allowed")
+"""Message of :class:`IncompatibleConstraintError` in zc.buildout 2.5."""
+
+UPDATE_SKIP_VCS_METHODS = ('parents', 'is_local_fixed_revision',
+                           'uncommitted_changes')
+"""Methods a VCS class must implement for updates to be skippable."""
 
 
-def pip_version():
-    import pip
-    # we don't use pip or setuptools APIs for that to avoid going
-    # in a swath of instability.
-    # TODO we could try and use the version class from runtime.session
-    # (has the advantage over pkf_resources' of direct transparent
-    # comparison to tuples), but that'd introduced logical deps problems
-    # that I don't want to solve right now.
+def is_current_hash(repo, revspec):
+    """True if revspec is a hash that the repository is already at.
 
-    pip_version = pip.__version__
-    # Naturally, pip has strictly conformed to PEP440, and does not use
-    # version epochs, since at least v1.2. the oldest I could easily check
-    # (we claim to support >= 1.4.1).
-    # This equates all pre versions with the final one, and that's good
-    # enough for current purposes:
-    for suffix in ('a', 'b', 'rc', '.dev', '.post'):
-        pip_version = pip_version.split(suffix)[0]
-    return tuple(int(x) for x in pip_version.split('.'))
+    This is the case of SHA pinning with Git, which is not considered a
+    fixed revision by :meth:`GitRepo.is_local_fixed_revision`, yet makes
+    any update a no-op.
+    """
+    if not re.match(r'[0-9a-f]{7,40}$', revspec):
+        return False
+    parents = repo.parents()
+    return len(parents) == 1 and parents[0].startswith(revspec)
+
+
+def supports_update_skip(repo):
+    """True if the class of repo implements :data:`UPDATE_SKIP_VCS_METHODS`.
+    """
+    return all(getattr(repo.__class__, meth).__func__ is not
+               getattr(BaseRepo, meth).__func__
+               for meth in UPDATE_SKIP_VCS_METHODS)
+
+
+def egg_link_target(path):
+    """Return the real directory an egg-link points to, or ``None``."""
+    try:
+        with open(path) as egg_link:
+            return os.path.realpath(egg_link.readline().strip())
+    except IOError:
+        return None
+
+
+def missing_project_name(exc):
+    """Name of the project an installation error of eggs is about.
+
+    :returns: ``None`` if it can't be told.
+    """
+    if isinstance(exc, MissingDistribution):
+        return exc.data[0].project_name
+    if isinstance(exc, IncompatibleConstraintError):
+        if len(exc.args) > 2:  # older zc.buildout versions
+            return exc.args[2].project_name
+        match = CONSTRAINT_ERROR_RE.search(exc.message)
+        if match is None:
+            return None
+        return pkg_resources.Requirement.parse(match.group(1)).project_name
+    # happens only for zc.buildout >= 2.0
+    words = exc.message.split(os.linesep)[0].split()
+    if not words:
+        return None
+    return re.split(r'[=<>]', words[-1])[0]
 
 
 class BaseRecipe(object):
@@ -150,6 +201,12 @@ class BaseRecipe(object):
     soft_requirements = ()  # subset of requirements that's not necessary
     addons_paths = ()
 
+    develop_fingerprint_files = ('setup.py', 'setup.cfg')
+    """Files of developed distributions their metadata depend on.
+
+    See :meth:`develop_fingerprint`.
+    """
+
     # Caching logic for the main Odoo part (e.g, without addons)
     # Can be 'filename' or 'http-head'
     main_http_caching = 'filename'
@@ -164,7 +221,7 @@ class BaseRecipe(object):
     with_odoo_requirements_file = False
     """Whether attempt to use the 'requirements.txt' shipping with Odoo"""
 
-    def bool_opt_get(self, name, is_global=False):
+    def bool_opt_get(self, name, is_global=False, default=''):
         """Retrieve an option and interpret it as boolean.
 
         Factorized to improve code readability.
@@ -172,14 +229,16 @@ class BaseRecipe(object):
         :param is_global: if ``True``, the option is taken from the
                           global buildout options instead of the part
                           taken care of by this recipe instance.
+        :param default: value to interpret if the option is not set
         """
         options = self.b_options if is_global else self.options
-        return options.get(name, '').lower() == 'true'
+        return options.get(name, default).lower() == 'true'
 
     def __init__(self, buildout, name, options):
         self.requirements = list(self.requirements)
         self.recipe_requirements_path = []
         self.buildout, self.name, self.options = buildout, name, options
+        self.initial_options = dict(options)  # before any normalization
         self.b_options = self.buildout['buildout']
         self.buildout_dir = self.b_options['directory']
         # GR: would prefer lower() but doing as in 'zc.recipe.egg'
@@ -193,11 +252,7 @@ class BaseRecipe(object):
         self.clear_retry = clear_retry == 'true'
 
         if self.bool_opt_get(WITH_ODOO_REQUIREMENTS_FILE_OPTION):
-            logger.debug("%s option: adding 'pip' to the recipe requirements",
-                         WITH_ODOO_REQUIREMENTS_FILE_OPTION)
             self.with_odoo_requirements_file = True
-            self.recipe_requirements = list(self.recipe_requirements)
-            self.recipe_requirements.append('pip')
 
         # same as in zc.recipe.eggs
         self.extra_paths = [
@@ -386,105 +441,82 @@ class BaseRecipe(object):
                         "Proceeding anyway.", req_fname)
             return
 
-        # pip wouldn't be importable before the call to
-        # install_recipe_requirements()
-
-        # if an extension has used pip before, it can be left in a
-        # strange state where pip.req is not usable nor reloadable
-        # anymore. (may have something to do with the fact that the
-        # first import is done from a tmp dir
-        # that does not exist any more).
-        # So, better to clean that before hand.
-        for k in sys.modules.keys():
-            if k.split('.', 1)[0] == 'pip':
-                del sys.modules[k]
-
         # it is useless to mutate the versions section at this point
         # it's already been used to populate the Installer class variable
         versions = Installer._versions
         develops = self.list_develops()
 
         new_reqs = set()
-        if pip_version() < (8, 1, 2):
-            self.read_requirements_pip_before_v8(req_path, versions, develops)
-        else:
-            self.read_requirements_pip_after_v8(req_path, versions, develops)
+        project_names = self.read_requirements_file(req_path, versions,
+                                                    develops)
         self.merge_requirements(reqs=new_reqs)
 
-    def read_requirements_pip_before_v8(self, req_path, versions, develops):
-        from pip.req import parse_requirements
-        if pip_version() < (1, 5):
-            parsed = parse_requirements(req_path)
-        else:
-            # pip internals are protected against the fact of not passing
-            # a session with ``is None``. OTOH, the session is not used
-            # if the file is local (direct path, not an URL), so we cheat
-            # it.
-            # Although this hack still works with pip 8, it's considered to be
-            # the kind of thing that can depend on pip version
-            fake_session = object()
-            parsed = parse_requirements(req_path, session=fake_session)
-
-        for inst_req in parsed:
-            req = inst_req.req
-            logger.debug("Considering requirement from Odoo's file %s",
-                         req)
-            # GR something more interesting would be to apply the
-            # requirement if it does not contradict an existing one.
-            # For now that's too much complicated, but check later if
-            # zc.buildout.easy_install._constrain() fits the bill.
-
-            project_name = req.project_name
-            if project_name not in self.requirements:
-                # TODO maybe convert self.requirements to a set (in
-                # next unstable branch)
-                self.requirements.append(project_name)
+        if self.options.get(WHEELHOUSE_OPTION):
+            self.install_from_wheelhouse(
+                dict((name, versions[name]) for name in project_names
+                     if name in versions and name not in develops))
 
-            if project_name in versions:
-                logger.debug("Requirement from Odoo's file %s superseded "
-                             "by buildout versions configuration as %r",
-                             req, versions[project_name])
-                continue
+    def install_from_wheelhouse(self, pins):
+        """Make pinned requirements available as eggs, through wheels.
 
-            if project_name in develops:
-                logger.debug("Requirement from Odoo's file %s superseded "
-                             "by a direct develop directive", req)
-                continue
+        The wheels are taken from the wheelhouse given by the
+        :data:`WHEELHOUSE_OPTION` option, or built there first (unless
+        offline), then converted to eggs in the eggs directory, where
+        zc.buildout will find them.
 
-            if not req.specs:
+        :param pins: dict of versions, indexed by project names
+        """
+        from .wheelhouse import Wheelhouse
+        house = Wheelhouse(self.make_absolute(
+            os.path.expanduser(self.options[WHEELHOUSE_OPTION])))
+        eggs_dir = self.b_options['eggs-directory']
+        env = pkg_resources.Environment([eggs_dir])
+        for project_name, version in sorted(pins.items()):
+            wanted = pkg_resources.parse_version(version)
+            # Environment keys are normalized, as egg names are
+            key = pkg_resources.safe_name(project_name).lower()
+            if any(dist.parsed_version == wanted for dist in env[key]):
                 continue
 
-            supported = True
-
-            if len(req.specs) > 1:
-                supported = False
-            spec = req.specs[0]
-            if spec[0] != '==':
-                supported = False
-
-            if not supported:
-                raise UserError(
-                    "Version requirement %s from Odoo's requirement file "
-                    "is too complicated to be taken automatically into "
-                    "account. Please translate it in your [%s] "
-                    "configuration section and, "
-                    "if from a public fork of Odoo, report this as a "
-                    "request for improvement on the buildout recipe." % (
-                        req, self.b_options.get('versions', 'versions')))
-
-            logger.debug("Applying requirement %s from Odoo's file",
-                         req)
-            versions[project_name] = spec[1]
-
-    def read_requirements_pip_after_v8(self, req_path, versions, develops):
-        from pip.req import parse_requirements
-        # pip internals are protected against the fact of not passing
-        # a session with ``is None``. OTOH, the session is not used
-        # if the file is local (direct path, not an URL), so we cheat
-        # it.
-        fake_session = object()
-        for inst_req in parse_requirements(req_path, session=fake_session):
-            req = inst_req.req
+            wheel = house.find(project_name, version)
+            if wheel is None:
+                if self.offline:
+                    logger.warn("No wheel for %s==%s in %r, can't build "
+                                "one in offline mode.",
+                                project_name, version, house.path)
+                    continue
+                wheel = house.build(
+                    project_name, version,
+                    index=self.b_options.get('index'),
+                    find_links=self.b_options.get('find-links', '').split(),
+                    pythonpath=self.wheel_build_paths())
+            house.install_as_egg(wheel, eggs_dir)
+
+    def wheel_build_paths(self):
+        """Paths to give pip through PYTHONPATH to build wheels.
+
+        As for :meth:`develop`, the interpreter may lack what the recipe
+        runs with, namely pip (a requirement of the recipe), setuptools
+        and wheel, if available.
+        """
+        paths = list(self.recipe_requirements_paths)
+        for project_name in ('pip', 'setuptools', 'wheel'):
+            dist = pkg_resources.working_set.find(
+                pkg_resources.Requirement.parse(project_name))
+            if dist is not None and dist.location not in paths:
+                paths.append(dist.location)
+        return paths
+
+    def read_requirements_file(self, req_path, versions, develops):
+        """Read Odoo's requirements file, and apply its version constraints.
+
+        :param versions: the versions constraints, updated in place
+        :param develops: projects that are developed, hence not constrained
+        :returns: the names of all projects of the file
+        """
+        from .requirements import parse_requirements
+        project_names = []
+        for req in parse_requirements(req_path):
             logger.debug("Considering requirement from Odoo's file %s",
                          req)
             # GR something more interesting would be to apply the
@@ -494,7 +526,8 @@ class BaseRecipe(object):
 
             # zc.buildout does its version comparison in lower case
             # watch out for develops if that's the same !
-            project_name = req.name.lower()
+            project_name = req.project_name.lower()
+            project_names.append(project_name)
             if project_name not in self.requirements:
                 # TODO maybe convert self.requirements to a set (in
                 # next unstable branch)
@@ -511,19 +544,10 @@ class BaseRecipe(object):
                              "by a direct develop directive", req)
                 continue
 
-            specs = req.specifier
-            if not specs:
+            if not req.specs:
                 continue
 
-            supported = True
-
-            if len(specs) > 1:
-                supported = False
-            spec = specs.__iter__().next()
-            if spec.operator != '==':
-                supported = False
-
-            if not supported:
+            if len(req.specs) > 1 or req.specs[0][0] != '==':
                 raise UserError(
                     "Version requirement %s from Odoo's requirement file "
                     "is too complicated to be taken automatically into "
@@ -535,63 +559,207 @@ class BaseRecipe(object):
 
             logger.debug("Applying requirement %s from Odoo's file",
                          req)
-            versions[project_name] = spec.version
+            versions[project_name] = req.specs[0][1]
+        return project_names
+
+    def discard_unavailable_soft_requirements(self):
+        """Remove direct soft requirements that can't be installed.
+
+        Availability is checked in the eggs and develop eggs directories,
+        and, unless buildout runs offline, in the package index and
+        find-links, so that the installation of eggs is attempted only
+        once.
+
+        :returns: the list of requirements that have been removed from the
+                  ``eggs`` option.
+        """
+        eggs = option_splitlines(self.options.get('eggs'))
+        soft = [egg for egg in eggs
+                if pkg_resources.Requirement.parse(egg).project_name
+                in self.soft_requirements]
+        if not soft:
+            return []
+
+        # Installer._constrain(), _env and _obtain() are private, this has
+        # been checked against zc.buildout 2.5.3. Without them, missing
+        # soft requirements are reported by the installation itself.
+        if not all(hasattr(Installer, attr)
+                   for attr in ('_constrain', '_obtain')):
+            return []
+
+        b_options = self.b_options
+        installer = Installer(
+            dest=b_options['eggs-directory'],
+            links=b_options.get('find-links', '').split(),
+            index=b_options.get('index'),
+            path=[b_options['develop-eggs-directory']],
+            newest=False,
+            allow_hosts=tuple(b_options.get('allow-hosts', '').split()) or (
+                '*', ))
+        unavailable = []
+        for egg in soft:
+            req = pkg_resources.Requirement.parse(egg)
+            try:
+                req = installer._constrain(req)
+                if any(dist in req
+                       for dist in installer._env[req.project_name]):
+                    continue
+                if not self.offline and installer._obtain(req) is not None:
+                    continue
+            except UserError as exc:  # includes constraint errors
+                if missing_project_name(exc) != req.project_name:
+                    raise
+                logger.debug("While looking for %r: %s", egg, exc)
+            logger.error("Could not find %r. " +
+                         self.missing_deps_instructions.get(egg, ''), egg)
+            logger.warn("%r is a direct soft requirement, "
+                        "installing without it", egg)
+            unavailable.append(egg)
+
+        if unavailable:
+            self.options['eggs'] = os.linesep.join(
+                egg for egg in eggs if egg not in unavailable)
+        return unavailable
 
     def install_requirements(self):
         """Install egg requirements and scripts.
 
-        If some distributions are known as soft requirements, will retry
-        without them
+        Direct soft requirements that aren't available are left out
+        beforehand (see :meth:`discard_unavailable_soft_requirements`).
         """
         if self.with_odoo_requirements_file:
             self.apply_odoo_requirements_file()
 
-        while True:
-            missing = None
-            eggs_recipe = zc.recipe.egg.Scripts(self.buildout, '',
-                                                self.options)
-            try:
-                eggs_recipe.install()
-            except MissingDistribution as exc:
-                missing = exc.data[0].project_name
-            except VersionConflict as exc:
-                # GR not 100% sure, but this should mean a conflict with an
-                # already loaded version (don't know what can lead to this
-                # 'already', have seen it with zc.buildout itself only so far)
-                # In any case, removing the requirement can't make for a sane
-                # recovery
-                raise
-            except IncompatibleConstraintError as exc:
-                missing = exc.args[2].project_name
-            except UserError, exc:  # happens only for zc.buildout >= 2.0
-                missing = exc.message.split(os.linesep)[0].split()[-1]
-                missing = re.split(r'[=<>]', missing)[0]
-            else:
-                break
-
-            logger.error("Could not find or install %r. " +
-                         self.missing_deps_instructions.get(missing, '') +
-                         " Original exception %s.%s says: %s",
-                         missing,
-                         exc.__class__.__module__, exc.__class__.__name__, exc)
-            if missing not in self.soft_requirements:
-                raise exc
-
-            eggs = set(self.options['eggs'].split(os.linesep))
-            if missing not in eggs:
-                logger.error("Soft requirement %r is also an indirect "
-                             "dependency (either of OpenERP/Odoo or of "
-                             "one listed in config file). Can't retry.",
-                             missing)
-                raise exc
+        self.discard_unavailable_soft_requirements()
+        eggs_recipe = zc.recipe.egg.Scripts(self.buildout, '', self.options)
+
+        cache_key = self.working_set_cache_key()
+        cached = self.read_working_set_cache(cache_key)
+        if cached is not None:
+            logger.info("Eggs requirements unchanged, reusing the working "
+                        "set resolved in a previous run")
+        resolved = [cached]
+        resolve = eggs_recipe.working_set
+
+        def working_set(extra=()):
+            # resolve once, whatever the number of calls
+            if resolved[0] is None:
+                resolved[0] = resolve(extra)
+            reqs, ws = resolved[0]
+            return list(reqs), ws  # Scripts.install() alters the list
+        eggs_recipe.working_set = working_set
 
-            logger.warn("%r is a direct soft requirement, "
-                        "retrying without it", missing)
-            eggs.discard(missing)
-            self.options['eggs'] = os.linesep.join(eggs)
+        try:
+            eggs_recipe.install()
+        except VersionConflict as exc:
+            # GR not 100% sure, but this should mean a conflict with an
+            # already loaded version (don't know what can lead to this
+            # 'already', have seen it with zc.buildout itself only so far)
+            raise
+        except UserError, exc:
+            missing = missing_project_name(exc)
+        else:
+            self.eggs_reqs, self.eggs_ws = eggs_recipe.working_set()
+            self.ws = self.eggs_ws
+            if cached is None:
+                self.write_working_set_cache(cache_key)
+            return
+
+        logger.error("Could not find or install %r. " +
+                     self.missing_deps_instructions.get(missing, '') +
+                     " Original exception %s.%s says: %s",
+                     missing,
+                     exc.__class__.__module__, exc.__class__.__name__, exc)
+        if missing in self.soft_requirements:
+            logger.error("Soft requirement %r is also an indirect "
+                         "dependency (either of OpenERP/Odoo or of "
+                         "one listed in config file). Can't proceed "
+                         "without it.", missing)
+        raise exc
+
+    @property
+    def working_set_cache_path(self):
+        return join(self.etc, self.name + '.working_set.json')
+
+    def working_set_cache_key(self):
+        """Digest of what the resolution of eggs requirements depends on.
+
+        These are the requirements, the versions constraints, the develop
+        eggs and their metadata (see :meth:`develop_links`), the locations
+        where to look for distributions, and the Python interpreter.
+        """
+        b_options = self.b_options
+        inputs = dict(
+            eggs=sorted(set(option_splitlines(self.options.get('eggs')))),
+            versions=sorted(Installer._versions.items()),
+            develops=self.develop_links(),
+            eggs_directory=b_options['eggs-directory'],
+            find_links=option_splitlines(b_options.get('find-links')),
+            index=b_options.get('index'),
+            allow_hosts=option_splitlines(b_options.get('allow-hosts')),
+            python=[sys.executable, sys.version])
+        return hashlib.sha1(json.dumps(inputs, sort_keys=True)).hexdigest()
+
+    def read_working_set_cache(self, key):
+        """Rebuild the working set stored by :meth:`write_working_set_cache`.
+
+        The cache is not used if ``key`` doesn't match, if a distribution
+        is not at its recorded location any more, or if a new resolution
+        could pick up newer distributions from the indexes: all
+        distributions must be either pinned, or develop ones, unless
+        running in offline or non-newest mode.
+
+        :returns: ``None`` or a pair (requirements, working set), as the
+                  ``working_set()`` method of :mod:`zc.recipe.egg` would.
+        """
+        try:
+            with open(self.working_set_cache_path) as cache_file:
+                cache = json.load(cache_file)
+        except (IOError, ValueError):
+            return None
+        if cache.get('key') != key:
+            return None
+        if not (cache['pinned'] or self.offline or
+                self.b_options.get('newest') == 'false'):
+            return None
 
-        self.eggs_reqs, self.eggs_ws = eggs_recipe.working_set()
-        self.ws = self.eggs_ws
+        ws = pkg_resources.WorkingSet([])
+        for name, version, location in cache['distributions']:
+            location = str(location)
+            dists = (pkg_resources.find_distributions(location)
+                     if os.path.exists(location) else ())
+            for dist in dists:
+                if dist.project_name == name and dist.version == version:
+                    ws.add(dist)
+                    break
+            else:
+                logger.debug("Distribution %s %s not found in %r, "
+                             "working set cache not usable",
+                             name, version, location)
+                return None
+        return [str(req) for req in cache['requirements']], ws
+
+    def write_working_set_cache(self, key):
+        """Store the current working set, for :meth:`read_working_set_cache`.
+        """
+        dists = list(self.ws)
+        with open(self.working_set_cache_path, 'w') as cache_file:
+            json.dump(dict(key=key,
+                           pinned=self.working_set_pinned(),
+                           requirements=self.eggs_reqs,
+                           distributions=[(d.project_name, d.version,
+                                           d.location) for d in dists]),
+                      cache_file)
+
+    def working_set_pinned(self):
+        """True if all distributions of :attr:`ws` are pinned or develop ones.
+
+        Otherwise, a new resolution could pick up newer distributions.
+        """
+        versions = Installer._versions
+        return all(d.precedence == pkg_resources.DEVELOP_DIST or
+                   versions.get(d.project_name.lower()) == d.version
+                   for d in self.ws)
 
     def apply_version_dependent_decisions(self):
         """Store some booleans depending on detected version.
@@ -718,8 +886,19 @@ class BaseRecipe(object):
                   This is useful for OpenERP/Odoo itself, whose project name
                   changed within the 8.0 stable branch.
         """
-        logger.debug("Developing %r", src_directory)
         develop_dir = self.b_options['develop-eggs-directory']
+        records = self.read_develop_records()
+        record = records.get(src_directory)
+        if (record is not None and
+                record['fingerprint'] == self.develop_fingerprint(
+                    src_directory) and
+                egg_link_target(join(develop_dir, record['egg_link'])) ==
+                os.path.realpath(src_directory)):
+            logger.debug("%r is unchanged since it's been developed",
+                         src_directory)
+            return str(record['egg_link'][:-len('.egg-link')])
+
+        logger.debug("Developing %r", src_directory)
         pythonpath_bak = os.getenv('PYTHONPATH')
         os.putenv('PYTHONPATH', ':'.join(self.recipe_requirements_paths))
 
@@ -737,8 +916,74 @@ class BaseRecipe(object):
                 "Development of OpenERP/Odoo distribution "
                 "produced an unexpected egg link: %r" % egg_link)
 
+        records[src_directory] = dict(
+            egg_link=os.path.basename(egg_link),
+            fingerprint=self.develop_fingerprint(src_directory))
+        with open(self.develop_records_path, 'w') as records_file:
+            json.dump(records, records_file)
         return os.path.basename(egg_link)[:-len(suffix)]
 
+    @property
+    def develop_records_path(self):
+        return join(self.etc, self.name + '.develops.json')
+
+    def read_develop_records(self):
+        """Read what :meth:`develop` recorded, indexed by source directory.
+        """
+        try:
+            with open(self.develop_records_path) as records_file:
+                return json.load(records_file)
+        except (IOError, ValueError):
+            return {}
+
+    def develop_links(self):
+        """List the develop eggs of the buildout.
+
+        :returns: list of (egg-link file name, target directory,
+                  fingerprint) triples, the fingerprint being that of
+                  :meth:`develop_fingerprint`, or ``False`` if the target
+                  directory is missing.
+        """
+        develops = []
+        develop_dir = self.b_options['develop-eggs-directory']
+        if not os.path.isdir(develop_dir):
+            return develops
+        for fname in sorted(os.listdir(develop_dir)):
+            if not fname.endswith('.egg-link'):
+                continue
+            target = egg_link_target(join(develop_dir, fname))
+            develops.append((fname, target,
+                             target is not None and
+                             os.path.isdir(target) and
+                             self.develop_fingerprint(target)))
+        return develops
+
+    def develop_fingerprint(self, src_directory):
+        """Digest of what the development of a distribution depends on.
+
+        These are the contents of :attr:`develop_fingerprint_files` and of
+        the egg-info directories, as produced by development.
+
+        :returns: ``None`` if there's no egg-info directory.
+        """
+        sha = hashlib.sha1()
+        paths = [join(src_directory, f)
+                 for f in self.develop_fingerprint_files]
+        egg_infos = [join(src_directory, d)
+                     for d in sorted(os.listdir(src_directory))
+                     if d.endswith('.egg-info')]
+        if not egg_infos:
+            return None
+        for egg_info in egg_infos:
+            paths.extend(join(egg_info, f)
+                         for f in sorted(os.listdir(egg_info)))
+        for path in paths:
+            sha.update(path + '\0')
+            if os.path.isfile(path):
+                with open(path) as f:
+                    sha.update(f.read())
+        return sha.hexdigest()
+
     def parse_addons(self, options):
         """Parse the addons options into :attr:`sources`.
 
@@ -1136,6 +1381,7 @@ class BaseRecipe(object):
             self.extract_downloads_to(extract_downloads_to)
         if freeze_to:
             self.freeze_to(freeze_to)
+        self.write_inputs_record()
         return self.openerp_installed
 
     def dump_nightly_latest_version(self):
@@ -1234,35 +1480,13 @@ class BaseRecipe(object):
         if not lines:
             return ()
 
-        try:
-            import pip.req
-        except ImportError:
-            logger.error("You have vcs-extends-develop distributions "
-                         "but pip is not available. That means that "
-                         "gp.vcsdevelop is not properly installed. Did "
-                         "you ever run that buildout ?")
-            raise
-
-        if 'parse_editable' in dir(pip.req):  # pip < 6.0
-            def parse_egg_dir(req_str):
-                return pip.req.parse_editable(req_str)[0]
-        else:
-            def parse_egg_dir(req_str):
-                ireq = pip.req.InstallRequirement.from_editable(req_str)
-                # GR I'm worried because now this is also used as project
-                # name in requirement, whereas it used to just be the target
-                # directory
-                editable_options = getattr(ireq, 'editable_options', None)
-                if editable_options is not None:  # pip < 8.1.0
-                    return editable_options['egg']
-                try:
-                    return ireq.req.name  # pip >= 8.1.2
-                except AttributeError:
-                    return ireq.req.project_name  # pip >=8.1.0, < 8.1.2
-
+        from .requirements import parse_editable
         ret = []
         for raw in option_splitlines(lines):
-            target = parse_egg_dir(raw)
+            # GR I'm worried because this is also used as project
+            # name in requirement, whereas it used to just be the target
+            # directory
+            target = parse_editable(raw)
             abs_path = os.path.join(base_path, target)
             ret.append((raw, target, sub_dir, abs_path))
         return tuple(ret)
@@ -1585,7 +1809,163 @@ class BaseRecipe(object):
     def _create_default_config(self):
         raise NotImplementedError
 
-    update = install
+    def update(self):
+        """Install again, unless the inputs of the part are unchanged.
+
+        See :meth:`update_skip_blocker` and :meth:`inputs_digest`.
+        """
+        record = self.read_inputs_record()
+        if record is None:
+            return self.install()
+        blocker = self.update_skip_blocker(record)
+        if blocker is not None:
+            logger.debug("Part %r can't be skipped: %s", self.name, blocker)
+            return self.install()
+        if record['digest'] != self.inputs_digest():
+            logger.debug("Part %r can't be skipped: inputs have changed",
+                         self.name)
+            return self.install()
+        logger.info("Inputs of part %r are unchanged, nothing to do",
+                    self.name)
+        return record['installed']
+
+    @property
+    def inputs_record_path(self):
+        return join(self.etc, self.name + '.inputs.json')
+
+    def read_inputs_record(self):
+        """Read what has been stored by :meth:`write_inputs_record`.
+
+        :returns: ``None`` if there's no usable record.
+        """
+        try:
+            with open(self.inputs_record_path) as record_file:
+                return json.load(record_file)
+        except (IOError, ValueError):
+            return None
+
+    def write_inputs_record(self):
+        """Store the inputs digest and installed files after installation.
+        """
+        if not self.bool_opt_get(SKIP_UNCHANGED_OPTION, default='true'):
+            return
+        with open(self.inputs_record_path, 'w') as record_file:
+            json.dump(dict(digest=self.inputs_digest(),
+                           pinned=(getattr(self, 'ws', None) is not None and
+                                   self.working_set_pinned()),
+                           installed=self.openerp_installed,
+                           openerp_dir=self.openerp_dir), record_file)
+
+    def inputs_digest(self):
+        """Digest of the effective inputs of the part.
+
+        These are the part options, as given to the recipe, the buildout
+        options (except :data:`NOT_INPUTS_BUILDOUT_OPTIONS`), the versions
+        section, the version of the recipe, the
+        current revisions of the VCS sources, the develop eggs (see
+        :meth:`develop_fingerprint`) and Odoo's requirements file.
+        """
+        try:
+            recipe_version = pkg_resources.get_distribution(
+                'anybox.recipe.odoo').version
+        except pkg_resources.DistributionNotFound:
+            recipe_version = None
+
+        versions = ()
+        versions_section = self.b_options.get('versions')
+        if versions_section:
+            try:
+                versions = sorted(self.buildout[versions_section].items())
+            except KeyError:
+                pass
+
+        revisions = []
+        for local_dir, source in self.sources.items():
+            if source[0] in ('local', 'downloadable'):
+                continue
+            local_dir = self.source_local_dir(local_dir)
+            repo = vcs.repo(source[0], local_dir, '')
+            if supports_update_skip(repo) and os.path.isdir(local_dir):
+                revisions.append((local_dir, repo.parents()))
+
+        requirements = None
+        if self.openerp_dir is not None:
+            req_path = join(self.openerp_dir, 'requirements.txt')
+            if os.path.isfile(req_path):
+                with open(req_path) as req_file:
+                    requirements = hashlib.sha1(req_file.read()).hexdigest()
+
+        inputs = dict(recipe=[self.__class__.__name__, recipe_version],
+                      options=sorted(self.initial_options.items()),
+                      buildout=sorted(
+                          (k, v) for k, v in self.b_options.items()
+                          if k not in NOT_INPUTS_BUILDOUT_OPTIONS),
+                      versions=versions,
+                      revisions=revisions,
+                      develops=self.develop_links(),
+                      requirements=requirements)
+        return hashlib.sha1(json.dumps(inputs, sort_keys=True)).hexdigest()
+
+    def source_local_dir(self, local_dir):
+        """Absolute path of a source from :attr:`sources`."""
+        if local_dir is main_software:
+            return self.openerp_dir
+        return self.make_absolute(local_dir)
+
+    def update_skip_blocker(self, record):
+        """Tell why the whole update cannot be skipped.
+
+        Skipping is possible only if the outcome of :meth:`install` would
+        not depend on anything else than what :meth:`inputs_digest` is
+        made of: remote repositories that might have changed in the
+        meanwhile must not be involved, nor operations with side effects,
+        nor eggs that aren't pinned, unless no newer ones would be looked
+        for (offline or non-newest mode).
+
+        :param record: as read by :meth:`read_inputs_record`
+        :returns: ``None`` if skipping is possible, the reason otherwise.
+        """
+        if not self.bool_opt_get(SKIP_UNCHANGED_OPTION, default='true'):
+            return "disabled by the %r option" % SKIP_UNCHANGED_OPTION
+        for option in ('freeze-to', 'extract-downloads-to'):
+            if self.options.get(option):
+                return "%r option" % option
+        if self.clean:
+            return "'clean' option"
+        if self.merges:
+            return "merges"
+        if not (record.get('pinned') or self.offline or
+                self.b_options.get('newest') == 'false'):
+            return "eggs that aren't pinned may have newer releases"
+        if self.openerp_dir is None:
+            self.openerp_dir = record.get('openerp_dir')
+        for path in record['installed'] + [self.config_path,
+                                           self.openerp_dir]:
+            if path is None or not os.path.exists(path):
+                return "%r is missing" % path
+
+        for local_dir, source in self.sources.items():
+            source_type = source[0]
+            if source_type == 'local':
+                continue
+            if source_type == 'downloadable':
+                if self.main_http_caching != 'filename':
+                    return "freshness of %r must be checked" % source[1]
+                continue
+            local_dir = self.source_local_dir(local_dir)
+            if not os.path.isdir(local_dir):
+                return "%r is missing" % local_dir
+            repo = vcs.repo(source_type, local_dir, '')
+            if not supports_update_skip(repo):
+                return "%r sources can't be checked for changes" % (
+                    source_type, )
+            revspec = source[1][1]
+            if not (self.offline or repo.is_local_fixed_revision(revspec) or
+                    is_current_hash(repo, revspec)):
+                return "%r tracks a revision that may have moved" % (
+                    local_dir, )
+            if repo.uncommitted_changes():
+                return "%r has local modifications" % local_dir
 
     def _default_addons_path(self):
         """Set the default addons path for OpenERP > 6.0 pure python install
@@ -0,0 +1,142 @@
+"""Parsing of pip requirements files, without pip.
+
+Only the subset of the syntax that Odoo's ``requirements.txt`` files and
+the ``vcs-extend-develop`` option of gp.vcsdevelop use is supported:
+
+* requirement specifiers, such as ``lxml==3.4.1``, possibly with extras
+  and environment markers,
+* comments, blank lines and line continuations,
+* inclusion of other local files with ``-r`` (``--requirement``),
+* editable requirements (``-e``, ``--editable``), whose project name is
+  taken from the ``#egg=`` fragment of their URL,
+* global options, such as ``--index-url``, which are ignored.
+
+Requirement specifiers are parsed by :mod:`pkg_resources`, that is always
+available at buildout time, whereas importing pip is slow, and its internal
+API changes from one version to the next.
+"""
+import os
+import re
+import logging
+
+from zc.buildout import UserError
+
+logger = logging.getLogger(__name__)
+
+COMMENT_RE = re.compile(r'(^|\s+)#.*$')
+EGG_FRAGMENT_RE = re.compile(r'[#&]egg=([^&]+)')
+
+IGNORED_OPTIONS = ('-i', '--index-url', '--extra-index-url', '--no-index',
+                   '-f', '--find-links', '--trusted-host', '--pre',
+                   '--allow-external', '--allow-unverified',
+                   '--allow-all-external', '--process-dependency-links',
+                   '-Z', '--always-unzip', '--no-binary', '--only-binary')
+
+_cache = {}  # path -> ((mtime, size), logical lines)
+
+
+def logical_lines(text):
+    """Iterate on the meaningful lines of a requirements file.
+
+    >>> list(logical_lines('# comment\\n\\nfoo==1.0  # bar\\n'
+    ...                    'spam>=2.0,\\\\\\n<3\\n'))
+    ['foo==1.0', 'spam>=2.0,<3']
+    """
+    pending = ''
+    for line in text.splitlines():
+        if line.endswith('\\'):
+            pending += line[:-1]
+            continue
+        line = COMMENT_RE.sub('', pending + line).strip()
+        pending = ''
+        if line:
+            yield line
+    if pending.strip():
+        yield pending.strip()
+
+
+def parse_editable(spec):
+    """Return the project name of an editable requirement.
+
+    >>> parse_editable('git+https://example.com/repo.git@8.0#egg=anybox.foo')
+    'anybox.foo'
+    >>> parse_editable('hg+http://example.com/repo#egg=bar[extra]&sub=x')
+    'bar'
+    """
+    match = EGG_FRAGMENT_RE.search(spec)
+    if match is None:
+        raise UserError("Could not find the project name in editable "
+                        "requirement %r, please specify it "
+                        "with '#egg=' " % spec)
+    return match.group(1).split('[', 1)[0].strip()
+
+
+def parse_requirement(spec):
+    """Parse a requirement specifier.
+
+    :returns: a :class:`pkg_resources.Requirement` instance, or ``None`` if
+              it has an environment marker that doesn't match the current
+              one.
+
+    >>> parse_requirement('lxml==3.4.1').specs
+    [('==', '3.4.1')]
+    """
+    from pkg_resources import Requirement
+    try:
+        req = Requirement.parse(spec)
+    except ValueError, exc:
+        raise UserError("Unsupported requirement %r (%s)" % (spec, exc))
+    marker = getattr(req, 'marker', None)
+    if marker is not None and not marker.evaluate():
+        logger.debug("Requirement %r does not apply to this environment",
+                     spec)
+        return None
+    return req
+
+
+def read_lines(path):
+    """Return the logical lines of a file, cached while it's not modified.
+    """
+    stat = os.stat(path)
+    key = (stat.st_mtime, stat.st_size)
+    cached = _cache.get(path)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
+    with open(path) as req_file:
+        lines = tuple(logical_lines(req_file.read()))
+    _cache[path] = key, lines
+    return lines
+
+
+def parse_requirements(path):
+    """Parse a requirements file, and the files it includes.
+
+    :returns: a list of :class:`pkg_resources.Requirement` instances.
+              Editable requirements appear without version specifiers.
+    """
+    path = os.path.abspath(path)
+    reqs = []
+    for line in read_lines(path):
+        if not line.startswith('-'):
+            if '://' in line or line.startswith('.'):
+                raise UserError("Requirement %r from %r: URLs and paths "
+                                "are not supported" % (line, path))
+            req = parse_requirement(line)
+            if req is not None:
+                reqs.append(req)
+            continue
+
+        option, value = re.match(r'(-\w|--[\w-]+)[\s=]*(.*)$',
+                                 line).groups()
+        if option in ('-r', '--requirement'):
+            reqs.extend(parse_requirements(
+                os.path.join(os.path.dirname(path), value)))
+        elif option in ('-e', '--editable'):
+            reqs.append(parse_requirement(parse_editable(value)))
+        elif option in IGNORED_OPTIONS:
+            logger.debug("Ignoring %r in requirements file %r", line, path)
+        else:
+            raise UserError("Unsupported option in requirements file "
+                            "%r: %r" % (path, line))
+    return reqs
@@ -0,0 +1,348 @@
+"""Cron worker processing the jobs of several databases concurrently.
+
+This is the cron worker script used along with Gunicorn for Odoo >= 8
+(see the ``gunicorn`` option of the recipe). It plays the same role as
+the cron workers of the Odoo prefork server, with the following
+differences:
+
+* the databases are processed by a bounded pool of worker processes, so
+  that a long job in one database does not delay the jobs of the others.
+  Each database is pinned to one of the workers (see
+  :func:`worker_index`), that therefore holds the registries of its own
+  databases only.
+* if no database is specified, the Odoo databases are discovered (see
+  :func:`.databases.list_databases`), and discovered again periodically.
+* the registries are kept from one poll to the next, only database
+  connections are released. Workers are replaced only if they exceed
+  a given amount of memory (see :class:`PinnedWorker`).
+* each job is measured. Jobs lasting longer than their interval are
+  logged, and measures can be appended to a file (see :class:`JobStats`).
+"""
+import os
+import sys
+import time
+import json
+import zlib
+import signal
+import logging
+import resource
+import multiprocessing
+from collections import deque
+from argparse import ArgumentParser
+from argparse import ArgumentDefaultsHelpFormatter
+
+logger = logging.getLogger('openerp.cron_worker')
+
+stopping = False
+
+INTERVAL_SECONDS = dict(minutes=60, hours=3600, work_days=86400,
+                        days=86400, weeks=7 * 86400, months=30 * 86400)
+"""Durations of the interval units of cron jobs (approximate for months).
+"""
+
+job_records = []
+"""Measures of the jobs run by the current task of a pool worker."""
+
+
+def job_interval(job):
+    """Return the interval of a job, in seconds.
+
+    >>> job_interval(dict(interval_number=2, interval_type='hours'))
+    7200
+    """
+    return job['interval_number'] * INTERVAL_SECONDS.get(job['interval_type'],
+                                                         0)
+
+
+def instrument_jobs():
+    """Make :class:`ir_cron` record the measures of each job it runs.
+
+    The records are appended to :data:`job_records`.
+    """
+    from openerp.addons.base.ir.ir_cron import ir_cron
+    process_job = ir_cron._process_job
+    handle_exception = ir_cron._handle_callback_exception
+
+    def _process_job(self, job_cr, job, cron_cr):
+        record = dict(database=job_cr.dbname,
+                      job_id=job['id'],
+                      name=job['name'],
+                      interval=job_interval(job),
+                      start=time.time(),
+                      outcome='success')
+        job_records.append(record)
+        try:
+            return process_job(self, job_cr, job, cron_cr)
+        except Exception:
+            record['outcome'] = 'failure'
+            raise
+        finally:
+            record['end'] = time.time()
+            record['duration'] = record['end'] - record['start']
+
+    def _handle_callback_exception(self, *args, **kwargs):
+        # job failures are caught by ir.cron, before reaching _process_job
+        if job_records and 'end' not in job_records[-1]:
+            job_records[-1]['outcome'] = 'failure'
+        return handle_exception(self, *args, **kwargs)
+
+    ir_cron._process_job = _process_job
+    ir_cron._handle_callback_exception = _handle_callback_exception
+
+
+def process_database(db_name):
+    """Run the pending cron jobs of a database. Executed by pool workers.
+
+    :returns: the records of the jobs that have been run, and the peak
+              resident memory of the worker, in bytes
+    """
+    import openerp
+    import openerp.addons.base
+    del job_records[:]
+    try:
+        openerp.addons.base.ir.ir_cron.ir_cron._acquire_job(db_name)
+    except Exception:
+        logger.exception("Failure while processing cron jobs of database %r",
+                         db_name)
+    finally:
+        openerp.sql_db.close_db(db_name)
+    # kilobytes on Linux
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return list(job_records), rss
+
+
+def init_pool_worker():
+    """Initializer of pool worker processes.
+
+    Interruptions are handled by the main process, which lets the current
+    jobs finish.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    instrument_jobs()
+
+
+def worker_index(db_name, workers):
+    """Return the index of the worker a database is pinned to.
+
+    This is stable across restarts.
+
+    >>> worker_index('db', 1)
+    0
+    >>> worker_index('db', 4) == worker_index('db', 4)
+    True
+    """
+    if isinstance(db_name, unicode):
+        db_name = db_name.encode('utf-8')
+    return (zlib.crc32(db_name) & 0xffffffff) % workers
+
+
+class PinnedWorker(object):
+    """A worker process, to which some databases are pinned.
+
+    This is a pool of a single process, so that it can be recycled in a
+    controlled way: if ``max_memory`` (bytes) is not ``None``, and the
+    process exceeds it after a database processing, no more processings
+    are submitted, and the process is replaced once the pending ones are
+    finished.
+    """
+
+    def __init__(self, max_memory=None):
+        self.max_memory = max_memory
+        self.in_progress = {}  # db name -> AsyncResult
+        self.start()
+
+    def start(self):
+        self.pool = multiprocessing.Pool(1, init_pool_worker)
+        self.recycling = False
+
+    def accepts(self, db_name):
+        """True if a processing of ``db_name`` can be submitted."""
+        return not self.recycling and db_name not in self.in_progress
+
+    def submit(self, db_name):
+        self.in_progress[db_name] = self.pool.apply_async(process_database,
+                                                          (db_name, ))
+
+    def handle_result(self, db_name, stats):
+        result = self.in_progress.pop(db_name)
+        try:
+            records, rss = result.get()
+        except Exception:
+            logger.exception("Processing of database %r failed", db_name)
+            return
+        for record in records:
+            stats.add(record)
+        if self.max_memory is not None and rss > self.max_memory:
+            logger.info("Worker uses %d bytes of memory (limit %d), "
+                        "recycling it", rss, self.max_memory)
+            self.recycling = True
+
+    def collect(self, stats):
+        """Handle finished processings, and recycle if needed."""
+        for db_name, result in self.in_progress.items():
+            if result.ready():
+                self.handle_result(db_name, stats)
+        if self.recycling and not self.in_progress:
+            self.pool.close()
+            self.pool.join()
+            self.start()
+
+    def stop(self, stats):
+        """Wait for pending processings and handle their results."""
+        self.pool.close()
+        for db_name, result in self.in_progress.items():
+            logger.info("Waiting for cron jobs of database %r to complete",
+                        db_name)
+            while not result.ready():
+                result.wait(1)  # with a timeout, signals get handled
+            self.handle_result(db_name, stats)
+        self.pool.join()
+
+
+class JobStats(object):
+    """Rolling statistics about cron jobs, maintained in the main process.
+
+    For each job record (see :func:`instrument_jobs`), the statistics of
+    the latest ``window`` runs of the same job are updated. Jobs that
+    lasted longer than their interval are logged as overruns.
+    If ``path`` is not ``None``, the record and statistics are appended to
+    that file as a JSON line.
+
+    >>> stats = JobStats(window=2)
+    >>> for duration in (10, 20, 90):
+    ...     rec = stats.add(dict(database='db', job_id=1, name='Job',
+    ...                          interval=60, duration=duration,
+    ...                          outcome='success'))
+    >>> rec['overrun'], rec['runs'], rec['mean_duration']
+    (True, 3, 55.0)
+    """
+
+    def __init__(self, path=None, window=20):
+        self.path = path
+        self.window = window
+        self.durations = {}  # (database, job id) -> deque
+        self.runs = {}
+
+    def add(self, record):
+        key = record['database'], record['job_id']
+        durations = self.durations.get(key)
+        if durations is None:
+            durations = self.durations[key] = deque(maxlen=self.window)
+        durations.append(record['duration'])
+        self.runs[key] = self.runs.get(key, 0) + 1
+
+        record = dict(record,
+                      runs=self.runs[key],
+                      mean_duration=float(sum(durations)) / len(durations),
+                      max_duration=max(durations),
+                      overrun=bool(record['interval']) and (
+                          record['duration'] > record['interval']))
+        if record['overrun']:
+            logger.warn("Job %r (id=%d) of database %r lasted %d seconds, "
+                        "more than its interval (%d seconds)",
+                        record['name'], record['job_id'], record['database'],
+                        record['duration'], record['interval'])
+        if record['outcome'] != 'success':
+            logger.warn("Job %r (id=%d) of database %r failed",
+                        record['name'], record['job_id'], record['database'])
+
+        if self.path is not None:
+            with open(self.path, 'a') as stats_file:
+                stats_file.write(json.dumps(record, sort_keys=True) + '\n')
+        return record
+
+
+def stop(sig, frame):
+    """Signal handler: stop gracefully, or immediately if called twice."""
+    global stopping
+    if stopping:
+        logger.warn("Forced shutdown")
+        os._exit(1)
+    logger.info("Waiting for current jobs to complete. "
+                "Send the signal again to force shutdown.")
+    stopping = True
+
+
+def main(conf):
+    """Start the cron worker.
+
+    :param conf: path to the Odoo configuration file (managed by the recipe)
+
+    The remaining command-line arguments are passed to Odoo configuration
+    parsing.
+    """
+    parser = ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter,
+                            description="Process Odoo cron jobs. Other "
+                            "arguments are interpreted as Odoo options.")
+    parser.add_argument('-j', '--jobs', type=int, default=2,
+                        help="Number of worker processes. Each database is "
+                        "processed by one of them, always the same.")
+    parser.add_argument('--poll-interval', type=float, default=60,
+                        help="Seconds between two checks for pending jobs "
+                        "in a database")
+    parser.add_argument('--discovery-interval', type=float, default=600,
+                        help="Seconds between two discoveries of databases "
+                        "(if none are specified with -d)")
+    parser.add_argument('--max-memory', type=int, default=0,
+                        help="Resident memory, in megabytes, beyond which "
+                        "a worker process is replaced (0 means never)")
+    parser.add_argument('--stats-file',
+                        help="File to append a JSON line to, for each job "
+                        "run, with its duration and outcome, and rolling "
+                        "statistics of the latest runs of the same job")
+    arguments, odoo_args = parser.parse_known_args()
+
+    os.environ['TZ'] = 'UTC'
+    import openerp
+    from .databases import list_databases
+    config = openerp.tools.config
+    config.parse_config(['-c', conf] + odoo_args)
+    openerp.netsvc.init_logger()
+    openerp.multi_process = True  # enable multi-process signaling
+    openerp.modules.module.initialize_sys_path()
+
+    if config['db_name']:
+        fixed_db_names = config['db_name'].split(',')
+        logger.info("Monitoring databases %s", ', '.join(fixed_db_names))
+    else:
+        fixed_db_names = None
+        logger.info("Monitored databases are auto-discovered every "
+                    "%d seconds", arguments.discovery_interval)
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    workers = [PinnedWorker(max_memory=arguments.max_memory * 2 ** 20 or
+                            None)
+               for i in range(max(arguments.jobs, 1))]
+
+    stats = JobStats(path=arguments.stats_file)
+    db_names = fixed_db_names
+    discovered_at = None
+    next_polls = {}  # db name -> time of next poll
+    while not stopping:
+        now = time.time()
+        if fixed_db_names is None and (
+                discovered_at is None or
+                now - discovered_at >= arguments.discovery_interval):
+            db_names = list_databases()
+            discovered_at = now
+            logger.debug("Discovered databases: %s", ', '.join(db_names))
+            for db_name in set(next_polls).difference(db_names):
+                del next_polls[db_name]
+
+        for worker in workers:
+            worker.collect(stats)
+        for db_name in db_names:
+            worker = workers[worker_index(db_name, len(workers))]
+            if (not worker.accepts(db_name) or
+                    next_polls.get(db_name, 0) > now):
+                continue
+            worker.submit(db_name)
+            next_polls[db_name] = now + arguments.poll_interval
+        time.sleep(1)
+
+    for worker in workers:
+        worker.stop(stats)
+    logger.info("Cron worker stopped")
+    sys.exit(0)
@@ -0,0 +1,119 @@
+"""Discovery of the Odoo databases hosted by the PostgreSQL cluster.
+
+Used by the scripts that can work on several databases at once, such as
+the upgrade script (see :mod:`.upgrade`), and also provides the few
+database management operations they need.
+Odoo configuration is expected to have been parsed before hand.
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def list_databases(odoo_only=True):
+    """List the databases of the cluster Odoo is configured to connect to.
+
+    All database names are fetched with a single query. Templates, databases
+    that don't accept connections and the ``postgres`` database are excluded.
+
+    :param odoo_only: if ``True``, only initialized Odoo databases are
+                      listed (those having the ``ir_module_module`` table).
+    :returns: sorted list of database names
+    """
+    import openerp
+    cnx = openerp.sql_db.db_connect('postgres')
+    cr = cnx.cursor()
+    try:
+        cr.execute("SELECT datname FROM pg_database "
+                   "WHERE datallowconn AND NOT datistemplate "
+                   "AND datname != 'postgres' ORDER BY datname")
+        db_names = [row[0] for row in cr.fetchall()]
+    finally:
+        cr.close()
+        # avoid leaving connections behind, e.g., before a fork
+        openerp.sql_db.close_db('postgres')
+
+    if odoo_only:
+        db_names = [db_name for db_name in db_names
+                    if is_odoo_database(db_name)]
+    return db_names
+
+
+def is_odoo_database(db_name):
+    """True if the given database has been initialized by Odoo.
+
+    Databases that can't be connected to are not considered to be Odoo's.
+    """
+    import psycopg2
+    import openerp
+    try:
+        cr = openerp.sql_db.db_connect(db_name).cursor()
+    except psycopg2.Error:
+        logger.debug("Could not connect to database %r, ignoring it", db_name)
+        return False
+    try:
+        return openerp.modules.db.is_initialized(cr)
+    finally:
+        cr.close()
+        openerp.sql_db.close_db(db_name)
+
+
+def database_exists(db_name):
+    """True if a database of that name exists in the cluster."""
+    import openerp
+    cr = openerp.sql_db.db_connect('postgres').cursor()
+    try:
+        cr.execute("SELECT 1 FROM pg_database WHERE datname=%s", (db_name, ))
+        return bool(cr.fetchall())
+    finally:
+        cr.close()
+        openerp.sql_db.close_db('postgres')
+
+
+def create_empty_database(db_name):
+    """Create an empty database, that Odoo will initialize when opening it.
+
+    Opening a database that does not exist fails, whereas the
+    initialization of empty ones is automatic.
+    """
+    import openerp
+    logger.info("Creating empty database %r", db_name)
+    openerp.service.db._create_empty_database(db_name)
+
+
+def clone_database(template, db_name):
+    """Create ``db_name`` with ``template`` as PostgreSQL template.
+
+    This is a file-level copy, much faster than any initialization. The
+    filestore is copied as well. Connections to ``template`` are closed
+    beforehand, as PostgreSQL requires.
+    """
+    import openerp
+    logger.info("Creating database %r from template %r", db_name, template)
+    openerp.service.db.exp_duplicate_database(template, db_name)
+
+
+def drop_database(db_name):
+    """Drop a database, together with its filestore."""
+    import openerp
+    logger.info("Dropping database %r", db_name)
+    openerp.sql_db.close_db(db_name)
+    openerp.service.db.exp_drop(db_name)
+
+
+def read_parameters(db_name, keys):
+    """Read some ``ir.config_parameter`` values with a single query.
+
+    This doesn't need the registry to be loaded.
+
+    :returns: ``dict`` key -> value, for the keys that are set.
+    """
+    import openerp
+    cr = openerp.sql_db.db_connect(db_name).cursor()
+    try:
+        cr.execute("SELECT key, value FROM ir_config_parameter "
+                   "WHERE key IN %s", (tuple(keys), ))
+        return dict(cr.fetchall())
+    finally:
+        cr.close()
+        openerp.sql_db.close_db(db_name)
@@ -0,0 +1,241 @@
+"""Helpers for the Gunicorn configuration file generated by the recipe.
+
+The configuration file (``etc/gunicorn_<part_name>.conf.py``) is executed
+by Gunicorn itself, at startup time, and the hooks it defines call the
+functions of this module.
+
+Odoo is not imported at module level. :mod:`psutil` is a requirement of
+the recipe whenever Gunicorn is used.
+"""
+import os
+import re
+import json
+import time
+import bisect
+import socket
+import logging
+import multiprocessing
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKER_MEMORY = 512 * 1024 * 1024
+"""Estimated memory footprint of a worker, in bytes, for automatic sizing.
+"""
+
+
+def process_rss(pid=None):
+    """Return the resident memory of a process (default: current one)."""
+    import psutil
+    process = psutil.Process(os.getpid() if pid is None else pid)
+    # the method has been renamed in psutil 2.0
+    memory_info = getattr(process, 'memory_info', None)
+    if memory_info is None:
+        memory_info = process.get_memory_info
+    return memory_info().rss
+
+
+def available_memory():
+    """Return the memory available for new processes, in bytes."""
+    import psutil
+    vmem = psutil.virtual_memory()
+    # 'available' appeared in psutil 0.6
+    return getattr(vmem, 'available', vmem.free)
+
+
+def auto_workers(worker_memory=DEFAULT_WORKER_MEMORY, cpu_count=None,
+                 memory=None):
+    """Compute a number of workers suitable for the current host.
+
+    This is the usual ``2 * CPUs + 1``, bounded by the number of workers
+    that fit in the available memory.
+
+    :param worker_memory: expected memory footprint of a worker, in bytes
+    :param cpu_count: number of CPUs (default: read from the system)
+    :param memory: available memory in bytes (default: read from the
+                   system)
+
+    >>> auto_workers(cpu_count=4, memory=10 * 2 ** 30)
+    9
+    >>> auto_workers(worker_memory=2 ** 30, cpu_count=4, memory=3 * 2 ** 30)
+    3
+    >>> auto_workers(cpu_count=4, memory=0)
+    1
+    """
+    if cpu_count is None:
+        cpu_count = multiprocessing.cpu_count()
+    if memory is None:
+        memory = available_memory()
+    return max(min(2 * cpu_count + 1, memory // worker_memory), 1)
+
+
+def recycle_if_memory_exceeded(worker, limit):
+    """Ask a worker to stop if its resident memory exceeds ``limit``.
+
+    Meant to be called from the ``post_request`` hook: the worker stops
+    gracefully after the current request, and Gunicorn replaces it.
+    """
+    rss = process_rss()
+    if rss > limit:
+        worker.log.info("Worker %d uses %d bytes of memory (limit %d), "
+                        "recycling it", worker.pid, rss, limit)
+        worker.alive = False
+
+
+def set_memory_hard_limit(limit):
+    """Set a hard limit on the address space of the current process.
+
+    Meant to be called from the ``post_fork`` hook: in a worker reaching
+    the limit, memory allocations fail with :class:`MemoryError`, instead
+    of the whole host running out of memory.
+    """
+    import resource
+    soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+"""Upper bounds of the request durations histogram buckets, in seconds."""
+
+OTHER_PATHS = '<other>'
+"""Key of the statistics of requests whose path isn't tracked by itself.
+"""
+
+
+def sql_count():
+    """Return the number of SQL queries performed by this process so far.
+
+    This relies on the global counter that Odoo maintains in
+    :mod:`openerp.sql_db` (updated as cursors get closed).
+    """
+    import openerp
+    return getattr(openerp.sql_db, 'sql_counter', 0)
+
+
+class RequestStats(object):
+    """Measure requests from Gunicorn ``pre_request`` and ``post_request``.
+
+    For each request, the duration, number of SQL queries and variation
+    of the worker resident memory are measured. Requests taking more than
+    ``slow_threshold`` seconds are logged.
+
+    Statistics are aggregated by request path (which, for JSON-RPC calls
+    of the web client, ends with the model and method names), and flushed
+    every ``interval`` seconds to ``target``, which is either the path of a
+    file, to which JSON lines are appended, or the address of a statsd
+    compatible server, in the ``udp://HOST:PORT`` form.
+
+    Some paths have many values (``/web/image/<id>`` for instance): at
+    most ``max_paths`` of them are tracked between two flushes, requests to
+    further paths are aggregated under :data:`OTHER_PATHS`.
+    """
+
+    def __init__(self, slow_threshold=None, target=None, interval=60,
+                 prefix='odoo', max_paths=100):
+        self.slow_threshold = slow_threshold
+        self.target = target
+        self.interval = interval
+        self.prefix = prefix
+        self.max_paths = max_paths
+        self.current = None
+        self.reset()
+
+    def reset(self):
+        self.stats = {}
+        self.last_flush = time.time()
+
+    def start(self, req):
+        self.current = (time.time(), sql_count(), process_rss())
+
+    def end(self, worker, req):
+        if self.current is None:
+            return
+        start, start_sql, start_rss = self.current
+        self.current = None
+        duration = time.time() - start
+        queries = sql_count() - start_sql
+        rss_delta = process_rss() - start_rss
+        if self.slow_threshold is not None and duration > self.slow_threshold:
+            worker.log.warning("Slow request: %s %s took %.3f seconds, "
+                               "%d SQL queries, memory delta %d bytes",
+                               req.method, req.path, duration, queries,
+                               rss_delta)
+        if self.target is None:
+            return
+
+        path = req.path
+        if path not in self.stats and len(self.stats) >= self.max_paths:
+            path = OTHER_PATHS
+        stats = self.stats.get(path)
+        if stats is None:
+            stats = self.stats[path] = dict(
+                count=0, time=0, time_max=0, sql=0, rss_delta=0,
+                buckets=[0] * (len(LATENCY_BUCKETS) + 1))
+        stats['count'] += 1
+        stats['time'] += duration
+        stats['time_max'] = max(stats['time_max'], duration)
+        stats['sql'] += queries
+        stats['rss_delta'] += rss_delta
+        stats['buckets'][bisect.bisect_left(LATENCY_BUCKETS, duration)] += 1
+
+        if time.time() - self.last_flush >= self.interval:
+            self.flush(worker)
+
+    def flush(self, worker):
+        """Write the aggregated statistics to the target, then reset them."""
+        if self.target is None or not self.stats:
+            return
+        try:
+            if self.target.startswith('udp://'):
+                self.send_statsd()
+            else:
+                self.write_file()
+        except (IOError, socket.error), exc:
+            worker.log.warning("Could not flush request statistics to %s: "
+                               "%s", self.target, exc)
+        self.reset()
+
+    def write_file(self):
+        with open(self.target, 'a') as stats_file:
+            stats_file.write(json.dumps(dict(
+                pid=os.getpid(),
+                start=self.last_flush,
+                end=time.time(),
+                buckets=LATENCY_BUCKETS,
+                requests=self.stats)) + '\n')
+
+    def statsd_lines(self):
+        """Format the statistics for statsd.
+
+        >>> stats = RequestStats(target='udp://localhost:8125')
+        >>> stats.stats = {'/web/dataset/call_kw/res.partner/read': dict(
+        ...     count=2, time=0.3, time_max=0.2, sql=10, rss_delta=0)}
+        >>> for line in stats.statsd_lines():
+        ...     print(line)
+        odoo.web_dataset_call_kw_res_partner_read.count:2|c
+        odoo.web_dataset_call_kw_res_partner_read.time_mean:150|ms
+        odoo.web_dataset_call_kw_res_partner_read.time_max:200|g
+        odoo.web_dataset_call_kw_res_partner_read.sql_mean:5|g
+        """
+        lines = []
+        for path, stats in sorted(self.stats.items()):
+            key = '%s.%s' % (self.prefix,
+                             re.sub(r'\W+', '_', path).strip('_') or 'root')
+            count = stats['count']
+            lines.extend((
+                '%s.count:%d|c' % (key, count),
+                '%s.time_mean:%d|ms' % (key, 1000 * stats['time'] / count),
+                '%s.time_max:%d|g' % (key, 1000 * stats['time_max']),
+                '%s.sql_mean:%d|g' % (key, stats['sql'] / count),
+            ))
+        return lines
+
+    def send_statsd(self):
+        host, port = self.target[len('udp://'):].rsplit(':', 1)
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            lines = self.statsd_lines()
+            # keeping datagrams small enough to avoid fragmentation
+            for i in range(0, len(lines), 10):
+                sock.sendto('\n'.join(lines[i:i + 10]), (host, int(port)))
+        finally:
+            sock.close()
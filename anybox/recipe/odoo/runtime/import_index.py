@@ -0,0 +1,147 @@
+"""Precomputed index of the top-level modules available to the scripts.
+
+The ``sys.path`` of generated scripts has one entry per egg, and Python
+looks for each top-level import in all of them, in turn. The recipe scans
+these entries once at buildout time, stores where each top-level module or
+package lies, and scripts install a :data:`sys.meta_path` finder that goes
+straight to the right entry.
+
+As for ``sys.path``, if a name appears in several entries, the first
+occurrence wins. Names that aren't in the index, or can't be found any more
+where the index says, are left to the standard import machinery, as are
+submodules, which are looked up in the ``__path__`` of their package only.
+
+This module does not import Odoo and can be used from the recipe itself.
+"""
+import os
+import re
+import imp
+import sys
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+IDENTIFIER_RE = re.compile(r'^[A-Za-z_]\w*$')
+
+
+def module_suffixes():
+    """Return the suffixes of importable files, longest first.
+
+    This way, ``foomodule.so`` is seen as module ``foo``, as
+    :func:`imp.find_module` would.
+    """
+    return sorted((suffix for suffix, _, _ in imp.get_suffixes()),
+                  key=len, reverse=True)
+
+
+def is_package_dir(path):
+    """True if the given directory is a Python package."""
+    return any(os.path.isfile(os.path.join(path, '__init__' + suffix))
+               for suffix in ('.py', '.pyc', '.pyo'))
+
+
+def scan_path(path):
+    """List top-level modules and packages found in ``path``.
+
+    Zipped eggs are left to :mod:`zipimport`, and builtin modules, that
+    come before ``sys.path`` in imports resolution, are ignored.
+
+    :returns: a ``dict`` module name -> ``sys.path`` entry
+    """
+    suffixes = module_suffixes()
+    modules = {}
+    for location in path:
+        if not os.path.isdir(location):
+            continue
+        for entry in os.listdir(location):
+            entry_path = os.path.join(location, entry)
+            name = None
+            if os.path.isdir(entry_path):
+                if is_package_dir(entry_path):
+                    name = entry
+            else:
+                for suffix in suffixes:
+                    if entry.endswith(suffix):
+                        name = entry[:-len(suffix)]
+                        break
+            if (name is None or name in modules or
+                    name in sys.builtin_module_names or
+                    not IDENTIFIER_RE.match(name)):
+                continue
+            modules[name] = location
+    return modules
+
+
+def write_index(index_path, path):
+    """Scan ``path`` and write the resulting index to ``index_path``.
+
+    :returns: the ``dict`` of found modules (see :func:`scan_path`)
+    """
+    path = list(path)
+    modules = scan_path(path)
+    with open(index_path, 'w') as index_file:
+        json.dump(dict(path=path, modules=modules),
+                  index_file, indent=2, sort_keys=True)
+    return modules
+
+
+class IndexLoader(object):
+    """Load a module from the result of :func:`imp.find_module`."""
+
+    def __init__(self, found):
+        self.found = found
+
+    def load_module(self, fullname):
+        if fullname in sys.modules:
+            return sys.modules[fullname]
+        module_file, pathname, description = self.found
+        try:
+            return imp.load_module(fullname, module_file, pathname,
+                                   description)
+        finally:
+            if module_file is not None:
+                module_file.close()
+
+
+class IndexFinder(object):
+    """A :data:`sys.meta_path` finder for indexed top-level modules.
+
+    :param modules: ``dict`` module name -> ``sys.path`` entry
+    """
+
+    def __init__(self, modules):
+        self.modules = modules
+
+    def find_module(self, fullname, path=None):
+        if path is not None:
+            return None
+        location = self.modules.get(fullname)
+        if location is None:
+            return None
+        try:
+            found = imp.find_module(fullname, [location])
+        except ImportError:
+            logger.debug("Module %r not found in %r any more",
+                         fullname, location)
+            return None
+        return IndexLoader(found)
+
+
+def install(index_path):
+    """Read the index at ``index_path`` and install its finder.
+
+    :returns: the :class:`IndexFinder` instance, or ``None`` if the index
+              does not exist or can't be read, in which case imports
+              just work as usual.
+    """
+    try:
+        with open(index_path) as index_file:
+            modules = json.load(index_file)['modules']
+    except (IOError, ValueError, KeyError):
+        logger.warn("Imports index %r missing or unreadable", index_path)
+        return None
+    finder = IndexFinder(dict((str(name), str(location))
+                              for name, location in modules.items()))
+    sys.meta_path.append(finder)
+    return finder
@@ -0,0 +1,166 @@
+"""Precomputed index of the Odoo modules available in the addons paths.
+
+Odoo finds out the available modules by listing every addons directory and
+checking for manifest files. The recipe performs the same scan once at
+buildout time and stores the result, so that startup scripts can use it
+instead (see the ``--install-all`` option of the main startup script).
+
+It also provides some helpers about module dependencies and source
+fingerprints, that are used by :class:`.session.Session`.
+
+This module does not import Odoo and can be used from the recipe itself.
+"""
+import os
+import json
+import hashlib
+import logging
+
+from ..utils import is_object_file
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAMES = ('__openerp__.py', '__terp__.py')
+
+
+def module_manifest(path):
+    """Return the path of the manifest file of the module at ``path``.
+
+    :returns: ``None`` if ``path`` is not an Odoo module.
+    """
+    for manifest in MANIFEST_NAMES:
+        manifest_path = os.path.join(path, manifest)
+        if os.path.isfile(manifest_path):
+            return manifest_path
+
+
+def is_module_dir(path):
+    """True if the given directory is an Odoo module."""
+    return module_manifest(path) is not None
+
+
+def scan_modules(addons_paths):
+    """List modules found in ``addons_paths``.
+
+    As in Odoo, if a module name appears in several paths, the first
+    occurrence wins.
+
+    :returns: a ``dict`` module name -> addons path
+    """
+    modules = {}
+    for addons_path in addons_paths:
+        if not os.path.isdir(addons_path):
+            continue
+        for name in os.listdir(addons_path):
+            if name in modules:
+                continue
+            if is_module_dir(os.path.join(addons_path, name)):
+                modules[name] = addons_path
+    return modules
+
+
+def path_mtimes(paths):
+    """Return the modification times of ``paths`` as a ``dict``.
+
+    Non existing paths are mapped to ``None``.
+    """
+    mtimes = {}
+    for path in paths:
+        try:
+            mtimes[path] = os.stat(path).st_mtime
+        except OSError:
+            mtimes[path] = None
+    return mtimes
+
+
+def write_index(index_path, addons_paths):
+    """Scan ``addons_paths`` and write the resulting index to ``index_path``.
+
+    :returns: the ``dict`` of found modules (see :func:`scan_modules`)
+    """
+    addons_paths = list(addons_paths)
+    modules = scan_modules(addons_paths)
+    manifests = [module_manifest(os.path.join(addons_path, name))
+                 for name, addons_path in modules.items()]
+    with open(index_path, 'w') as index_file:
+        json.dump(dict(addons_paths=addons_paths,
+                       mtimes=path_mtimes(addons_paths),
+                       manifests=path_mtimes(manifests),
+                       modules=modules),
+                  index_file, indent=2, sort_keys=True)
+    return modules
+
+
+def read_index(index_path, check_fresh=True):
+    """Read the list of module names from the index at ``index_path``.
+
+    :param check_fresh: if ``True``, the index is considered stale if one of
+                        the indexed addons directories, or the manifest
+                        file of one of the indexed modules, has been
+                        modified since the index creation.
+    :returns: sorted list of module names, or ``None`` if the index
+              does not exist, can't be read or is stale.
+    """
+    try:
+        with open(index_path) as index_file:
+            index = json.load(index_file)
+    except (IOError, ValueError):
+        logger.warn("Modules index %r missing or unreadable", index_path)
+        return None
+
+    # indexes written by previous versions have no manifests
+    if check_fresh and (
+            path_mtimes(index['addons_paths']) != index['mtimes'] or
+            path_mtimes(index.get('manifests', ())) != index.get('manifests')):
+        logger.info("Modules index %r is stale", index_path)
+        return None
+
+    return sorted(index['modules'])
+
+
+def dependency_closure(modules, depends):
+    """Return ``modules`` and all their direct or indirect dependencies.
+
+    :param modules: iterable of module names
+    :param depends: a callable returning the names of direct dependencies
+                    of the module whose name it is passed (``None`` is
+                    accepted for no dependencies).
+    :returns: a list of module names in which dependencies come
+              before the modules depending on them. Cycles are tolerated,
+              in which case the ordering can't be fully respected.
+    """
+    ordered = []
+    seen = set()
+
+    def visit(module):
+        if module in seen:
+            return
+        seen.add(module)
+        for dep in depends(module) or ():
+            visit(dep)
+        ordered.append(module)
+
+    for module in modules:
+        visit(module)
+    return ordered
+
+
+def module_fingerprint(module_path):
+    """Compute a fingerprint of the source files of a module.
+
+    This is a hash of the relative paths and contents of all files in
+    ``module_path``, python object files excepted.
+
+    :returns: hexadecimal digest
+    """
+    digest = hashlib.sha1()
+    for dirpath, dirnames, filenames in os.walk(module_path):
+        dirnames.sort()
+        for fname in sorted(filenames):
+            if is_object_file(fname):
+                continue
+            path = os.path.join(dirpath, fname)
+            digest.update(os.path.relpath(path, module_path) + '\0')
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+            digest.update('\0')
+    return digest.hexdigest()
@@ -1,8 +1,6 @@
 """Necessary monkey patches to make Odoo work in the buildout context.
 """
 
-import subprocess
-
 
 def do_patch(gevent_script_path):
     """
@@ -15,6 +13,7 @@ def do_patch(gevent_script_path):
     from openerp.service.server import PreforkServer, stripped_sys_argv
 
     def long_polling_spawn(server):
+        import subprocess
         nargs = stripped_sys_argv()
         nargs[0] = gevent_script_path
         popen = subprocess.Popen(nargs)
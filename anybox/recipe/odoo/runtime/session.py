@@ -2,7 +2,12 @@
 import warnings
 import sys
 import os
+import re
+import json
+import time
 import logging
+from contextlib import contextmanager
+from datetime import datetime
 from distutils.version import Version
 
 
@@ -21,11 +26,17 @@ else:
     from openerp.tools.parse_version import parse_version
 
 from optparse import OptionParser  # we support python >= 2.6
+from .modules_index import dependency_closure
+from .modules_index import module_fingerprint
 
 logger = logging.getLogger(__name__)
 
 DEFAULT_VERSION_PARAMETER = 'buildout.db_version'
 
+DEFAULT_FINGERPRINTS_PARAMETER = 'buildout.modules_fingerprints'
+
+DEFAULT_CHECKPOINTS_PARAMETER = 'buildout.upgrade_checkpoints'
+
 DEFAULT_VERSION_FILE = 'VERSION.txt'
 
 
@@ -78,6 +89,8 @@ class Session(object):
     * :attr:`registry`: access to model objects
     * :attr:`is_initialization`: True if and only if the database was not
       initialized before the call to :meth:`open`
+    * :attr:`steps`: timings of the steps performed so far (see
+      :meth:`step`)
 
     Example application code::
 
@@ -120,6 +133,10 @@ class Session(object):
         self.openerp_config_file = conffile
 
         self._registry = self.cr = None
+        self.steps = []
+        self.profile_dir = None
+        self._profiling = False
+        self._step_depth = 0
         if parse_config:
             config.parse_config(['-c', conffile])
 
@@ -363,6 +380,11 @@ class Session(object):
         return any(self.cr.__dict__.get(c)
                    for c in ('_Cursor__closed', '_closed'))
 
+    def is_open_on(self, db):
+        """True if the session has a usable cursor on database ``db``."""
+        return (self.cr is not None and not self.is_cursor_closed() and
+                self.cr.dbname == db)
+
     def close(self):
         """Close the cursor and forget about the current database.
 
@@ -399,15 +421,172 @@ class Session(object):
                                  "be opened or an explicit database name")
             db = self.cr.dbname
 
-        if self.cr is not None:
-            self.close()
+        modules = list(modules)
+        with self.step('update_modules(%s)' % ', '.join(modules)):
+            if self.cr is not None:
+                self.close()
+            for module in modules:
+                config['update'][module] = 1
+            self._registry = openerp.modules.registry.RegistryManager.get(
+                db, update_module=True)
+            config['update'].clear()
+            self.init_cursor()
+            self.clean_environments()
+
+    _fingerprints_parameter_name = DEFAULT_FINGERPRINTS_PARAMETER
+
+    def installed_modules(self):
+        """Return the names of installed modules, with a single query."""
+        self.cr.execute("SELECT name FROM ir_module_module "
+                        "WHERE state='installed'")
+        return [row[0] for row in self.cr.fetchall()]
+
+    def modules_fingerprints(self, modules):
+        """Compute current source fingerprints of the given modules.
+
+        :returns: ``dict`` module name -> fingerprint (see
+                  :func:`.modules_index.module_fingerprint`). Modules that
+                  can't be found in the addons path are omitted.
+        """
+        fingerprints = {}
         for module in modules:
-            config['update'][module] = 1
-        self._registry = openerp.modules.registry.RegistryManager.get(
-            db, update_module=True)
-        config['update'].clear()
-        self.init_cursor()
-        self.clean_environments()
+            path = openerp.modules.module.get_module_path(module)
+            if path:
+                fingerprints[module] = module_fingerprint(path)
+        return fingerprints
+
+    @property
+    def db_modules_fingerprints(self):
+        """Settable property for the modules fingerprints stored in DB.
+
+        These are the fingerprints of the modules sources at the time of the
+        latest call to :meth:`update_changed_modules`.
+        """
+        stored = self.registry('ir.config_parameter').get_param(
+            self.cr, self.uid, self._fingerprints_parameter_name)
+        if not stored:
+            return {}
+        return json.loads(stored)
+
+    @db_modules_fingerprints.setter
+    def db_modules_fingerprints(self, fingerprints):
+        self.registry('ir.config_parameter').set_param(
+            self.cr, self.uid, self._fingerprints_parameter_name,
+            json.dumps(fingerprints, sort_keys=True))
+
+    def reverse_dependencies(self):
+        """Return installed modules depending directly on each module.
+
+        This is read from the database, with a single query.
+
+        :returns: ``dict`` module name -> list of module names
+        """
+        self.cr.execute("SELECT d.name, m.name "
+                        "FROM ir_module_module_dependency d "
+                        "JOIN ir_module_module m ON d.module_id = m.id "
+                        "WHERE m.state = 'installed'")
+        dependents = {}
+        for dep, module in self.cr.fetchall():
+            dependents.setdefault(dep, []).append(module)
+        return dependents
+
+    def changed_modules(self, fingerprints=None):
+        """List installed modules that need an update because of source changes.
+
+        These are the installed modules whose current fingerprint differs from
+        the one stored in the database (or that have none), and all the
+        installed modules that depend on them, directly or indirectly.
+
+        :param fingerprints: current fingerprints, if already computed.
+        """
+        installed = self.installed_modules()
+        if fingerprints is None:
+            fingerprints = self.modules_fingerprints(installed)
+        stored = self.db_modules_fingerprints
+        changed = [m for m in installed
+                   if m in fingerprints and stored.get(m) != fingerprints[m]]
+        if not changed:
+            return []
+        return dependency_closure(changed, self.reverse_dependencies().get)
+
+    def update_changed_modules(self, db=None):
+        """Update only the modules whose sources changed since the last call.
+
+        This is meant as a replacement of ``update_modules(['all'])``
+        for deployments where a release typically touches a small subset of
+        all installed modules. See :meth:`changed_modules` for the selection.
+
+        On the first call for a database, all installed modules are
+        considered to have changed.
+
+        The new fingerprints are stored in the database but not committed,
+        so that they end up in the same transaction as the rest of the
+        upgrade.
+
+        :param db: see :meth:`update_modules`
+        :returns: the list of updated modules
+        """
+        if db is None:
+            if self.cr is None:
+                raise ValueError("update_changed_modules needs either the "
+                                 "session to be opened or an explicit "
+                                 "database name")
+        elif not self.is_open_on(db):
+            self.open(db=db)
+        installed = self.installed_modules()
+        fingerprints = self.modules_fingerprints(installed)
+        to_update = self.changed_modules(fingerprints=fingerprints)
+        if to_update:
+            logger.info("Updating changed modules and their dependents: %s",
+                        ', '.join(to_update))
+            self.update_modules(to_update)
+        else:
+            logger.info("No module changed, skipping update")
+        self.db_modules_fingerprints = fingerprints
+        return to_update
+
+    INSTALLED_STATES = ('installed', 'to upgrade')
+    """Module states for which no installation is needed."""
+
+    def manifest_depends(self, module):
+        """Return the direct dependencies of a module, read from its manifest.
+        """
+        info = openerp.modules.module.load_information_from_description_file(
+            module)
+        return info.get('depends', ())
+
+    def modules_states(self, modules, cr=None):
+        """Return the states of modules, as recorded in ``ir_module_module``.
+
+        This is done with a single query.
+
+        :param modules: iterable of module names
+        :param cr: cursor to use. Defaults to the current one.
+        :returns: ``dict`` module name -> state. Modules unknown to the
+                  database are not in the result.
+        """
+        modules = tuple(modules)
+        if not modules:
+            return {}
+        if cr is None:
+            cr = self.cr
+        cr.execute("SELECT name, state FROM ir_module_module "
+                   "WHERE name IN %s", (modules, ))
+        return dict(cr.fetchall())
+
+    def modules_to_install(self, modules, cr=None):
+        """Compute which modules need to be installed to provide ``modules``.
+
+        The dependency closure of ``modules`` is computed from the
+        manifests, and modules already installed are removed.
+
+        :param cr: see :meth:`modules_states`
+        :returns: list of module names, dependencies first
+        """
+        closure = dependency_closure(modules, self.manifest_depends)
+        states = self.modules_states(closure, cr=cr)
+        return [m for m in closure
+                if states.get(m) not in self.INSTALLED_STATES]
 
     def install_modules(self, modules, db=None, update_modules_list=True,
                         open_with_demo=False):
@@ -416,6 +595,13 @@ class Session(object):
         Has the side effect of closing the current cursor, committing if and
         only if the list of modules is updated.
 
+        The modules to install are computed by :meth:`modules_to_install`.
+        If there are none, the registry is not reloaded at all, making
+        repeated calls cheap (e.g., in idempotent upgrade scripts): the
+        current cursor is then kept, and the session is left open on
+        ``db``. On a database that isn't initialized yet, all ``modules``
+        are installed.
+
         Demo data loading is handled consistently with the decision taken
         by :meth:`open`.
 
@@ -445,21 +631,171 @@ class Session(object):
             self.update_modules_list()
             self.cr.commit()
 
-        if self.cr is not None:
-            self.close()
-        saved_without_demo = config['without_demo']
+        modules = list(modules)
+        if self.is_open_on(db):
+            to_install = self.modules_to_install(modules)
+        else:
+            # with update_modules_list=False, an explicitely named DB would
+            # not have gone through open() yet.
+            cr = openerp.sql_db.db_connect(db).cursor()
+            try:
+                if openerp.modules.db.is_initialized(cr):
+                    to_install = self.modules_to_install(modules, cr=cr)
+                else:
+                    # the registry initializes it, no state to read yet
+                    to_install = modules
+            finally:
+                cr.close()
+
+        if not to_install:
+            logger.info("Modules %s already installed, nothing to do",
+                        ', '.join(modules))
+            if not self.is_open_on(db):
+                self.open(db=db, with_demo=open_with_demo)
+            return
 
-        # with update_modules_list=False, an explicitely named DB would not
-        # have gone through open() yet.
-        config['without_demo'] = not getattr(self, 'with_demo', open_with_demo)
-        for module in modules:
-            config['init'][module] = 1
-        self._registry = openerp.modules.registry.RegistryManager.get(
-            db, update_module=True, force_demo=self.with_demo)
-        config['init'].clear()
-        config['without_demo'] = saved_without_demo
-        self.init_cursor()
-        self.clean_environments()
+        logger.info("Installing modules %s", ', '.join(to_install))
+        with self.step('install_modules(%s)' % ', '.join(modules)):
+            if self.cr is not None:
+                self.close()
+            saved_without_demo = config['without_demo']
+
+            config['without_demo'] = not getattr(self, 'with_demo',
+                                                 open_with_demo)
+            for module in to_install:
+                config['init'][module] = 1
+            self._registry = openerp.modules.registry.RegistryManager.get(
+                db, update_module=True, force_demo=self.with_demo)
+            config['init'].clear()
+            config['without_demo'] = saved_without_demo
+            self.init_cursor()
+            self.clean_environments()
+
+    @contextmanager
+    def step(self, name):
+        """Context manager to time a named step of a script.
+
+        Example::
+
+           with session.step('migrate invoices'):
+               (...)
+
+        The step is recorded in :attr:`steps` as a ``dict`` with the
+        ``name``, ``start`` (UTC, ISO format), ``duration`` (in seconds),
+        ``depth`` (for nested steps) and ``outcome`` (``'success'`` or
+        ``'failure'``) keys.
+        :meth:`update_modules` and :meth:`install_modules` automatically
+        record steps.
+
+        If :attr:`profile_dir` is set, the step is also profiled with
+        :mod:`cProfile`, and the resulting statistics are dumped in that
+        directory, whose path is recorded under the ``profile`` key.
+        Nested steps are profiled as part of the outermost one.
+        """
+        record = dict(name=name,
+                      start=datetime.utcnow().isoformat(),
+                      depth=self._step_depth,
+                      outcome='failure',
+                      profile=None)
+        self.steps.append(record)
+        index = len(self.steps)
+        profiler = None
+        if self.profile_dir is not None and not self._profiling:
+            import cProfile
+            profiler = cProfile.Profile()
+            self._profiling = True
+            profiler.enable()
+
+        self._step_depth = record['depth'] + 1
+        start = time.time()
+        try:
+            yield record
+            record['outcome'] = 'success'
+        finally:
+            record['duration'] = time.time() - start
+            self._step_depth = record['depth']
+            if profiler is not None:
+                profiler.disable()
+                self._profiling = False
+                record['profile'] = os.path.join(
+                    self.profile_dir, '%03d-%s.prof' % (
+                        index, re.sub(r'[^\w.-]+', '_', name)[:60]))
+                profiler.dump_stats(record['profile'])
+            logger.info("Step %r: %s in %.1f seconds",
+                        name, record['outcome'], record['duration'])
+
+    _checkpoints_parameter_name = DEFAULT_CHECKPOINTS_PARAMETER
+
+    @property
+    def done_checkpoints(self):
+        """Names of the checkpoints already passed towards the package version.
+
+        Checkpoints recorded while upgrading to another package version
+        (see :attr:`package_version`) are ignored.
+        """
+        stored = self.registry('ir.config_parameter').get_param(
+            self.cr, self.uid, self._checkpoints_parameter_name)
+        if not stored:
+            return []
+        stored = json.loads(stored)
+        if stored.get('version') != self._checkpoints_version():
+            return []
+        return stored['done']
+
+    def _checkpoints_version(self):
+        pkg_version = self.package_version
+        return None if pkg_version is None else str(pkg_version)
+
+    def _store_checkpoints(self, done):
+        self.registry('ir.config_parameter').set_param(
+            self.cr, self.uid, self._checkpoints_parameter_name,
+            json.dumps(dict(version=self._checkpoints_version(), done=done)))
+
+    def checkpoint(self, name, func, *args, **kwargs):
+        """Run a resumable step of an upgrade, unless it's already been done.
+
+        Example::
+
+           session.checkpoint('update all', session.update_modules, ['all'])
+           session.checkpoint('migrate invoices', migrate_invoices, session)
+
+        The step is run through :meth:`step`, then its completion is
+        recorded in the database and the transaction is committed. Hence,
+        if a later step fails, running the upgrade again skips to it
+        directly.
+
+        Each step must leave the database in a consistent state, since
+        it is committed independently of the rest of the upgrade.
+        The recorded checkpoints are cleared by :meth:`clear_checkpoints`,
+        which the upgrade script calls after its success.
+
+        :param name: unique name of the step within the upgrade
+        :param func: callable actually performing the step. Extra positional
+                     and keyword arguments are passed to it.
+        :returns: the return value of ``func``, or ``None`` if the step was
+                  skipped.
+        """
+        done = self.done_checkpoints
+        if name in done:
+            logger.info("Checkpoint %r already passed, skipping", name)
+            return
+        with self.step(name):
+            res = func(*args, **kwargs)
+        # func may have reloaded the registry (hence the cursor)
+        self._store_checkpoints(done + [name])
+        self.cr.commit()
+        logger.info("Checkpoint %r passed and committed", name)
+        return res
+
+    def clear_checkpoints(self):
+        """Forget about all passed checkpoints (not committed).
+
+        The parameter is removed, rather than emptied, on all Odoo versions.
+        """
+        params = self.registry('ir.config_parameter')
+        params.unlink(self.cr, self.uid, params.search(
+            self.cr, self.uid,
+            [('key', '=', self._checkpoints_parameter_name)]))
 
     def ref(self, external_id):
         """Return ir.model.data object id from its external identifier.
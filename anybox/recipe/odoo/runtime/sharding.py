@@ -0,0 +1,255 @@
+"""Run the tests of many modules in several processes and databases.
+
+This is the implementation of the ``--test-jobs`` option of the test
+script (see :func:`.start_openerp.main`): the modules to install or update
+are split in shards, and the test script itself is run for each shard,
+against a dedicated database, in parallel processes. Their outputs are
+then merged.
+
+Odoo tests the dependencies it installs along with a module. Modules that
+depend on each other are therefore kept in the same shard, so that each
+one is tested once.
+"""
+import os
+import sys
+import time
+import logging
+import subprocess
+import multiprocessing
+
+from .modules_index import dependency_closure
+
+logger = logging.getLogger(__name__)
+
+ALWAYS_INSTALLED = ('base', )
+"""Modules that every database has, and which don't tie modules together.
+"""
+
+
+def extract_option(argv, short, long_):
+    """Remove all occurrences of an option and its value from ``argv``.
+
+    :param short: short form of the option (e.g, ``-i``), or ``None``
+    :param long_: long form of the option (e.g, ``--init``)
+    :returns: the value (last occurrence wins, ``None`` if absent) and
+              the remaining arguments.
+
+    >>> extract_option(['-d', 'db', '-i', 'a,b', '--stop-after-init'],
+    ...                '-i', '--init')
+    ('a,b', ['-d', 'db', '--stop-after-init'])
+    >>> extract_option(['--init=a', '-ib', '--init', 'c'], '-i', '--init')
+    ('c', [])
+    >>> extract_option(['--test-jobs=4', '--test'], None, '--test-jobs')
+    ('4', ['--test'])
+    """
+    value = None
+    remaining = []
+    args = iter(argv)
+    for arg in args:
+        if arg == long_ or arg == short:
+            value = next(args, None)
+        elif arg.startswith(long_ + '='):
+            value = arg[len(long_) + 1:]
+        elif short is not None and arg.startswith(short):
+            value = arg[len(short):]
+        else:
+            remaining.append(arg)
+    return value, remaining
+
+
+def no_depends(module):
+    """Dependencies callable for independent modules."""
+    return ()
+
+
+def dependency_groups(modules, depends):
+    """Group ``modules`` that are tied by dependencies.
+
+    Two modules are in the same group if one of them depends, directly or
+    not, on the other one, or if they are in the same group as a third
+    one. Modules of :data:`ALWAYS_INSTALLED` don't tie others.
+
+    :param depends: see :func:`.modules_index.dependency_closure`
+    :returns: list of sorted groups, largest first
+
+    >>> deps = {'sale': ['base'], 'stock': ['base'],
+    ...         'sale_stock': ['sale', 'stock'], 'crm': ['base']}
+    >>> dependency_groups(['base', 'crm', 'sale', 'sale_stock', 'stock'],
+    ...                   deps.get)
+    [['sale', 'sale_stock', 'stock'], ['base'], ['crm']]
+    """
+    modules = set(modules)
+    group_of = dict((m, m) for m in modules)
+
+    def find(module):
+        while group_of[module] != module:
+            module = group_of[module]
+        return module
+
+    for module in sorted(modules):
+        for dep in dependency_closure([module], depends):
+            if dep in modules and dep not in ALWAYS_INSTALLED:
+                group_of[find(dep)] = find(module)
+
+    groups = {}
+    for module in modules:
+        groups.setdefault(find(module), []).append(module)
+    return sorted((sorted(group) for group in groups.values()),
+                  key=lambda group: (-len(group), group))
+
+
+def shard_modules(modules, jobs, depends=None):
+    """Split ``modules`` in at most ``jobs`` shards.
+
+    The groups of :func:`dependency_groups` are assigned, largest first,
+    to the shard with the fewest modules so far.
+
+    :param depends: see :func:`.modules_index.dependency_closure`. If
+                    ``None``, modules are considered independent.
+
+    >>> shard_modules(['a', 'b', 'c', 'd', 'e'], 2)
+    [['a', 'c', 'e'], ['b', 'd']]
+    >>> shard_modules(['a', 'b'], 3)
+    [['a'], ['b']]
+    >>> deps = {'sale_stock': ['sale', 'stock']}
+    >>> shard_modules(['crm', 'hr', 'sale', 'sale_stock', 'stock'], 2,
+    ...               deps.get)
+    [['sale', 'sale_stock', 'stock'], ['crm', 'hr']]
+    """
+    shards = [[] for i in range(jobs)]
+    for group in dependency_groups(modules, depends or no_depends):
+        min(shards, key=len).extend(group)
+    return [sorted(shard) for shard in shards if shard]
+
+
+def parse_jobs(value):
+    """Interpret the value of the ``--test-jobs`` option.
+
+    >>> parse_jobs('3')
+    3
+    >>> parse_jobs('auto') == multiprocessing.cpu_count()
+    True
+    """
+    if value == 'auto':
+        return multiprocessing.cpu_count()
+    return max(int(value), 1)
+
+
+def shard_db_name(db_name, index):
+    """Name of the database dedicated to a shard.
+
+    >>> shard_db_name('test', 2)
+    'test_shard2'
+    """
+    return '%s_shard%d' % (db_name, index)
+
+
+def run_sharded_tests(script, conf, argv, jobs, template=None,
+                      logs_dir='.'):
+    """Run the test script for shards of the modules, in parallel.
+
+    :param script: path to the test script itself
+    :param conf: path to the Odoo configuration file
+    :param argv: command-line arguments, without the ``--test-*`` options
+                 that are specific to this function. The modules to test
+                 are read from the ``-i`` (or, if absent, ``-u``) option,
+                 and the database name from ``-d``.
+    :param jobs: number of shards, hence of processes and databases
+    :param template: if not ``None``, the name of a database to create
+                     the databases of shards from (see
+                     :func:`.databases.clone_database`). Otherwise, they
+                     are created empty by Odoo, and updating modules
+                     (``-u``) is refused, as it would do nothing.
+    :param logs_dir: directory for the output of each shard
+    :returns: 0 if and only if all shards were successful
+    """
+    from openerp.tools import config
+    from openerp.modules.module import load_information_from_description_file
+    from .databases import database_exists, clone_database, drop_database
+
+    logger.setLevel(logging.INFO)
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter(
+        "%(asctime)s %(levelname)s  %(message)s"))
+    logger.addHandler(handler)
+
+    option = '-i', '--init'
+    modules, argv = extract_option(argv, *option)
+    if modules is None:
+        option = '-u', '--update'
+        modules, argv = extract_option(argv, *option)
+    if not modules:
+        logger.error("Parallel tests need modules to install or update "
+                     "(-i, -u or --install-all)")
+        return 1
+    if option[0] == '-u' and template is None:
+        logger.error("Parallel tests of updates (-u) need a database to "
+                     "update (--test-template)")
+        return 1
+    db_name, argv = extract_option(argv, '-d', '--database')
+    logfile, argv = extract_option(argv, None, '--logfile')
+    if logfile is not None:
+        logger.warn("Ignoring --logfile, the output of each shard is "
+                    "written in %s", logs_dir)
+
+    config.parse_config(['-c', conf])
+    db_name = db_name or config['db_name'] or 'test'
+
+    def depends(module):
+        return load_information_from_description_file(module).get(
+            'depends', ())
+
+    shards = shard_modules(sorted(modules.split(',')), jobs, depends)
+    if not os.path.isdir(logs_dir):
+        os.makedirs(logs_dir)
+
+    processes = []
+    for index, shard in enumerate(shards):
+        shard_db = shard_db_name(db_name, index)
+        if database_exists(shard_db):
+            drop_database(shard_db)
+        if template is not None:
+            clone_database(template, shard_db)
+        log_path = os.path.join(logs_dir, shard_db + '.log')
+        log_file = open(log_path, 'w')
+        logger.info("Shard %d: testing %s in database %r, output in %s",
+                    index, ', '.join(shard), shard_db, log_path)
+        process = subprocess.Popen(
+            [sys.executable, script, '-d', shard_db,
+             option[1] + '=' + ','.join(shard)] + argv,
+            stdout=log_file, stderr=subprocess.STDOUT)
+        processes.append((process, log_file, log_path, time.time()))
+
+    failed = []
+    running = set(range(len(processes)))
+    while running:
+        time.sleep(0.1)
+        for index in sorted(running):
+            process, log_file, log_path, start = processes[index]
+            status = process.poll()
+            if status is None:
+                continue
+            running.remove(index)
+            log_file.close()
+            if status:
+                failed.append(index)
+            logger.info("Shard %d %s after %d seconds (status %r)", index,
+                        'failed' if status else 'succeeded',
+                        time.time() - start, status)
+
+    merge_logs([p[2] for p in processes], sys.stdout)
+    logger.info("Tested %d modules in %d shards, %d failed%s",
+                len(modules.split(',')), len(shards), len(failed),
+                ': ' + ', '.join(str(i) for i in sorted(failed))
+                if failed else '')
+    return 1 if failed else 0
+
+
+def merge_logs(log_paths, output):
+    """Write the contents of all ``log_paths`` to ``output``, in order."""
+    for log_path in log_paths:
+        output.write("===== %s =====%s" % (log_path, os.linesep))
+        with open(log_path) as log_file:
+            for line in log_file:
+                output.write(line)
+    output.flush()
@@ -10,7 +10,11 @@ from here.
 
 import sys
 import os
+import logging
 from . import patch_odoo
+from . import modules_index as modules_index_mod
+
+logger = logging.getLogger(__name__)
 
 
 def insert_args(arguments):
@@ -22,7 +26,8 @@ def insert_args(arguments):
 
 def main(starter, conf, version=None, just_test=False,
          server_wide_modules=None,
-         gevent_script_path=None):
+         gevent_script_path=None,
+         modules_index=None):
     """Call the `starter` script, dispatching configuration.
 
     All arguments are set in the standalone script produced by buildout through
@@ -36,11 +41,27 @@ def main(starter, conf, version=None, just_test=False,
        the ``--load`` command-line option (ignored if the option is actually
        there on the command line)
     :type version: tuple of integers
-    :param just_test: if True, only run unit tests
+    :param just_test: if True, only run unit tests. The ``--test-jobs``
+       command-line option then allows to run them in parallel, see
+       :mod:`.sharding`.
+    :param modules_index: path to the index of available modules written
+       by the recipe (see :mod:`.modules_index`). Used to expand the
+       ``--install-all`` and ``--install-from-index`` command-line options.
     """
     arguments = ['-c', conf]
 
+    test_jobs = None
     if just_test:
+        from . import sharding
+        script = os.path.abspath(sys.argv[0])
+        argv = sys.argv[1:]
+        test_jobs, argv = sharding.extract_option(argv, None, '--test-jobs')
+        test_template, argv = sharding.extract_option(argv, None,
+                                                      '--test-template')
+        test_logs_dir, argv = sharding.extract_option(argv, None,
+                                                      '--test-logs-dir')
+        sys.argv[1:] = argv
+
         arguments.extend(('--log-level',
                           'test' if version >= (6, 0) else 'info',
                           '--stop-after-init'))
@@ -55,15 +76,37 @@ def main(starter, conf, version=None, just_test=False,
         else:
             arguments.append('--load=' + ','.join(server_wide_modules))
 
-    if '--install-all' in sys.argv:
-        sys.argv.remove('--install-all')
-        from openerp.tools import config
-        # Maybe we should preparse config in all cases and therefore avoid
-        # adding the '-c' on the fly ?
-        # Still, cautious about pre-6.1 versions
-        config.parse_config(['-c', conf])
-        from openerp.modules import get_modules
-        arguments.extend(('-i', ','.join(get_modules())))
+    install_all = '--install-all' in sys.argv
+    from_index = '--install-from-index' in sys.argv
+    if install_all or from_index:
+        for opt in ('--install-all', '--install-from-index'):
+            if opt in sys.argv:
+                sys.argv.remove(opt)
+        modules = None
+        if modules_index is not None:
+            # with --install-from-index, the index is trusted as is
+            modules = modules_index_mod.read_index(
+                modules_index, check_fresh=not from_index)
+        if modules is None:
+            logger.info("Listing available modules from addons paths")
+            from openerp.tools import config
+            # Maybe we should preparse config in all cases and therefore
+            # avoid adding the '-c' on the fly ?
+            # Still, cautious about pre-6.1 versions
+            config.parse_config(['-c', conf])
+            from openerp.modules import get_modules
+            modules = get_modules()
+        install_arguments = ['-i', ','.join(modules)]
+        arguments.extend(install_arguments)
+    else:
+        install_arguments = []
+
+    if test_jobs is not None:
+        return sharding.run_sharded_tests(
+            script, conf, sys.argv[1:] + install_arguments,
+            sharding.parse_jobs(test_jobs),
+            template=test_template,
+            logs_dir=test_logs_dir or '.')
 
     insert_args(arguments)
 
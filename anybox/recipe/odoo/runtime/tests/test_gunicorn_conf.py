@@ -0,0 +1,77 @@
+import os
+import json
+import shutil
+import logging
+from tempfile import mkdtemp
+from unittest import TestCase
+
+from .. import gunicorn_conf
+
+
+class FakeRequest(object):
+
+    method = 'POST'
+
+    def __init__(self, path):
+        self.path = path
+
+
+class FakeWorker(object):
+
+    log = logging.getLogger(__name__)
+
+
+class TestRequestStats(TestCase):
+
+    def setUp(self):
+        self.tmpdir = mkdtemp('test_gunicorn_conf')
+        self.sql_count = gunicorn_conf.sql_count
+        self.process_rss = gunicorn_conf.process_rss
+        # no Odoo nor psutil needed
+        gunicorn_conf.sql_count = lambda: 0
+        gunicorn_conf.process_rss = lambda: 1024
+
+    def tearDown(self):
+        gunicorn_conf.sql_count = self.sql_count
+        gunicorn_conf.process_rss = self.process_rss
+        shutil.rmtree(self.tmpdir)
+
+    def request(self, stats, path):
+        req = FakeRequest(path)
+        stats.start(req)
+        stats.end(FakeWorker(), req)
+
+    def test_file_flush(self):
+        target = os.path.join(self.tmpdir, 'stats.json')
+        stats = gunicorn_conf.RequestStats(target=target, interval=3600)
+        self.request(stats, '/web/dataset/call_kw')
+        self.request(stats, '/web/dataset/call_kw')
+        self.request(stats, '/xmlrpc/2/object')
+        self.assertFalse(os.path.exists(target))  # interval not reached
+
+        stats.flush(FakeWorker())
+        with open(target) as stats_file:
+            lines = stats_file.readlines()
+        self.assertEqual(len(lines), 1)
+        requests = json.loads(lines[0])['requests']
+        self.assertEqual(set(requests),
+                         set(['/web/dataset/call_kw', '/xmlrpc/2/object']))
+        self.assertEqual(requests['/web/dataset/call_kw']['count'], 2)
+        self.assertEqual(sum(requests['/xmlrpc/2/object']['buckets']), 1)
+        self.assertEqual(stats.stats, {})
+
+    def test_no_target(self):
+        stats = gunicorn_conf.RequestStats(slow_threshold=0)
+        self.request(stats, '/web')
+        self.assertEqual(stats.stats, {})
+
+    def test_max_paths(self):
+        stats = gunicorn_conf.RequestStats(target='stats.json', max_paths=2)
+        for image_id in range(5):
+            self.request(stats, '/web/image/%d' % image_id)
+        self.request(stats, '/web/image/0')
+        self.assertEqual(set(stats.stats), set(['/web/image/0',
+                                                '/web/image/1',
+                                                gunicorn_conf.OTHER_PATHS]))
+        self.assertEqual(stats.stats['/web/image/0']['count'], 2)
+        self.assertEqual(stats.stats[gunicorn_conf.OTHER_PATHS]['count'], 3)
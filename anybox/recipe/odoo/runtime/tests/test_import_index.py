@@ -0,0 +1,70 @@
+import os
+import sys
+import shutil
+from tempfile import mkdtemp
+from unittest import TestCase
+
+from .. import import_index
+
+
+class TestImportIndex(TestCase):
+
+    def setUp(self):
+        self.tmpdir = mkdtemp('test_import_index')
+        self.index_path = os.path.join(self.tmpdir, 'imports.json')
+        self.entry1 = self.make_entry('entry1', 'idx_pkg1', 'idx_common')
+        self.entry2 = self.make_entry('entry2', 'idx_mod2', 'idx_common')
+        self.finder = None
+
+    def tearDown(self):
+        if self.finder is not None:
+            sys.meta_path.remove(self.finder)
+        for name in ('idx_pkg1', 'idx_mod2', 'idx_common'):
+            sys.modules.pop(name, None)
+        shutil.rmtree(self.tmpdir)
+
+    def make_entry(self, name, package, module):
+        path = os.path.join(self.tmpdir, name)
+        os.makedirs(os.path.join(path, package))
+        with open(os.path.join(path, package, '__init__.py'), 'w') as f:
+            f.write("WHERE = %r\n" % name)
+        with open(os.path.join(path, module + '.py'), 'w') as f:
+            f.write("WHERE = %r\n" % name)
+        return path
+
+    def test_scan_path(self):
+        os.mkdir(os.path.join(self.entry1, 'not_a_package'))
+        os.mkdir(os.path.join(self.entry1, 'EGG-INFO'))
+        open(os.path.join(self.entry1, 'some-file.py'), 'w').close()
+        open(os.path.join(self.entry1, 'README.txt'), 'w').close()
+        self.assertEqual(
+            import_index.scan_path([self.entry1, self.entry2,
+                                    os.path.join(self.tmpdir, 'nope.egg')]),
+            dict(idx_pkg1=self.entry1,
+                 idx_mod2=self.entry2, idx_common=self.entry1))
+
+    def test_install(self):
+        import_index.write_index(self.index_path, [self.entry1, self.entry2])
+        self.finder = import_index.install(self.index_path)
+        self.assertTrue(self.finder in sys.meta_path)
+
+        # the finder does not need the entries to be in sys.path
+        import idx_common
+        self.assertEqual(idx_common.WHERE, 'entry1')
+        import idx_pkg1
+        self.assertEqual(idx_pkg1.__path__,
+                         [os.path.join(self.entry1, 'idx_pkg1')])
+        import idx_mod2
+        self.assertEqual(idx_mod2.WHERE, 'entry2')
+
+    def test_install_stale(self):
+        import_index.write_index(self.index_path, [self.entry1])
+        os.remove(os.path.join(self.entry1, 'idx_common.py'))
+        self.finder = import_index.install(self.index_path)
+        self.assertIsNone(self.finder.find_module('idx_common'))
+        self.assertIsNone(self.finder.find_module('idx_unknown'))
+        self.assertIsNone(self.finder.find_module('idx_pkg1.sub',
+                                                  path=[self.entry1]))
+
+    def test_install_missing(self):
+        self.assertIsNone(import_index.install(self.index_path))
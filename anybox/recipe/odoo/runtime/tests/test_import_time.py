@@ -0,0 +1,81 @@
+"""Import time of the runtime entry points.
+
+The generated scripts are often short lived (upgrades, cron jobs, ops
+tooling), and each invocation pays for the imports of the entry point it
+runs before Odoo itself gets imported. These tests make sure that the
+entry points do not import modules they don't need, in fresh interpreters.
+
+``pkg_resources`` is not checked: in generated scripts, the ``anybox``
+namespace package imports it anyway (this doesn't happen here if the
+recipe is installed in development mode, with a ``-nspkg.pth`` file).
+
+Running this module as a script prints the best import time of each entry
+point, for comparisons across versions of the recipe::
+
+  python -m anybox.recipe.odoo.runtime.tests.test_import_time
+"""
+import sys
+import json
+import subprocess
+from unittest import TestCase
+
+ENTRY_POINTS = ('anybox.recipe.odoo.runtime.session',
+                'anybox.recipe.odoo.runtime.upgrade',
+                'anybox.recipe.odoo.runtime.start_openerp',
+                )
+
+HEAVY_MODULES = ('anybox.recipe.odoo.base',
+                 'zc.buildout',
+                 'zc.recipe.egg',
+                 'setuptools',
+                 'tarfile',
+                 'httplib',
+                 )
+
+SUBPROCESS_FREE = ('anybox.recipe.odoo.runtime.session',
+                   'anybox.recipe.odoo.runtime.start_openerp',
+                   )
+"""Entry points that must not import :mod:`subprocess` (on Python 2,
+:mod:`multiprocessing` imports it, hence ``upgrade`` does)."""
+
+IMPORT_CODE = """
+import sys, time, json, warnings
+warnings.simplefilter('ignore')
+start = time.time()
+import %s
+print(json.dumps(dict(seconds=time.time() - start,
+                      modules=sorted(sys.modules))))
+"""
+
+
+def measure_import(module):
+    """Import ``module`` in a fresh interpreter.
+
+    :returns: the duration of the import, in seconds, and the names of all
+              modules loaded afterwards.
+    """
+    output = subprocess.Popen([sys.executable, '-c', IMPORT_CODE % module],
+                              stdout=subprocess.PIPE).communicate()[0]
+    measure = json.loads(output.splitlines()[-1])
+    return measure['seconds'], set(measure['modules'])
+
+
+class TestImportTime(TestCase):
+
+    def assertNotImported(self, module, forbidden):
+        seconds, modules = measure_import(module)
+        self.assertEqual(modules.intersection(forbidden), set())
+
+    def test_runtime_entry_points(self):
+        for module in ENTRY_POINTS:
+            self.assertNotImported(module, HEAVY_MODULES)
+
+    def test_subprocess(self):
+        for module in SUBPROCESS_FREE:
+            self.assertNotImported(module, ('subprocess', ))
+
+
+if __name__ == '__main__':
+    for module in ENTRY_POINTS:
+        best = min(measure_import(module)[0] for i in range(5))
+        print("%-45s %6.1f ms" % (module, best * 1000))
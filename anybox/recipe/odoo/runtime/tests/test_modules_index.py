@@ -0,0 +1,114 @@
+import os
+import shutil
+from tempfile import mkdtemp
+from unittest import TestCase
+
+from .. import modules_index
+
+
+class TestModulesIndex(TestCase):
+
+    def setUp(self):
+        self.tmpdir = mkdtemp('test_modules_index')
+        self.index_path = os.path.join(self.tmpdir, 'modules.json')
+        self.addons1 = self.make_addons_dir('addons1', 'mod1', 'common')
+        self.addons2 = self.make_addons_dir('addons2', 'mod2', 'common')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def make_addons_dir(self, name, *modules):
+        path = os.path.join(self.tmpdir, name)
+        os.mkdir(path)
+        for module in modules:
+            self.make_module(path, module)
+        return path
+
+    def make_module(self, addons_dir, name):
+        mod_dir = os.path.join(addons_dir, name)
+        os.mkdir(mod_dir)
+        with open(os.path.join(mod_dir, '__openerp__.py'), 'w') as f:
+            f.write("{'name': %r}" % name)
+
+    def test_scan_modules(self):
+        os.mkdir(os.path.join(self.addons1, 'not_a_module'))
+        self.assertEqual(
+            modules_index.scan_modules([self.addons1, self.addons2]),
+            dict(mod1=self.addons1, mod2=self.addons2, common=self.addons1))
+
+    def test_write_read(self):
+        modules_index.write_index(self.index_path,
+                                  [self.addons1, self.addons2])
+        self.assertEqual(modules_index.read_index(self.index_path),
+                         ['common', 'mod1', 'mod2'])
+
+    def test_read_missing(self):
+        self.assertIsNone(modules_index.read_index(self.index_path))
+
+    def test_read_stale(self):
+        modules_index.write_index(self.index_path,
+                                  [self.addons1, self.addons2])
+        # making sure the mtime does change, whatever the fs resolution
+        stat = os.stat(self.addons2)
+        self.make_module(self.addons2, 'mod3')
+        os.utime(self.addons2, (stat.st_atime, stat.st_mtime + 10))
+
+        self.assertIsNone(modules_index.read_index(self.index_path))
+        self.assertEqual(
+            modules_index.read_index(self.index_path, check_fresh=False),
+            ['common', 'mod1', 'mod2'])
+
+    def test_read_stale_manifest(self):
+        modules_index.write_index(self.index_path,
+                                  [self.addons1, self.addons2])
+        # the addons directory itself is unchanged
+        manifest = os.path.join(self.addons2, 'mod2', '__openerp__.py')
+        stat = os.stat(manifest)
+        with open(manifest, 'w') as f:
+            f.write("{'name': 'mod2', 'depends': ['mod1']}")
+        os.utime(manifest, (stat.st_atime, stat.st_mtime + 10))
+        self.assertIsNone(modules_index.read_index(self.index_path))
+
+        modules_index.write_index(self.index_path,
+                                  [self.addons1, self.addons2])
+        os.remove(manifest)
+        self.assertIsNone(modules_index.read_index(self.index_path))
+
+    def test_module_fingerprint(self):
+        mod_dir = os.path.join(self.addons1, 'common')
+        fprint = modules_index.module_fingerprint(mod_dir)
+        self.assertEqual(fprint,
+                         modules_index.module_fingerprint(
+                             os.path.join(self.addons2, 'common')),
+                         msg="Same content should give same fingerprint")
+
+        # object files are ignored
+        with open(os.path.join(mod_dir, 'models.pyc'), 'w') as f:
+            f.write('compiled')
+        self.assertEqual(modules_index.module_fingerprint(mod_dir), fprint)
+
+        with open(os.path.join(mod_dir, 'models.py'), 'w') as f:
+            f.write('# some code')
+        self.assertNotEqual(modules_index.module_fingerprint(mod_dir), fprint)
+
+
+class TestDependencyClosure(TestCase):
+
+    graph = dict(base=(),
+                 web=('base', ),
+                 sale=('web', 'product'),
+                 product=('base', ),
+                 crm=('sale', 'web'))
+
+    def closure(self, *modules):
+        return modules_index.dependency_closure(modules, self.graph.get)
+
+    def test_closure(self):
+        self.assertEqual(self.closure('crm'),
+                         ['base', 'web', 'product', 'sale', 'crm'])
+        self.assertEqual(self.closure('product', 'web'),
+                         ['base', 'product', 'web'])
+
+    def test_closure_cycle(self):
+        self.graph = dict(a=('b', ), b=('a', ))
+        self.assertEqual(self.closure('a'), ['b', 'a'])
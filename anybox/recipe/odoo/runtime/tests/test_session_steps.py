@@ -0,0 +1,81 @@
+import os
+import shutil
+import warnings
+from tempfile import mkdtemp
+from unittest import TestCase
+
+with warnings.catch_warnings():
+    # Odoo is not importable in these tests
+    warnings.simplefilter('ignore', RuntimeWarning)
+    from ..session import Session
+    from ..session import DEFAULT_CHECKPOINTS_PARAMETER
+
+
+class FakeConfigParameter(object):
+    """Stand-in for the ``ir.config_parameter`` model (old API)."""
+
+    def __init__(self, params):
+        self.params = params
+
+    def search(self, cr, uid, domain):
+        (field, op, value), = domain
+        return [key for key in self.params if key == value]
+
+    def unlink(self, cr, uid, ids):
+        for key in ids:
+            del self.params[key]
+
+
+class TestSessionSteps(TestCase):
+
+    def setUp(self):
+        self.session = Session(None, None, parse_config=False)
+
+    def test_steps(self):
+        with self.session.step('outer'):
+            with self.session.step('inner'):
+                pass
+        self.assertEqual([(s['name'], s['depth'], s['outcome'])
+                          for s in self.session.steps],
+                         [('outer', 0, 'success'), ('inner', 1, 'success')])
+        self.assertTrue(self.session.steps[0]['duration'] >= 0)
+        self.assertIsNone(self.session.steps[0]['profile'])
+
+    def test_step_failure(self):
+        def fail():
+            with self.session.step('failing'):
+                raise RuntimeError('expected')
+        self.assertRaises(RuntimeError, fail)
+        self.assertEqual(self.session.steps[0]['outcome'], 'failure')
+        with self.session.step('next'):
+            pass
+        self.assertEqual(self.session.steps[1]['depth'], 0)
+
+    def test_step_profile(self):
+        profile_dir = self.session.profile_dir = mkdtemp('test_steps')
+        try:
+            with self.session.step('migrate invoices'):
+                with self.session.step('inner'):
+                    pass
+            steps = self.session.steps
+            self.assertEqual(steps[0]['profile'],
+                             os.path.join(profile_dir,
+                                          '001-migrate_invoices.prof'))
+            self.assertTrue(os.path.isfile(steps[0]['profile']))
+            # nested steps are profiled with the outermost one
+            self.assertIsNone(steps[1]['profile'])
+        finally:
+            shutil.rmtree(profile_dir)
+
+    def test_clear_checkpoints(self):
+        params = {DEFAULT_CHECKPOINTS_PARAMETER: '{"done": ["a"]}',
+                  'other': 'value'}
+        self.session._registry = {
+            'ir.config_parameter': FakeConfigParameter(params)}
+        self.session.uid = 1
+        self.session.clear_checkpoints()
+        # the row is removed, not emptied
+        self.assertEqual(params, {'other': 'value'})
+
+    def test_update_changed_modules_not_open(self):
+        self.assertRaises(ValueError, self.session.update_changed_modules)
@@ -0,0 +1,117 @@
+import os
+import sys
+import shutil
+from StringIO import StringIO
+from types import ModuleType
+from tempfile import mkdtemp
+from unittest import TestCase
+
+from .. import sharding
+from .. import databases
+
+FAKE_SCRIPT = """
+import sys
+args = sys.argv[1:]
+print('args %r' % (args, ))
+modules = [a.split('=', 1)[1] for a in args if '=' in a][0]
+sys.exit(1 if 'failing' in modules.split(',') else 0)
+"""
+
+DEPENDS = {'sale': ['base'],
+           'stock': ['base'],
+           'sale_stock': ['sale', 'stock']}
+
+
+class FakeConfig(dict):
+
+    def parse_config(self, args):
+        pass
+
+
+class TestRunShardedTests(TestCase):
+    """Sharded tests with a fake test script and database layer."""
+
+    def setUp(self):
+        self.tmpdir = mkdtemp('test_sharding')
+        self.script = os.path.join(self.tmpdir, 'test_openerp')
+        with open(self.script, 'w') as script:
+            script.write(FAKE_SCRIPT)
+        self.logs_dir = os.path.join(self.tmpdir, 'logs')
+        self.dbs = dbs = {}
+        self.patched = []
+
+        self.patch(databases, 'database_exists', dbs.__contains__)
+        self.patch(databases, 'drop_database', dbs.pop)
+        self.patch(databases, 'clone_database',
+                   lambda template, db_name: dbs.__setitem__(db_name,
+                                                             template))
+
+        openerp = ModuleType('openerp')
+        openerp.tools = ModuleType('openerp.tools')
+        openerp.tools.config = FakeConfig(db_name=False)
+        openerp.modules = ModuleType('openerp.modules')
+        openerp.modules.module = ModuleType('openerp.modules.module')
+        openerp.modules.module.load_information_from_description_file = (
+            lambda module: dict(depends=DEPENDS.get(module, ())))
+        self.fake_modules = dict((m.__name__, m) for m in (
+            openerp, openerp.tools, openerp.modules, openerp.modules.module))
+        sys.modules.update(self.fake_modules)
+
+    def tearDown(self):
+        for obj, attr, orig in reversed(self.patched):
+            setattr(obj, attr, orig)
+        for name in self.fake_modules:
+            del sys.modules[name]
+        for handler in sharding.logger.handlers[:]:
+            sharding.logger.removeHandler(handler)
+        shutil.rmtree(self.tmpdir)
+
+    def patch(self, obj, attr, value):
+        self.patched.append((obj, attr, getattr(obj, attr)))
+        setattr(obj, attr, value)
+
+    def run_sharded(self, argv, template=None):
+        stdout = sys.stdout
+        sys.stdout = output = StringIO()
+        try:
+            status = sharding.run_sharded_tests(
+                self.script, 'openerp.cfg', argv, 2, template=template,
+                logs_dir=self.logs_dir)
+        finally:
+            sys.stdout = stdout
+        return status, output.getvalue()
+
+    def test_install(self):
+        self.dbs['test_shard0'] = 'leftover'
+        status, output = self.run_sharded(
+            ['-i', 'crm,failing,sale,sale_stock,stock', '-d', 'test',
+             '--test-enable'])
+        self.assertEqual(status, 1)
+        # dependent modules are tested in the same shard
+        self.assertTrue("args ['-d', 'test_shard0', "
+                        "'--init=sale,sale_stock,stock', '--test-enable']"
+                        in output)
+        self.assertTrue("args ['-d', 'test_shard1', "
+                        "'--init=crm,failing', '--test-enable']" in output)
+        self.assertEqual(self.dbs, {})  # dropped, created by Odoo
+        # outputs of shards are merged in order
+        log0, log1 = [os.path.join(self.logs_dir, 'test_shard%d.log' % i)
+                      for i in range(2)]
+        self.assertTrue(output.index('===== %s' % log0) <
+                        output.index("args ['-d', 'test_shard0'") <
+                        output.index('===== %s' % log1) <
+                        output.index("args ['-d', 'test_shard1'"))
+        self.assertTrue("in 2 shards, 1 failed: 1" in output)
+
+    def test_update_template(self):
+        status, output = self.run_sharded(['-u', 'crm,sale', '-d', 'test'],
+                                          template='tmpl')
+        self.assertEqual(status, 0)
+        self.assertEqual(self.dbs, dict(test_shard0='tmpl',
+                                        test_shard1='tmpl'))
+        self.assertTrue("'--update=crm'" in output)
+
+    def test_update_no_template(self):
+        status, output = self.run_sharded(['-u', 'crm,sale', '-d', 'test'])
+        self.assertEqual(status, 1)
+        self.assertFalse(os.path.exists(self.logs_dir))
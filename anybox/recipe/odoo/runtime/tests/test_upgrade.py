@@ -0,0 +1,154 @@
+import os
+import sys
+import shutil
+import warnings
+import multiprocessing
+from types import ModuleType
+from argparse import Namespace
+from tempfile import mkdtemp
+from unittest import TestCase
+
+with warnings.catch_warnings():
+    # Odoo is not importable in these tests
+    warnings.simplefilter('ignore', RuntimeWarning)
+    from ..upgrade import compute_template_key
+    from .. import upgrade
+    from .. import databases
+    from ..upgrade import TEMPLATE_KEY_PARAMETER
+    from ..session import DEFAULT_FINGERPRINTS_PARAMETER
+
+
+class TestTemplateKey(TestCase):
+
+    def setUp(self):
+        self.tmpdir = mkdtemp('test_upgrade')
+        self.script = os.path.join(self.tmpdir, 'upgrade.py')
+        self.write_script("def run(session, logger):\n    pass\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write_script(self, source):
+        with open(self.script, 'w') as script:
+            script.write(source)
+
+    def key(self, callable_name='run', version='1.0', demo=False):
+        return compute_template_key(self.script, callable_name, version, demo)
+
+    def test_key(self):
+        key = self.key()
+        self.assertEqual(self.key(), key)
+        self.assertNotEqual(self.key(callable_name='other'), key)
+        self.assertNotEqual(self.key(version='1.1'), key)
+        self.assertNotEqual(self.key(version=None), key)
+        self.assertNotEqual(self.key(demo=True), key)
+
+        self.write_script("def run(session, logger):\n    return 1\n")
+        self.assertNotEqual(self.key(), key)
+
+
+class FakeProcess(object):
+    """Run the target in the current process, when started."""
+
+    def __init__(self, target=None, name=None, args=(), kwargs=None):
+        self.target = target
+        self.args = args
+        self.kwargs = kwargs or {}
+        self.exitcode = None
+
+    def start(self):
+        try:
+            self.target(*self.args, **self.kwargs)
+        except SystemExit, exc:
+            self.exitcode = exc.code
+
+    def join(self):
+        pass
+
+
+class TestCreateFromTemplate(TestCase):
+    """Creation from a template, with a fake database layer.
+
+    Databases are represented by the dict of their parameters, or ``None``
+    if they are empty.
+    """
+
+    def setUp(self):
+        self.tmpdir = mkdtemp('test_upgrade')
+        self.script = os.path.join(self.tmpdir, 'upgrade.py')
+        with open(self.script, 'w') as script:
+            script.write("def run(session, logger):\n    pass\n")
+        self.dbs = {}
+        self.upgraded = []
+        self.patched = []
+
+        dbs = self.dbs
+
+        def clone_database(template, db_name):
+            dbs[db_name] = dbs[template]
+
+        def run_upgrade(upgrade_script, upgrade_callable, conf,
+                        buildout_dir, arguments, db_name, log_path,
+                        console_prefix='', template_key=None):
+            # as Session.open() would, fail on missing databases
+            if db_name not in dbs:
+                return 1
+            self.upgraded.append(db_name)
+            dbs[db_name] = {TEMPLATE_KEY_PARAMETER: template_key,
+                            DEFAULT_FINGERPRINTS_PARAMETER: '{}'}
+            return 0
+
+        self.patch(databases, 'database_exists', dbs.__contains__)
+        self.patch(databases, 'is_odoo_database',
+                   lambda db_name: dbs.get(db_name) is not None)
+        self.patch(databases, 'read_parameters',
+                   lambda db_name, keys: dbs[db_name])
+        self.patch(databases, 'create_empty_database',
+                   lambda db_name: dbs.__setitem__(db_name, None))
+        self.patch(databases, 'drop_database', dbs.pop)
+        self.patch(databases, 'clone_database', clone_database)
+        self.patch(upgrade, 'run_upgrade', run_upgrade)
+        self.patch(multiprocessing, 'Process', FakeProcess)
+
+        openerp = ModuleType('openerp')
+        openerp.tools = ModuleType('openerp.tools')
+        openerp.tools.config = Namespace(parse_config=lambda args: None)
+        sys.modules['openerp'] = openerp
+        sys.modules['openerp.tools'] = openerp.tools
+
+    def tearDown(self):
+        for obj, attr, orig in reversed(self.patched):
+            setattr(obj, attr, orig)
+        del sys.modules['openerp'], sys.modules['openerp.tools']
+        shutil.rmtree(self.tmpdir)
+
+    def patch(self, obj, attr, value):
+        self.patched.append((obj, attr, getattr(obj, attr)))
+        setattr(obj, attr, value)
+
+    def create(self, *db_names):
+        return upgrade.create_from_template(
+            self.script, 'run', 'openerp.cfg', self.tmpdir,
+            Namespace(init_load_demo_data=False), 'tmpl', list(db_names),
+            os.path.join(self.tmpdir, 'upgrade.log'))
+
+    def test_create_refresh(self):
+        # template built from scratch on first use
+        self.assertEqual(self.create('db1', 'db2'), (0, ['db1', 'db2']))
+        self.assertEqual(self.upgraded, ['tmpl'])
+        self.assertEqual(self.dbs['db1'], self.dbs['tmpl'])
+
+        # fresh template is reused
+        self.assertEqual(self.create('db1', 'db3'), (0, ['db3']))
+        self.assertEqual(self.upgraded, ['tmpl'])
+
+        # stale template is dropped and rebuilt
+        self.dbs['tmpl'][TEMPLATE_KEY_PARAMETER] = 'other'
+        self.assertEqual(self.create('db4'), (0, ['db4']))
+        self.assertEqual(self.upgraded, ['tmpl', 'tmpl'])
+
+        # leftover of an interrupted build
+        self.dbs['tmpl'] = None
+        self.assertEqual(self.create('db5'), (0, ['db5']))
+        self.assertEqual(self.upgraded, ['tmpl', 'tmpl', 'tmpl'])
+        self.assertTrue(self.dbs['db5'] is not None)
@@ -7,7 +7,11 @@ taking logic.
 import os
 import sys
 import imp
+import json
+import time
+import hashlib
 import logging
+import multiprocessing
 from argparse import ArgumentParser
 from argparse import ArgumentDefaultsHelpFormatter
 from argparse import SUPPRESS
@@ -16,9 +20,13 @@ from math import ceil
 
 from ..utils import total_seconds
 from .session import Session
+from .session import DEFAULT_FINGERPRINTS_PARAMETER
+from .modules_index import module_fingerprint
 
 DEFAULT_LOG_FILE = 'upgrade.log'
 
+TEMPLATE_KEY_PARAMETER = 'buildout.template_key'
+
 
 def upgrade(upgrade_script, upgrade_callable, conf, buildout_dir):
     """Run the upgrade from a source file.
@@ -40,6 +48,13 @@ def upgrade(upgrade_script, upgrade_callable, conf, buildout_dir):
 
     * ``conf``: path to the Odoo configuration file (managed by the recipe)
     * ``buildout_dir``: directory of the buildout
+
+    If several databases are specified (see ``--db-names`` and
+    ``--all-databases``), the upgrade is run for each of them in a separate
+    process, see :func:`upgrade_databases`.
+
+    With ``--from-template``, missing databases are first created from
+    a template database, see :func:`create_from_template`.
     """
 
     parser = ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter,
@@ -47,7 +62,9 @@ def upgrade(upgrade_script, upgrade_callable, conf, buildout_dir):
     parser.add_argument('--log-file', default=DEFAULT_LOG_FILE,
                         help="File to log sub-operations to, relative to the "
                         "current working directory, supports homedir "
-                        "expansion ('~' on POSIX systems).")
+                        "expansion ('~' on POSIX systems). If several "
+                        "databases are upgraded, the database name is "
+                        "inserted before the extension.")
     parser.add_argument('--log-level', default='info',
                         help="Main Odoo logging level. Does not affect the "
                         "logging from the main upgrade script itself.")
@@ -62,6 +79,26 @@ def upgrade(upgrade_script, upgrade_callable, conf, buildout_dir):
     parser.add_argument('-d', '--db-name', default=SUPPRESS,
                         help="Database name. If ommitted, the general default "
                         "values from Odoo config file or libpq will apply.")
+    parser.add_argument('--db-names', default=SUPPRESS,
+                        help="Comma-separated list of databases to upgrade, "
+                        "each in a separate process.")
+    parser.add_argument('--all-databases', action='store_true',
+                        help="Upgrade all the Odoo databases of the "
+                        "PostgreSQL cluster, each in a separate process.")
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help="Number of databases to upgrade in parallel. "
+                        "Only meaningful with --db-names or --all-databases.")
+    parser.add_argument('--profile-dir', default=SUPPRESS,
+                        help="If specified, each step of the upgrade (see "
+                        "Session.step()) is profiled, and the statistics are "
+                        "dumped in this directory.")
+    parser.add_argument('--from-template', default=SUPPRESS,
+                        metavar='TEMPLATE',
+                        help="Create missing databases by copying the "
+                        "TEMPLATE database, which is itself initialized by "
+                        "the upgrade script if needed, and rebuilt if the "
+                        "upgrade script, the package version or the source "
+                        "files of its modules changed.")
     parser.add_argument('--init-load-demo-data', action='store_true',
                         help="Demo data will be loaded with module "
                         "installations if and only if "
@@ -69,6 +106,271 @@ def upgrade(upgrade_script, upgrade_callable, conf, buildout_dir):
 
     arguments = parser.parse_args()  # 'args' would shadow the one of pdb
     log_path = os.path.abspath(os.path.expanduser(arguments.log_file))
+
+    db_names = getattr(arguments, 'db_names', None)
+    if hasattr(arguments, 'db_name') and (db_names is not None or
+                                          arguments.all_databases):
+        parser.error("-d/--db-name can't be combined with --db-names "
+                     "or --all-databases")
+    if db_names is not None:
+        db_names = parse_db_names(db_names)
+    elif arguments.all_databases:
+        from openerp.tools import config
+        from .databases import list_databases
+        config.parse_config(['-c', conf])
+        db_names = list_databases()
+
+    template = getattr(arguments, 'from_template', None)
+    if template is not None:
+        targets = db_names
+        if targets is None:
+            if not hasattr(arguments, 'db_name'):
+                parser.error("--from-template needs explicit database names")
+            targets = [arguments.db_name]
+        statuscode, created = create_from_template(
+            upgrade_script, upgrade_callable, conf, buildout_dir, arguments,
+            template, targets, log_path)
+        if statuscode:
+            sys.exit(statuscode)
+        # copies of a template that's just been upgraded are up to date
+        if db_names is None and created:
+            sys.exit(0)
+        if db_names is not None:
+            db_names = [db_name for db_name in db_names
+                        if db_name not in created]
+
+    if db_names is None:
+        statuscode = run_upgrade(upgrade_script, upgrade_callable,
+                                 conf, buildout_dir, arguments,
+                                 getattr(arguments, 'db_name', None),
+                                 log_path)
+    else:
+        statuscode = upgrade_databases(upgrade_script, upgrade_callable,
+                                       conf, buildout_dir, arguments,
+                                       db_names, log_path)
+    sys.exit(statuscode)
+
+
+def parse_db_names(value):
+    """Parse a comma-separated list of database names.
+
+    Duplicates are removed, so that each database is upgraded only once.
+
+    >>> parse_db_names('a, b,,a')
+    ['a', 'b']
+    """
+    db_names = []
+    for db_name in value.split(','):
+        db_name = db_name.strip()
+        if db_name and db_name not in db_names:
+            db_names.append(db_name)
+    return db_names
+
+
+def db_log_path(log_path, db_name):
+    """Return the path of the log file dedicated to a database.
+
+    >>> db_log_path('/var/log/upgrade.log', 'prod')
+    '/var/log/upgrade.prod.log'
+    """
+    root, ext = os.path.splitext(log_path)
+    return '%s.%s%s' % (root, db_name, ext)
+
+
+def steps_summary_path(log_path):
+    """Return the path of the JSON steps summary for a given log file.
+
+    >>> steps_summary_path('/var/log/upgrade.log')
+    '/var/log/upgrade.steps.json'
+    """
+    return os.path.splitext(log_path)[0] + '.steps.json'
+
+
+def write_steps_summary(path, session, db_name, status, total_time):
+    """Dump the steps recorded by the session, and overall results."""
+    with open(path, 'w') as summary_file:
+        json.dump(dict(database=db_name,
+                       status=status,
+                       total_time=total_time,
+                       steps=session.steps),
+                  summary_file, indent=2)
+
+
+def compute_template_key(upgrade_script, upgrade_callable, pkg_version,
+                         with_demo):
+    """Hash of what determines the contents of a template database.
+
+    The source files of the modules are handled separately, see
+    :func:`is_template_fresh`.
+    """
+    digest = hashlib.sha1()
+    with open(upgrade_script, 'rb') as script:
+        digest.update(script.read())
+    for item in (upgrade_callable, pkg_version, bool(with_demo)):
+        digest.update('\0' + str(item))
+    return digest.hexdigest()
+
+
+def is_template_fresh(template, key):
+    """True if the existing ``template`` database can be copied.
+
+    This means it's been built with the given ``key`` (see
+    :func:`compute_template_key`), and that the source files of the
+    modules it has been built with did not change since then.
+    """
+    import openerp
+    from .databases import read_parameters, is_odoo_database
+    if not is_odoo_database(template):
+        # e.g., left over by an interrupted build
+        return False
+    params = read_parameters(template, (TEMPLATE_KEY_PARAMETER,
+                                        DEFAULT_FINGERPRINTS_PARAMETER))
+    if params.get(TEMPLATE_KEY_PARAMETER) != key:
+        return False
+    stored = json.loads(params.get(DEFAULT_FINGERPRINTS_PARAMETER) or '{}')
+    for module, fingerprint in stored.items():
+        path = openerp.modules.module.get_module_path(module)
+        if not path or module_fingerprint(path) != fingerprint:
+            return False
+    return True
+
+
+def create_from_template(upgrade_script, upgrade_callable, conf, buildout_dir,
+                         arguments, template, db_names, log_path):
+    """Create those of ``db_names`` that don't exist by copying ``template``.
+
+    The template database is (re)built first if it does not exist or
+    is not fresh (see :func:`is_template_fresh`): it is created empty,
+    then the upgrade is run on it (in a separate process), recording the
+    key and modules fingerprints it's been built with.
+
+    The upgrade doesn't have to be run on the created databases, since they
+    are copies of an upgraded database.
+
+    :returns: a pair made of the status (0 in case of success, the status
+              of the template upgrade otherwise), and the list of created
+              databases.
+    """
+    from openerp.tools import config
+    from .databases import database_exists, clone_database, drop_database
+    from .databases import create_empty_database
+    config.parse_config(['-c', conf])
+    logger = logging.getLogger(__name__)
+    missing = [db_name for db_name in db_names
+               if not database_exists(db_name)]
+    if not missing:
+        return 0, missing
+
+    session = Session(conf, buildout_dir, parse_config=False)
+    key = compute_template_key(upgrade_script, upgrade_callable,
+                               session.package_version,
+                               arguments.init_load_demo_data)
+    if not database_exists(template) or not is_template_fresh(template, key):
+        if database_exists(template):
+            drop_database(template)
+        logger.info("Building template database %r", template)
+        create_empty_database(template)
+        process = multiprocessing.Process(
+            target=_upgrade_process,
+            name='upgrade-' + template,
+            args=(upgrade_script, upgrade_callable, conf, buildout_dir,
+                  arguments, template, db_log_path(log_path, template)),
+            kwargs=dict(template_key=key))
+        process.start()
+        process.join()
+        if process.exitcode:
+            logger.error("Building template database %r failed (status %r)",
+                         template, process.exitcode)
+            return process.exitcode, []
+
+    for db_name in missing:
+        clone_database(template, db_name)
+    return 0, missing
+
+
+def upgrade_databases(upgrade_script, upgrade_callable, conf, buildout_dir,
+                      arguments, db_names, log_path):
+    """Run the upgrade for each of ``db_names``, in separate processes.
+
+    At most ``arguments.jobs`` processes run at the same time. Each one
+    logs to its own file (see :func:`db_log_path`).
+
+    :returns: 0 if all upgrades were successful, 1 otherwise.
+    """
+    jobs = max(arguments.jobs, 1)
+    logger = logging.getLogger(__name__)
+    logger.setLevel(logging.INFO)
+    if not arguments.quiet:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter(
+            "%(asctime)s %(levelname)s  %(message)s"))
+        logger.addHandler(handler)
+
+    logger.info("Upgrading %d databases, with %d parallel jobs",
+                len(db_names), jobs)
+    start_time = datetime.utcnow()
+    pending = list(db_names)
+    running = {}
+    statuses = {}
+    while pending or running:
+        while pending and len(running) < jobs:
+            db_name = pending.pop(0)
+            process = multiprocessing.Process(
+                target=_upgrade_process,
+                name='upgrade-' + db_name,
+                args=(upgrade_script, upgrade_callable, conf, buildout_dir,
+                      arguments, db_name, db_log_path(log_path, db_name)))
+            process.start()
+            running[db_name] = process
+
+        time.sleep(0.1)
+        for db_name, process in running.items():
+            if process.is_alive():
+                continue
+            process.join()
+            del running[db_name]
+            statuses[db_name] = process.exitcode
+            if process.exitcode:
+                logger.error("Upgrade of database %r failed (status %r). "
+                             "Please check logs at %s", db_name,
+                             process.exitcode, db_log_path(log_path, db_name))
+            else:
+                logger.info("Upgrade of database %r successful", db_name)
+
+    failed = [db_name for db_name in db_names if statuses[db_name]]
+    logger.info("Upgraded %d databases in %d seconds, %d failures%s",
+                len(db_names),
+                ceil(total_seconds((datetime.utcnow() - start_time))),
+                len(failed),
+                ': ' + ', '.join(failed) if failed else '')
+    return 1 if failed else 0
+
+
+def _upgrade_process(upgrade_script, upgrade_callable, conf, buildout_dir,
+                     arguments, db_name, log_path, template_key=None):
+    """Target for the processes spawned by :func:`upgrade_databases`."""
+    sys.exit(run_upgrade(upgrade_script, upgrade_callable, conf, buildout_dir,
+                         arguments, db_name, log_path,
+                         console_prefix='[%s] ' % db_name,
+                         template_key=template_key))
+
+
+def run_upgrade(upgrade_script, upgrade_callable, conf, buildout_dir,
+                arguments, db_name, log_path, console_prefix='',
+                template_key=None):
+    """Run the upgrade of a single database.
+
+    :param arguments: parsed command-line arguments, see :func:`upgrade`
+    :param db_name: the database to upgrade. If ``None``, the general
+                    default values from Odoo config file or libpq will apply.
+    :param log_path: absolute path of the log file
+    :param console_prefix: prepended to console log messages
+    :param template_key: if not ``None``, the database is meant to be used
+                         as a template. This key and the fingerprints of
+                         the installed modules are stored in it.
+    :returns: the status code of the upgrade callable, or ``-1`` if the
+              log file can't be opened
+    """
     log_level = arguments.log_level.upper()
     console_level = arguments.console_log_level.upper()
     quiet = arguments.quiet
@@ -77,9 +379,14 @@ def upgrade(upgrade_script, upgrade_callable, conf, buildout_dir):
         log_file = open(log_path, 'a')
     except IOError:
         sys.stderr.write("Cannot open %r for write" % log_path + os.linesep)
-        sys.exit(-1)
+        return -1
 
     session = Session(conf, buildout_dir)
+    profile_dir = getattr(arguments, 'profile_dir', None)
+    if profile_dir is not None:
+        session.profile_dir = os.path.abspath(os.path.expanduser(profile_dir))
+        if not os.path.isdir(session.profile_dir):
+            os.makedirs(session.profile_dir)
 
     from openerp.tools import config
     config['logfile'] = log_path
@@ -87,16 +394,16 @@ def upgrade(upgrade_script, upgrade_callable, conf, buildout_dir):
 
     start_time = datetime.utcnow()
     if not quiet:
-        print("Starting upgrade, logging details to %s at level %s, "
+        print("%sStarting upgrade, logging details to %s at level %s, "
               "and major steps to console at level %s" % (
-                  log_path, log_level, console_level))
+                  console_prefix, log_path, log_level, console_level))
         print('')
 
     logger = logging.getLogger('openerp.upgrade')
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setLevel(getattr(logging, console_level))
     console_handler.setFormatter(logging.Formatter(
-        "%(asctime)s %(levelname)s  %(message)s"))
+        "%(asctime)s %(levelname)s  " + console_prefix + "%(message)s"))
 
     log_file_handler = logging.FileHandler(log_path, 'a')
     log_file_handler.setLevel(getattr(logging, log_level))
@@ -108,7 +415,6 @@ def upgrade(upgrade_script, upgrade_callable, conf, buildout_dir):
     if not arguments.quiet:
         logger.addHandler(console_handler)
 
-    db_name = getattr(arguments, 'db_name', None)
     logger.info("Opening database %r", db_name)
     session.open(db=db_name, with_demo=bool(arguments.init_load_demo_data))
     # actual value after all defaultings have been done
@@ -143,11 +449,30 @@ def upgrade(upgrade_script, upgrade_callable, conf, buildout_dir):
 
     upgrade_module = imp.load_source('anybox.recipe.odoo.upgrade_openerp',
                                      upgrade_script)
-    statuscode = getattr(upgrade_module, upgrade_callable)(session, logger)
+    statuscode = 'exception'
+    try:
+        statuscode = getattr(upgrade_module, upgrade_callable)(session, logger)
+    finally:
+        total_time = total_seconds(datetime.utcnow() - start_time)
+        summary_path = steps_summary_path(log_path)
+        write_steps_summary(summary_path, session, db_name, statuscode,
+                            total_time)
+        for step in session.steps:
+            if step['depth'] == 0:
+                logger.info("Step %r: %s in %.1f seconds", step['name'],
+                            step['outcome'], step['duration'])
+        logger.info("Steps summary written to %s", summary_path)
+
     if statuscode is None or statuscode == 0:
         if pkg_version is not None:
             logger.info("setting version %s in database" % pkg_version)
             session.db_version = pkg_version
+        session.clear_checkpoints()
+        if template_key is not None:
+            session.registry('ir.config_parameter').set_param(
+                session.cr, session.uid, TEMPLATE_KEY_PARAMETER, template_key)
+            session.db_modules_fingerprints = session.modules_fingerprints(
+                session.installed_modules())
         session.cr.commit()
         session.close()
         logger.info("%s successful. Total time: %d seconds." % (
@@ -158,4 +483,4 @@ def upgrade(upgrade_script, upgrade_callable, conf, buildout_dir):
         logger.error("Please check logs at %s" % log_path)
 
     log_file.close()
-    sys.exit(statuscode)
+    return statuscode
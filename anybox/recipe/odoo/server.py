@@ -3,17 +3,47 @@ import os
 from os.path import join
 import sys
 import shutil
+import tempfile
 import logging
+import multiprocessing
 import zc.buildout
 from zc.buildout import UserError
 from base import BaseRecipe
 from . import devtools
+from .runtime import modules_index
+from .runtime import import_index
 from .utils import option_splitlines, option_strip
+from .utils import host_memory, prefork_sizing, MB
+from .utils import link_farm
 
 logger = logging.getLogger(__name__)
 
+CONSOLIDATED_SITE_OPTION = 'consolidated-site'
+IMPORT_INDEX_OPTION = 'import-index'
+
+ONE_PASS_SCRIPTS_HELPERS = ('realpath', '_relative_path_and_setup',
+                            '_script', '_pyscript')
+"""Functions of :mod:`zc.buildout.easy_install` that render scripts in one
+pass. Except for ``realpath``, they are private: they have been checked
+against zc.buildout 2.5.3, with the signatures of that version. If any is
+missing, scripts are generated one by one with the public ``scripts()``.
+"""
+
 SERVER_COMMA_LIST_OPTIONS = ('log_handler', )
 
+PREFORK_SIZING_PARAMS = ('concurrency', 'worker_memory', 'cron_threads',
+                         'request_time')
+"""Parameters of prefork sizing, given as ``workers.*`` options (besides
+``workers.cpus`` and ``workers.memory``)."""
+
+GUNICORN_HOOKS = (('on_starting', 'server'),
+                  ('post_fork', 'server, worker'),
+                  ('pre_request', 'worker, req'),
+                  ('post_request', 'worker, req, environ, resp'),
+                  ('worker_exit', 'server, worker'))
+"""Gunicorn hooks that the configuration can define, with their arguments.
+"""
+
 
 class ServerRecipe(BaseRecipe):
     """Recipe for server install and config
@@ -35,9 +65,14 @@ class ServerRecipe(BaseRecipe):
     with_gunicorn = False
     with_upgrade = True
     ws = None
+    scripts_path_setup = None
+    one_pass_scripts = True
+    import_index_path = None
     template_upgrade_script = os.path.join(os.path.dirname(__file__),
                                            'upgrade.py.tmpl')
     server_wide_modules = ()
+    develop_fingerprint_files = BaseRecipe.develop_fingerprint_files + (
+        'openerp/release.py', 'odoo/release.py')  # version is read there
 
     def __init__(self, *a, **kw):
         super(ServerRecipe, self).__init__(*a, **kw)
@@ -53,6 +88,46 @@ class ServerRecipe(BaseRecipe):
         if sw_modules and 'web' not in sw_modules:
             sw_modules = ('web', ) + sw_modules
         self.server_wide_modules = sw_modules
+        if option_strip(opt.get('options.workers')) == 'auto':
+            self._apply_prefork_sizing()
+
+    def _apply_prefork_sizing(self):
+        """Compute options of the prefork server for ``options.workers=auto``.
+
+        The result depends on the host resources and on the ``workers.*``
+        options (see :func:`.utils.prefork_sizing`). Explicit ``options.*``
+        values are kept.
+        """
+        prefix = 'workers.'
+        params = {}
+        for k, v in self.options.items():
+            if not k.startswith(prefix):
+                continue
+            try:
+                params[k[len(prefix):]] = int(option_strip(v))
+            except ValueError:
+                raise UserError("Option %r of part %r must be an "
+                                "integer (got %r)" % (k, self.name, v))
+
+        cpus = params.pop('cpus', None) or multiprocessing.cpu_count()
+        memory = params.pop('memory', None) or host_memory()
+        if memory is None:
+            raise UserError("Could not determine the memory of the host. "
+                            "Please specify it with the workers.memory "
+                            "option of part %r" % self.name)
+        unknown = set(params).difference(PREFORK_SIZING_PARAMS)
+        if unknown:
+            raise UserError("Unknown options in part %r: %s" % (
+                self.name, ', '.join(prefix + p for p in sorted(unknown))))
+
+        sizing = prefork_sizing(cpus, memory, **params)
+        self.options['options.workers'] = str(sizing['workers'])
+        for opt, val in sorted(sizing.items()):
+            self.options.setdefault('options.' + opt, str(val))
+        logger.info("Prefork server sizing for %d CPUs and %d MB of memory: "
+                    "%s", cpus, memory // MB,
+                    ', '.join('%s=%s' % (opt, self.options['options.' + opt])
+                              for opt in sorted(sizing)))
 
     def apply_version_dependent_decisions(self):
         """Store some booleans depending on detected version.
@@ -105,6 +180,34 @@ class ServerRecipe(BaseRecipe):
         from openerp.tools.config import configmanager
         configmanager(self.config_path).save()
 
+    def _float_option(self, name, value):
+        """Convert the value of option ``name`` to a float.
+
+        :raises: :class:`UserError` if it is not a number.
+        """
+        try:
+            return float(option_strip(value))
+        except ValueError:
+            raise UserError("Option %r of part %r must be a "
+                            "number (got %r)" % (name, self.name, value))
+
+    def _bytes_option(self, name, value):
+        """Convert the value of option ``name``, an amount of bytes.
+
+        Products of integers, such as ``768 * 1024 * 1024``, are accepted.
+
+        :raises: :class:`UserError` if it is not such an amount.
+        """
+        amount = 1
+        try:
+            for factor in option_strip(value).split('*'):
+                amount *= int(factor)
+        except ValueError:
+            raise UserError("Option %r of part %r must be an amount of "
+                            "bytes, such as 1024 * 1024 (got %r)" % (
+                                name, self.name, value))
+        return amount
+
     def _create_gunicorn_conf(self, qualified_name):
         """Put a gunicorn_PART.conf.py script in /etc.
 
@@ -119,6 +222,9 @@ class ServerRecipe(BaseRecipe):
                 self.options.get('options.xmlrpc_interface', '0.0.0.0'),
                 self.options.get('options.xmlrpc_port', '8069')
             ))
+        if self.options.get('gunicorn.limit_memory_soft'):
+            # memory based recycling supersedes the request count based one
+            gunicorn_options['max_requests'] = '0'
 
         gunicorn_prefix = 'gunicorn.'
         gunicorn_options.update((k[len(gunicorn_prefix):], v)
@@ -128,10 +234,17 @@ class ServerRecipe(BaseRecipe):
         gunicorn_options['server_wide_modules'] = list(
             self.server_wide_modules) if self.server_wide_modules else ['web']
 
+        if gunicorn_options['workers'].strip() == 'auto':
+            worker_memory = gunicorn_options.get('worker_memory', '').strip()
+            gunicorn_options['workers'] = 'gunicorn_conf.auto_workers(%s)' % (
+                self._bytes_option('gunicorn.worker_memory', worker_memory)
+                if worker_memory else '')
+
         f = open(join(self.etc, qualified_name + '.conf.py'), 'w')
         conf = """'''Gunicorn configuration script.
 Generated by buildout. Do NOT edit.'''
 import openerp
+from anybox.recipe.odoo.runtime import gunicorn_conf
 bind = %(bind)r
 pidfile = %(qualified_name)r + '.pid'
 workers = %(workers)s
@@ -160,27 +273,103 @@ conf = openerp.tools.config
 
             conf += 'conf[%r] = %r' % (opt, val) + os.linesep
 
+        hooks = {}  # hook name -> lines of code
         preload_dbs = option_splitlines(self.options.get(
             'gunicorn.preload_databases'))
-        if preload_dbs:
+        if preload_dbs and self.bool_opt_get('gunicorn.preload_in_master'):
+            # done once in the master process, workers inherit the
+            # registries at fork time
+            hooks['on_starting'] = [
+                "from openerp.modules.registry import RegistryManager",
+                "preload_dbs = %r" % (preload_dbs,),
+                "for db_name in preload_dbs:",
+                "    server.log.info('Master loading database %r',",
+                "                    db_name)",
+                "    RegistryManager.get(db_name)",
+                "# database connections must not be shared with workers",
+                "openerp.sql_db.close_all()",
+                "server.log.info('Odoo databases %r loaded in master',",
+                "                preload_dbs)",
+            ]
+            hooks['post_fork'] = [
+                "# forget about connections inherited from the master, if",
+                "# any: closing them would close them in the master as well",
+                "pool = openerp.sql_db._Pool",
+                "if pool is not None:",
+                "    pool._connections = []",
+            ]
+        elif preload_dbs:
+            hooks['post_fork'] = [
+                "from openerp.modules.registry import RegistryManager",
+                "preload_dbs = %r" % (preload_dbs,),
+                "for db_name in preload_dbs:",
+                "    server.log.info('Worker loading database %r',",
+                "                    db_name)",
+                "    RegistryManager.get(db_name)",
+                "server.log.info('Odoo databases %r loaded, '",
+                "                'worker ready '",
+                "                'to serve requests', preload_dbs)",
+            ]
+
+        slow_threshold = gunicorn_options.get('slow_request_threshold')
+        stats_target = gunicorn_options.get('request_stats_target')
+        if slow_threshold or stats_target:
             conf += os.linesep.join((
                 "",
-                "def post_fork(server, worker):",
-                "    '''Preload databases specified in buildout conf.'''",
-                "    from openerp.modules.registry import RegistryManager",
-                "    preload_dbs = %r" % (preload_dbs,),
-                "    for db_name in preload_dbs:",
-                "        server.log.info('Worker loading database %r',",
-                "                        db_name)",
-                "        RegistryManager.get(db_name)",
-                "    server.log.info('Odoo databases %r loaded, '",
-                "                    'worker ready '",
-                "                    'to serve requests', preload_dbs)",
-            ))
+                "request_stats = gunicorn_conf.RequestStats(",
+                "    slow_threshold=%r," % (
+                    self._float_option('gunicorn.slow_request_threshold',
+                                       slow_threshold)
+                    if slow_threshold else None),
+                "    target=%r," % (stats_target and stats_target.strip()),
+                "    interval=%r)" % self._float_option(
+                    'gunicorn.request_stats_interval',
+                    gunicorn_options.get('request_stats_interval', '60')),
+                ""))
+            hooks.setdefault('pre_request', []).append(
+                "request_stats.start(req)")
+            hooks.setdefault('post_request', []).append(
+                "request_stats.end(worker, req)")
+            hooks.setdefault('worker_exit', []).append(
+                "request_stats.flush(worker)")
+
+        limit_hard = gunicorn_options.get('limit_memory_hard', '').strip()
+        if limit_hard:
+            hooks.setdefault('post_fork', []).append(
+                "gunicorn_conf.set_memory_hard_limit(%d)" % (
+                    self._bytes_option('gunicorn.limit_memory_hard',
+                                       limit_hard)))
+        limit_soft = gunicorn_options.get('limit_memory_soft', '').strip()
+        if limit_soft:
+            hooks.setdefault('post_request', []).append(
+                "gunicorn_conf.recycle_if_memory_exceeded(worker, %d)" % (
+                    self._bytes_option('gunicorn.limit_memory_soft',
+                                       limit_soft)))
+
+        for hook, signature in GUNICORN_HOOKS:
+            if hook not in hooks:
+                continue
+            conf += os.linesep.join(
+                ["", "", "def %s(%s):" % (hook, signature)] +
+                ["    " + line for line in hooks[hook]] + [""])
 
         f.write(conf)
         f.close()
 
+    def _create_modules_index(self):
+        """Write the index of available modules in /etc.
+
+        Startup scripts use it to expand ``--install-all`` without
+        scanning all addons directories at each run.
+        """
+        self.modules_index_path = join(self.etc,
+                                       self.name + '.modules.json')
+        modules = modules_index.write_index(self.modules_index_path,
+                                            self.addons_paths)
+        logger.info("Indexed %d modules in %s", len(modules),
+                    os.path.relpath(self.modules_index_path,
+                                    self.buildout_dir))
+
     def _get_server_command(self):
         """Return a full path to the main Odoo server command."""
         return join(self.openerp_dir, 'openerp-server')
@@ -244,11 +433,13 @@ conf = openerp.tools.config
         desc = self._get_or_create_script('openerp_starter',
                                           name=qualified_name)[1]
 
-        arguments = '%r, %r, version=%r, gevent_script_path=%r' % (
-            self._get_server_command(),
-            self.config_path,
-            self.major_version,
-            self.gevent_script_path)
+        arguments = ('%r, %r, version=%r, gevent_script_path=%r, '
+                     'modules_index=%r' % (
+                         self._get_server_command(),
+                         self.config_path,
+                         self.major_version,
+                         self.gevent_script_path,
+                         self.modules_index_path))
 
         if self.server_wide_modules:
             arguments += ', server_wide_modules=%r' % (
@@ -283,6 +474,7 @@ conf = openerp.tools.config
             self.config_path,
             self.major_version)
         arguments += ', gevent_script_path=%r' % self.gevent_script_path
+        arguments += ', modules_index=%r' % self.modules_index_path
 
         desc.update(
             entry='openerp_starter',
@@ -367,11 +559,23 @@ conf = openerp.tools.config
     def _register_cron_worker_startup_script(self, qualified_name):
         """Register the cron worker script for installation.
 
-        This worker script has been introduced in openobject-server, rev 4184
+        For Odoo >= 8, this is the cron worker of the recipe (see
+        :mod:`.runtime.cron_worker`). Otherwise, it is ``openerp-cron-worker``.
+
+        The latter has been introduced in openobject-server, rev 4184
         together with changes in the main code that it requires.
         These changes appeared in nightly build 6.1-20120530-233414.
         The worker script itself does not appear in nightly builds.
         """
+        if self.major_version >= (8, 0):
+            desc = self._get_or_create_script('openerp_cron_pool',
+                                              name=qualified_name)[1]
+            desc.update(entry='openerp_cron_pool',
+                        arguments='%r' % self.config_path,
+                        initialization='',
+                        )
+            return
+
         script_src = join(self.openerp_dir, 'openerp-cron-worker')
         if not os.path.isfile(script_src):
             version = self.version_detected
@@ -431,21 +635,171 @@ conf = openerp.tools.config
             "        print(\"    session.env['res.users'].browse(1)\")"
             ""))
 
-        reqs, ws = self.eggs_reqs, self.eggs_ws
-        return zc.buildout.easy_install.scripts(
-            reqs, ws, sys.executable, self.options['bin-directory'],
-            scripts={},
-            interpreter=int_name,
-            initialization=initialization,
-            arguments=self.options.get('arguments', ''),
-            extra_paths=self.extra_paths,
-            # TODO investigate these options:
-            # relative_paths=self._relative_paths,
-        )
+        if not self.one_pass_scripts:
+            reqs, ws = self.eggs_reqs, self.eggs_ws
+            return zc.buildout.easy_install.scripts(
+                reqs, ws, sys.executable, self.options['bin-directory'],
+                scripts={},
+                interpreter=int_name,
+                initialization=initialization,
+                arguments=self.options.get('arguments', ''),
+                extra_paths=self.extra_paths,
+                # TODO investigate these options:
+                # relative_paths=self._relative_paths,
+            )
+
+        # TODO investigate relative paths
+        spath, rpsetup = self._scripts_path_setup()
+        return zc.buildout.easy_install._pyscript(
+            spath, join(self.options['bin-directory'], int_name), rpsetup,
+            initialization=self._script_initialization(initialization))
+
+    def _scripts_path_setup(self):
+        """Return the ``sys.path`` for generated scripts, rendered.
+
+        This is done once for all scripts, the same way as
+        :func:`zc.buildout.easy_install.scripts` would for each of them.
+        :returns: the rendered path and relative paths setup
+        """
+        if self.scripts_path_setup is None:
+            path = []
+            for p in [dist.location for dist in self.eggs_ws
+                      ] + self.extra_paths:
+                if p not in path:
+                    path.append(p)
+            path = [zc.buildout.easy_install.realpath(p) for p in path]
+            if self.bool_opt_get(CONSOLIDATED_SITE_OPTION):
+                path = self._consolidate_site(path)
+            if self.bool_opt_get(IMPORT_INDEX_OPTION):
+                self._create_import_index(path)
+            self.scripts_path_setup = (
+                zc.buildout.easy_install._relative_path_and_setup(
+                    self.bin_dir, path, False))
+        return self.scripts_path_setup
+
+    def _check_one_pass_scripts(self):
+        """Tell if scripts can be generated in one pass.
+
+        See :data:`ONE_PASS_SCRIPTS_HELPERS`. The options that change the
+        path of scripts need it.
+        """
+        missing = [name for name in ONE_PASS_SCRIPTS_HELPERS
+                   if not hasattr(zc.buildout.easy_install, name)]
+        if not missing:
+            return True
+        for option in (CONSOLIDATED_SITE_OPTION, IMPORT_INDEX_OPTION):
+            if self.bool_opt_get(option):
+                raise UserError(
+                    "The %r option is not supported with this version of "
+                    "zc.buildout (missing %s in zc.buildout.easy_install)" % (
+                        option, ', '.join(missing)))
+        logger.warn("zc.buildout.easy_install lacks %s, generating "
+                    "scripts one by one", ', '.join(missing))
+        return False
+
+    def _consolidate_site(self, path):
+        """Gather the contents of ``path`` in a single site directory.
+
+        See :func:`.utils.link_farm`. The site directory is built aside,
+        then renamed into place, so that running processes don't see it
+        partially populated.
+
+        :returns: the ``sys.path`` to use instead of ``path``
+        """
+        if sys.platform.startswith('win'):
+            raise UserError("The %r option relies on symbolic links, and "
+                            "is not available on Windows" % (
+                                CONSOLIDATED_SITE_OPTION))
+        # the site-packages of the interpreter are available anyway
+        import site
+        from distutils.sysconfig import get_python_lib
+        site_packages = [get_python_lib()]
+        site_packages.extend(getattr(site, 'getsitepackages', list)())
+        site_packages = set(os.path.realpath(p) for p in site_packages)
+
+        site_dir = join(self.parts, self.name + '-site')
+        if not os.path.isdir(self.parts):
+            os.makedirs(self.parts)
+        new_dir = tempfile.mkdtemp(prefix=self.name + '-site.new.',
+                                   dir=self.parts)
+        os.chmod(new_dir, 0755)
+        try:
+            remaining = link_farm(
+                new_dir, [p for p in path if p not in site_packages])
+        except:
+            shutil.rmtree(new_dir)
+            raise
+        # there's no atomic exchange of directories: the time it's missing
+        # is that of two renames, instead of a whole rebuild
+        old_dir = None
+        if os.path.exists(site_dir):
+            old_dir = tempfile.mkdtemp(prefix=self.name + '-site.old.',
+                                       dir=self.parts)
+            os.rename(site_dir, join(old_dir, 'site'))
+        os.rename(new_dir, site_dir)
+        if old_dir is not None:
+            shutil.rmtree(old_dir)
+        self.openerp_installed.append(site_dir)
+        return [site_dir] + remaining + [p for p in path
+                                         if p in site_packages]
+
+    def _create_import_index(self, path):
+        """Write the index of top-level modules of ``path`` in /etc.
+
+        Scripts use it to resolve imports without looking through
+        all ``sys.path`` entries (see :mod:`.runtime.import_index`).
+        """
+        self.import_index_path = join(self.etc, self.name + '.imports.json')
+        modules = import_index.write_index(self.import_index_path, path)
+        logger.info("Indexed %d top-level Python modules in %s",
+                    len(modules), os.path.relpath(self.import_index_path,
+                                                  self.buildout_dir))
+
+    def _console_scripts(self):
+        """Map names of all available console scripts to their entry points.
+
+        :returns: dict whose values are (module name, attributes) pairs.
+        """
+        import pkg_resources
+        entry_points = {}
+        for req in self.eggs_reqs:
+            if not isinstance(req, str):
+                entry_points[req[0]] = req[1:]
+                continue
+            dist = self.eggs_ws.find(pkg_resources.Requirement.parse(req))
+            for name, entry_point in pkg_resources.get_entry_map(
+                    dist, 'console_scripts').items():
+                entry_points[name] = (entry_point.module_name,
+                                      '.'.join(entry_point.attrs))
+        return entry_points
+
+    def _script_initialization(self, initialization):
+        """Surround initialization code the way zc.buildout does.
+
+        The finder of the imports index, if any, is installed first.
+        """
+        initialization = self._with_import_index(initialization)
+        if initialization:
+            return '\n' + initialization + '\n'
+        return initialization
+
+    def _with_import_index(self, initialization):
+        """Prepend the installation of the imports index finder."""
+        if self.import_index_path is None:
+            return initialization
+        return os.linesep.join((
+            "",
+            "from anybox.recipe.odoo.runtime import import_index",
+            "import_index.install(%r)" % self.import_index_path,
+            initialization))
 
     def _install_openerp_scripts(self):
         """Install scripts registered in self.openerp_scripts.
 
+        Console scripts are all rendered from the same ``sys.path`` and
+        entry points lookup (see :meth:`_scripts_path_setup` and
+        :meth:`_console_scripts`).
+
         If initialization string is not passed, one will be cooked for
           - session initialization
           - treatment of Odoo options specific to this script, as required
@@ -453,6 +807,11 @@ conf = openerp.tools.config
             add a database opening option to the provided script).
         """
         reqs, ws = self.eggs_reqs, self.eggs_ws
+        if self.one_pass_scripts:
+            entry_points = self._console_scripts()
+            spath, rpsetup = self._scripts_path_setup()
+        else:
+            entry_points = {}
 
         common_init = os.linesep.join((
             "",
@@ -476,21 +835,33 @@ conf = openerp.tools.config
                     initialization,
                     "session.handle_command_line_options(%r)" % options))
 
-            zc.buildout.easy_install.scripts(
-                reqs, ws, sys.executable, self.bin_dir,
-                scripts={desc['entry']: script_name},
-                interpreter='',
-                initialization=initialization,
-                arguments=desc.get('arguments', ''),
-                # TODO investigate these options:
-                extra_paths=self.extra_paths,
-                # relative_paths=self._relative_paths,
-            )
+            entry_point = entry_points.get(desc['entry'])
+            if entry_point is None:
+                # not a console script, such as distutils scripts, or
+                # no one-pass generation
+                zc.buildout.easy_install.scripts(
+                    reqs, ws, sys.executable, self.bin_dir,
+                    scripts={desc['entry']: script_name},
+                    interpreter='',
+                    initialization=self._with_import_index(initialization),
+                    arguments=desc.get('arguments', ''),
+                    # TODO investigate these options:
+                    extra_paths=self.extra_paths,
+                    # relative_paths=self._relative_paths,
+                )
+            else:
+                zc.buildout.easy_install._script(
+                    entry_point[0], entry_point[1], spath,
+                    join(self.bin_dir, script_name),
+                    desc.get('arguments', ''),
+                    self._script_initialization(initialization), rpsetup)
             self.openerp_installed.append(join(self.bin_dir, script_name))
 
     def _install_startup_scripts(self):
         """install startup and control scripts.
         """
+        self.scripts_path_setup = self.import_index_path = None
+        self.one_pass_scripts = self._check_one_pass_scripts()
         self._parse_openerp_scripts()
 
         # provide additional needed entry points for main start/test scripts
@@ -501,6 +872,9 @@ conf = openerp.tools.config
             ('openerp_cron_worker',
              'anybox.recipe.odoo.runtime.start_openerp',
              'main'),
+            ('openerp_cron_pool',
+             'anybox.recipe.odoo.runtime.cron_worker',
+             'main'),
             ('openerp-gevent',
              'openerp.cli',
              'main'),
@@ -510,6 +884,7 @@ conf = openerp.tools.config
         ))
 
         self._install_interpreter()
+        self._create_modules_index()
 
         main_script = self.options.get('script_name', 'start_' + self.name)
         gevent_script_name = self.options.get('gevent_script_name',
@@ -1,5 +1,7 @@
 import os
 import sys
+import json
+import shutil
 from copy import deepcopy
 
 from zc.buildout import UserError
@@ -301,12 +303,11 @@ class TestBaseRecipe(RecipeTestCase):
         self.assertEquals(self.recipe.addons_paths,
                           [base_addons, '/some/separate/addons', odoo_addons])
 
-    def make_recipe_appplying_requirements_file(self, reqs_content):
+    def make_recipe_appplying_requirements_file(self, reqs_content, **opts):
         """Prepare recipe object and requirements file
 
         :param reqs_content: if ``None`` the file is not created at all
         """
-        opts = {}
         opts[WITH_ODOO_REQUIREMENTS_FILE_OPTION] = 'true'
         self.make_recipe(
             version='git http://github.com/odoo/odoo.git odoo 7.0', **opts)
@@ -387,6 +388,47 @@ class TestBaseRecipe(RecipeTestCase):
             pre_versions={dist_name: '17.2'})
         self.assertEqual(versions.get(dist_name), '17.2')
 
+    def test_apply_requirements_file_wheelhouse(self):
+        """Unit test for Odoo requirements.txt: eggs from a wheelhouse
+        """
+        from ..wheelhouse import Wheelhouse
+        from .test_wheelhouse import make_wheel
+        house = Wheelhouse(os.path.join(self.buildout_dir, 'wheelhouse'))
+        wheel = make_wheel(house.path, name='someproject', version='1.2.3')
+        house.record_digest(os.path.basename(wheel))
+
+        self.make_recipe_appplying_requirements_file(
+            "someproject==1.2.3",
+            **{'requirements-wheelhouse': house.path})
+        self.apply_requirements_file()
+        eggs_dir = self.recipe.b_options['eggs-directory']
+        self.assertEqual(
+            os.listdir(eggs_dir),
+            ['someproject-1.2.3-py%d.%d.egg' % sys.version_info[:2]])
+
+        # already there: nothing to do, even if the wheel disappeared
+        os.remove(wheel)
+        self.apply_requirements_file()
+
+    def test_apply_requirements_file_wheelhouse_normalized(self):
+        """Unit test for Odoo requirements.txt: project names normalization
+        """
+        from ..wheelhouse import Wheelhouse
+        from .test_wheelhouse import make_wheel
+        house = Wheelhouse(os.path.join(self.buildout_dir, 'wheelhouse'))
+        wheel = make_wheel(house.path, name='some_project', version='1.2.3')
+        house.record_digest(os.path.basename(wheel))
+
+        self.make_recipe(version='8.0',
+                         **{'requirements-wheelhouse': house.path})
+        eggs_dir = self.recipe.b_options['eggs-directory']
+        self.recipe.install_from_wheelhouse({'some_project': '1.2.3'})
+        # the egg is found, though its key is 'some-project'
+        self.recipe.install_from_wheelhouse({'some_project': '1.2.3'})
+        self.assertEqual(
+            os.listdir(eggs_dir),
+            ['some_project-1.2.3-py%d.%d.egg' % sys.version_info[:2]])
+
     def test_list_develops(self):
         self.make_recipe(
             version='git http://github.com/odoo/odoo.git odoo 7.0')
@@ -415,3 +457,191 @@ class TestBaseRecipe(RecipeTestCase):
         """
         self.make_recipe_appplying_requirements_file("spam==1.2.3, >2.0")
         self.assertRaises(UserError, self.apply_requirements_file)
+
+    def make_installed_recipe(self, **options):
+        """Create a recipe and the record of a previous installation."""
+        options.setdefault('version', 'local server-dir')
+        options.setdefault(
+            'addons', 'pr_fakevcs http://some/where addons-dir fixed')
+        b_dir = self.buildout_dir
+        for name in ('server-dir', 'addons-dir'):
+            path = os.path.join(b_dir, name)
+            if not os.path.isdir(path):
+                os.mkdir(path)
+        self.make_recipe(**options)
+        script = os.path.join(b_dir, 'start_odoo')
+        for path in (script, self.recipe.config_path):
+            with open(path, 'w') as f:
+                f.write('content')
+        self.recipe.openerp_installed = [script]
+        self.recipe.write_inputs_record()
+        self.make_recipe(**options)
+        self.recipe.install = lambda: 'installed'
+
+    def test_update_skip_unchanged(self):
+        from ..testing import PersistentRevFakeRepo
+        PersistentRevFakeRepo.fixed_revs = ('fixed', )
+        self.buildout['buildout']['newest'] = 'false'
+        try:
+            self.make_installed_recipe()
+            self.assertEqual(self.recipe.update(),
+                             [os.path.join(self.buildout_dir, 'start_odoo')])
+
+            self.recipe.initial_options['options.workers'] = '2'
+            self.assertEqual(self.recipe.update(), 'installed')
+        finally:
+            del PersistentRevFakeRepo.fixed_revs
+
+    def test_update_skip_unchanged_blockers(self):
+        # tracking a branch
+        self.make_installed_recipe()
+        self.assertEqual(self.recipe.update(), 'installed')
+
+        # same, offline
+        self.buildout['buildout']['offline'] = 'true'
+        self.make_installed_recipe()
+        self.assertNotEqual(self.recipe.update(), 'installed')
+
+        # local modifications
+        with open(os.path.join(self.buildout_dir, 'addons-dir', 'x'),
+                  'w') as f:
+            f.write('modified')
+        self.assertEqual(self.recipe.update(), 'installed')
+
+    def test_update_skip_unchanged_unpinned(self):
+        from ..testing import PersistentRevFakeRepo
+        PersistentRevFakeRepo.fixed_revs = ('fixed', )
+        try:
+            # newest mode, eggs not known to be pinned
+            self.make_installed_recipe()
+            self.assertEqual(self.recipe.update(), 'installed')
+
+            with open(self.recipe.inputs_record_path) as record_file:
+                record = json.load(record_file)
+            record['pinned'] = True
+            with open(self.recipe.inputs_record_path, 'w') as record_file:
+                json.dump(record, record_file)
+            self.assertNotEqual(self.recipe.update(), 'installed')
+        finally:
+            del PersistentRevFakeRepo.fixed_revs
+
+    def test_update_skip_unchanged_svn(self):
+        self.buildout['buildout']['offline'] = 'true'
+        self.make_installed_recipe(
+            addons='svn http://some/where addons-dir 123')
+        self.assertEqual(self.recipe.update(), 'installed')
+
+    def test_update_skip_unchanged_requirements(self):
+        self.buildout['buildout']['offline'] = 'true'
+        self.make_installed_recipe()
+        self.recipe.openerp_dir = os.path.join(self.buildout_dir,
+                                               'server-dir')
+        self.recipe.write_inputs_record()
+        self.assertNotEqual(self.recipe.update(), 'installed')
+
+        with open(os.path.join(self.buildout_dir, 'server-dir',
+                               'requirements.txt'), 'w') as f:
+            f.write('Babel==1.3\n')
+        self.assertEqual(self.recipe.update(), 'installed')
+
+    def test_update_skip_unchanged_disabled(self):
+        self.buildout['buildout']['offline'] = 'true'
+        self.make_installed_recipe(**{'skip-unchanged': 'false'})
+        self.assertEqual(self.recipe.update(), 'installed')
+
+    def test_working_set_cache(self):
+        import zc.recipe.egg
+        self.buildout['buildout']['newest'] = 'false'
+        self.make_recipe(version='8.0')
+        self.fill_working_set(fictive=True)
+        self.assertTrue(os.path.exists(self.recipe.working_set_cache_path))
+
+        orig_working_set = zc.recipe.egg.Eggs.working_set
+
+        def working_set(eggs_recipe, extra=()):
+            self.fail("Requirements should not have been resolved again")
+
+        zc.recipe.egg.Eggs.working_set = working_set
+        try:
+            self.make_recipe(version='8.0')
+            self.recipe.options['eggs'] = self.fictive_dist_name
+            self.recipe.install_requirements()
+        finally:
+            zc.recipe.egg.Eggs.working_set = orig_working_set
+        self.assertEqual(self.recipe.eggs_reqs, [self.fictive_dist_name])
+        self.assertEqual(self.recipe.ws.by_key[self.fictive_name].version,
+                         self.fictive_version)
+
+    def test_working_set_cache_invalidation(self):
+        self.buildout['buildout']['newest'] = 'false'
+        self.make_recipe(version='8.0')
+        self.fill_working_set(fictive=True)
+        key = self.recipe.working_set_cache_key()
+        self.assertIsNotNone(self.recipe.read_working_set_cache(key))
+
+        # unpinned distributions may have newer versions
+        self.buildout['buildout']['newest'] = 'true'
+        self.assertIsNone(self.recipe.read_working_set_cache(key))
+        self.buildout['buildout']['newest'] = 'false'
+
+        # requirements changed
+        self.recipe.options['eggs'] += '\nBabel'
+        self.assertNotEqual(self.recipe.working_set_cache_key(), key)
+
+        # distribution removed
+        egg = self.recipe.ws.by_key[self.fictive_name]
+        os.remove(egg.location)
+        self.assertIsNone(self.recipe.read_working_set_cache(key))
+
+    def test_working_set_cache_develop_requires(self):
+        self.buildout['buildout']['newest'] = 'false'
+        self.make_recipe(version='8.0')
+        src = os.path.join(self.buildout_dir, 'fictive_dist')
+        shutil.copytree(os.path.join(TEST_DIR, 'fictive_dist'), src)
+        self.silence_buildout_develop()
+        self.recipe.develop(src)
+        self.recipe.options['eggs'] = self.fictive_dist_name
+        self.recipe.install_requirements()
+        key = self.recipe.working_set_cache_key()
+        self.assertIsNotNone(self.recipe.read_working_set_cache(key))
+
+        # the develop egg gets a new dependency
+        egg_info = [d for d in os.listdir(src) if d.endswith('.egg-info')][0]
+        with open(os.path.join(src, egg_info, 'requires.txt'), 'w') as f:
+            f.write('Babel\n')
+        key = self.recipe.working_set_cache_key()
+        self.assertIsNone(self.recipe.read_working_set_cache(key))
+
+    def test_develop_unchanged(self):
+        import zc.buildout.easy_install
+        self.make_recipe(version='8.0')
+        src = os.path.join(self.buildout_dir, 'fictive_dist')
+        shutil.copytree(os.path.join(TEST_DIR, 'fictive_dist'), src)
+        self.silence_buildout_develop()
+        name = self.recipe.develop(src)
+
+        orig_develop = zc.buildout.easy_install.develop
+        developed = []
+
+        def develop(setup, dest, **kw):
+            developed.append(setup)
+            return orig_develop(setup, dest, **kw)
+
+        zc.buildout.easy_install.develop = develop
+        try:
+            skipped_name = self.recipe.develop(src)
+            self.assertEqual(skipped_name, name)
+            self.assertTrue(isinstance(skipped_name, str))
+            self.assertEqual(developed, [])
+
+            with open(os.path.join(src, 'setup.py'), 'a') as setup:
+                setup.write('\n# modified\n')
+            self.assertEqual(self.recipe.develop(src), name)
+            self.assertEqual(developed, [src])
+
+            os.remove(os.path.join(self.recipe.b_options[
+                'develop-eggs-directory'], name + '.egg-link'))
+            self.assertEqual(self.recipe.develop(src), name)
+            self.assertEqual(developed, [src, src])
+        finally:
+            zc.buildout.easy_install.develop = orig_develop
@@ -0,0 +1,70 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from zc.buildout import UserError
+from ..requirements import parse_requirements
+
+
+class RequirementsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp('test_requirements')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write(self, content, name='requirements.txt'):
+        path = os.path.join(self.tmp_dir, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def parse(self, content):
+        return [(r.project_name, r.specs)
+                for r in parse_requirements(self.write(content))]
+
+    def test_specifiers(self):
+        self.assertEqual(self.parse("Babel==1.3\n"
+                                    "# some comment\n"
+                                    "\n"
+                                    "lxml>=3.4 # inline comment\n"
+                                    "psycopg2\n"),
+                         [('Babel', [('==', '1.3')]),
+                          ('lxml', [('>=', '3.4')]),
+                          ('psycopg2', [])])
+
+    def test_markers(self):
+        self.assertEqual(
+            self.parse("pypiwin32 ; sys_platform == 'win32'\n"
+                       "pyserial==3.1 ; sys_platform != 'win32'\n"),
+            [('pyserial', [('==', '3.1')])])
+
+    def test_include(self):
+        self.write("pyusb==1.0.0\n", name='other.txt')
+        self.assertEqual(self.parse("-r other.txt\n"
+                                    "--index-url https://pypi.example\n"
+                                    "reportlab==3.1.44\n"),
+                         [('pyusb', [('==', '1.0.0')]),
+                          ('reportlab', [('==', '3.1.44')])])
+
+    def test_include_modified(self):
+        other = self.write("pyusb==1.0.0\n", name='other.txt')
+        self.parse("-r other.txt\n")
+        os.utime(other, (0, 0))  # mtime is what tells about modifications
+        self.write("pyusb==1.0.1\n", name='other.txt')
+        self.assertEqual(self.parse("-r other.txt\n"),
+                         [('pyusb', [('==', '1.0.1')])])
+
+    def test_editable(self):
+        self.assertEqual(
+            self.parse("-e git+https://example.com/foo.git@8.0#egg=foo\n"),
+            [('foo', [])])
+
+    def test_unsupported(self):
+        for content in ("-e git+https://example.com/foo.git\n",
+                        "https://example.com/foo.tar.gz\n",
+                        "--some-option\n",
+                        "foo=1.0\n"):
+            self.assertRaises(UserError, self.parse, content)
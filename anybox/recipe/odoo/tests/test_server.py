@@ -4,11 +4,16 @@ NB: zc.buildout.testing provides utilities for integration tests, with
 an embedded http server, etc.
 """
 import os
+import ast
+import json
 from pkg_resources import Requirement
 
 from ..base import MissingDistribution
 from ..base import IncompatibleConstraintError
+from ..base import missing_project_name
 from zc.buildout import UserError
+from zc.buildout.easy_install import Installer
+from zc.buildout.easy_install import _constrained_requirement
 from ..server import ServerRecipe
 from ..testing import get_vcs_log
 from ..testing import RecipeTestCase
@@ -339,6 +344,24 @@ class TestServer(RecipeTestCase):
     def test_install_scripts_soft_deps_missing_dist(self):
         self.do_test_install_scripts_soft_deps()
 
+    def test_install_scripts_soft_deps_single_pass(self):
+        """Unavailable soft requirements are left out before installing."""
+        import zc.recipe.egg
+        orig_install = zc.recipe.egg.Scripts.install
+        installed_eggs = []
+
+        def install(eggs_recipe):
+            installed_eggs.append(eggs_recipe.options['eggs'].split())
+            return orig_install(eggs_recipe)
+
+        zc.recipe.egg.Scripts.install = install
+        try:
+            self.do_test_install_scripts_soft_deps()
+        finally:
+            zc.recipe.egg.Scripts.install = orig_install
+        self.assertEqual(len(installed_eggs), 1)
+        self.assertFalse('zztest-softreq' in installed_eggs[0])
+
     def test_install_scripts_soft_deps_missing_dist_exc(self):
         req = Requirement.parse("zztest-softreq")
         self.do_test_install_scripts_soft_deps(
@@ -359,6 +382,31 @@ class TestServer(RecipeTestCase):
         else:
             self.fail("Exception should have been reraised")
 
+    def test_discard_soft_deps_incompatible_constraint(self):
+        self.make_recipe(version='local %s' % os.path.join(TEST_DIR, 'odoo80'),
+                         eggs='zztest-softreq>2\nzztest-other')
+        self.recipe.soft_requirements = ('zztest-softreq', )
+        orig_versions = Installer._versions
+        Installer._versions = {'zztest-softreq': '1.0'}
+        try:
+            self.assertEqual(
+                self.recipe.discard_unavailable_soft_requirements(),
+                ['zztest-softreq>2'])
+        finally:
+            Installer._versions = orig_versions
+        self.assertEqual(self.recipe.options['eggs'], 'zztest-other')
+
+    def test_missing_project_name_incompatible_constraint(self):
+        req = Requirement.parse("zztest-softreq>2")
+        try:
+            _constrained_requirement('1.0', req)
+        except IncompatibleConstraintError as exc:
+            self.assertEqual(missing_project_name(exc), 'zztest-softreq')
+        else:
+            self.fail("Expected IncompatibleConstraintError")
+        self.assertIsNone(missing_project_name(
+            IncompatibleConstraintError('Unexpected message')))
+
     def test_install_scripts_soft_deps_user_error(self):
         self.do_test_install_scripts_soft_deps(
             exc=UserError("We don't have a distribution for "
@@ -394,10 +442,24 @@ class TestServer(RecipeTestCase):
         if with_devtools:
             expected.append('test_openerp')
         self.assertScripts(expected)
+        self.assertTrue('anybox.recipe.odoo.runtime.cron_worker.main(' in
+                        self.read_script('cron_worker_openerp'))
 
     def test_install_scripts_80_no_devtools(self):
         self.test_install_scripts_80(with_devtools=False)
 
+    def test_install_scripts_modules_index(self):
+        self.make_recipe(version='local %s' % os.path.join(TEST_DIR, 'odoo80'))
+        self.recipe.version_detected = "8.0alpha"
+        self.recipe.addons_paths = [os.path.join(TEST_DIR, 'odoo80')]
+
+        self.install_scripts()
+
+        index_path = os.path.join(self.recipe.etc, 'openerp.modules.json')
+        self.assertTrue(os.path.exists(index_path))
+        self.assertTrue("modules_index=%r" % index_path
+                        in self.read_script('start_openerp'))
+
     def test_gunicorn_preload_databases(self, databases='onedb',
                                         expected="('onedb',)"):
         self.make_recipe(version='local %s' % os.path.join(TEST_DIR, 'odoo80'),
@@ -421,6 +483,120 @@ class TestServer(RecipeTestCase):
         self.test_gunicorn_preload_databases(databases='db1\ndb2',
                                              expected="('db1', 'db2')")
 
+    def test_gunicorn_preload_in_master(self):
+        code, tree = self.read_gunicorn_conf(preload_databases='db1\ndb2',
+                                             preload_in_master='true')
+        self.assertTrue("preload_dbs = ('db1', 'db2')" in code)
+        hooks = set(node.name for node in tree.body
+                    if isinstance(node, ast.FunctionDef))
+        self.assertEqual(hooks, set(['on_starting', 'post_fork']))
+
+    def read_gunicorn_conf(self, **options):
+        """Install scripts with the given Gunicorn options and parse conf.
+
+        :returns: the configuration source and its syntax tree (executing
+                  the configuration would need Odoo)
+        """
+        self.make_recipe(version='local %s' % os.path.join(TEST_DIR, 'odoo80'),
+                         gunicorn='direct')
+        self.recipe.version_detected = "8.0"
+        for opt, val in options.items():
+            self.recipe.options['gunicorn.' + opt] = val
+
+        self.install_scripts()
+
+        gunicorn_conf = os.path.join(self.recipe.etc,
+                                     'gunicorn_openerp.conf.py')
+        with open(gunicorn_conf) as conf:
+            code = conf.read()
+        return code, ast.parse(code)
+
+    def test_gunicorn_auto_workers_memory_limits(self):
+        code, tree = self.read_gunicorn_conf(
+            workers='auto',
+            worker_memory='1024 * 1024 * 1024',
+            limit_memory_soft='1536 * 1024 * 1024',
+            limit_memory_hard='2 * 1024 * 1024 * 1024')
+        assigned = dict((node.targets[0].id, node.value) for node in tree.body
+                        if isinstance(node, ast.Assign) and
+                        isinstance(node.targets[0], ast.Name))
+        self.assertTrue(isinstance(assigned['workers'], ast.Call))
+        self.assertTrue(
+            "workers = gunicorn_conf.auto_workers(1073741824)" in code)
+        # request count based recycling is disabled
+        self.assertEqual(assigned['max_requests'].n, 0)
+        hooks = dict((node.name, node) for node in tree.body
+                     if isinstance(node, ast.FunctionDef))
+        self.assertEqual(set(hooks), set(['post_fork', 'post_request']))
+        self.assertEqual([arg.id for arg in hooks['post_request'].args.args],
+                         ['worker', 'req', 'environ', 'resp'])
+        self.assertTrue("gunicorn_conf.recycle_if_memory_exceeded("
+                        "worker, 1610612736)" in code)
+        self.assertTrue("gunicorn_conf.set_memory_hard_limit("
+                        "2147483648)" in code)
+
+    def test_gunicorn_memory_limits_invalid(self):
+        try:
+            self.read_gunicorn_conf(limit_memory_soft='1.5G')
+        except UserError, exc:
+            self.assertTrue("'gunicorn.limit_memory_soft'" in str(exc))
+        else:
+            self.fail("Expected UserError")
+
+    def test_gunicorn_request_stats(self):
+        code, tree = self.read_gunicorn_conf(
+            slow_request_threshold='0.5',
+            request_stats_target='udp://localhost:8125',
+            limit_memory_soft='1024')
+        self.assertTrue("slow_threshold=0.5," in code)
+        self.assertTrue("target='udp://localhost:8125'," in code)
+        self.assertTrue("interval=60.0)" in code)
+        hooks = dict((node.name, node) for node in tree.body
+                     if isinstance(node, ast.FunctionDef))
+        self.assertEqual(set(hooks),
+                         set(['pre_request', 'post_request', 'worker_exit']))
+        # statistics are recorded before the worker gets recycled
+        self.assertEqual(len(hooks['post_request'].body), 2)
+        self.assertTrue(code.index("request_stats.end(") <
+                        code.index("recycle_if_memory_exceeded("))
+
+    def test_gunicorn_request_stats_invalid(self):
+        try:
+            self.read_gunicorn_conf(slow_request_threshold='2s')
+        except UserError, exc:
+            self.assertTrue("'gunicorn.slow_request_threshold'" in str(exc))
+        else:
+            self.fail("Expected UserError")
+
+    def test_gunicorn_default_workers(self):
+        code, tree = self.read_gunicorn_conf()
+        self.assertTrue("workers = 4" in code)
+        self.assertTrue("max_requests = 2000" in code)
+
+    def test_prefork_sizing(self):
+        options = {'options.workers': 'auto',
+                   'options.limit_time_real': '300',
+                   'workers.cpus': '4',
+                   'workers.memory': str(16 * 1024 ** 3),
+                   'workers.concurrency': '30'}
+        self.make_recipe(version='8.0', **options)
+        opts = self.recipe.options
+        self.assertEqual(opts['options.workers'], '5')
+        self.assertEqual(opts['options.max_cron_threads'], '2')
+        self.assertEqual(opts['options.limit_memory_soft'],
+                         str(16 * 1024 ** 3 // 7))
+        self.assertEqual(opts['options.limit_time_cpu'], '60')
+        # explicit value is kept
+        self.assertEqual(opts['options.limit_time_real'], '300')
+
+    def test_prefork_sizing_wrong_option(self):
+        self.assertRaises(UserError, self.make_recipe, version='8.0',
+                          **{'options.workers': 'auto',
+                             'workers.concurency': '30'})
+        self.assertRaises(UserError, self.make_recipe, version='8.0',
+                          **{'options.workers': 'auto',
+                             'workers.concurrency': 'many'})
+
     def test_install_scripts_80_server_wide_modules(self):
         self.make_recipe(version='local %s' % os.path.join(TEST_DIR, 'odoo80'),
                          gunicorn='direct',
@@ -450,6 +626,127 @@ class TestServer(RecipeTestCase):
                             'cron_worker_openerp',
                             ))
 
+    def test_install_scripts_batched(self):
+        """Console scripts are rendered without zc.buildout's scripts().
+
+        In particular, they all get the same path.
+        """
+        import zc.buildout.easy_install
+        self.make_recipe(version='local %s' % os.path.join(TEST_DIR, 'odoo80'),
+                         gunicorn='direct',
+                         openerp_scripts='openerp_starter=my_start '
+                         'command-line-options=-d')
+        self.recipe.version_detected = "8.0alpha"
+
+        orig_scripts = zc.buildout.easy_install.scripts
+        calls = []
+
+        def scripts(*args, **kwargs):
+            calls.append(kwargs.get('scripts'))
+            return orig_scripts(*args, **kwargs)
+
+        zc.buildout.easy_install.scripts = scripts
+        try:
+            self.install_scripts()
+        finally:
+            zc.buildout.easy_install.scripts = orig_scripts
+
+        self.assertEqual(calls, [])
+        names = ('my_start', 'gunicorn_openerp', 'cron_worker_openerp',
+                 'upgrade_openerp', 'python_openerp')
+        self.assertScripts(names)
+        paths = set(self.read_script(name).split('sys.path[0:0] = [')[1]
+                    .split(']')[0] for name in names)
+        self.assertEqual(len(paths), 1)
+        self.assertTrue("session.handle_command_line_options(['-d'])" in
+                        self.read_script('my_start'))
+
+    def test_install_scripts_one_pass_unsupported(self):
+        """Without zc.buildout helpers, scripts are generated by scripts()."""
+        from anybox.recipe.odoo import server
+        import zc.buildout.easy_install
+        self.make_recipe(version='local %s' % os.path.join(TEST_DIR, 'odoo80'),
+                         gunicorn='direct')
+        self.recipe.version_detected = "8.0alpha"
+
+        orig_scripts = zc.buildout.easy_install.scripts
+        orig_helpers = server.ONE_PASS_SCRIPTS_HELPERS
+        calls = []
+
+        def scripts(*args, **kwargs):
+            calls.append(kwargs.get('scripts'))
+            return orig_scripts(*args, **kwargs)
+
+        zc.buildout.easy_install.scripts = scripts
+        server.ONE_PASS_SCRIPTS_HELPERS = orig_helpers + ('_not_there', )
+        try:
+            self.install_scripts()
+        finally:
+            zc.buildout.easy_install.scripts = orig_scripts
+            server.ONE_PASS_SCRIPTS_HELPERS = orig_helpers
+
+        # one call per script, and one for the interpreter
+        self.assertEqual(len(calls), len(self.recipe.openerp_scripts) + 1)
+        self.assertScripts(('start_openerp', 'gunicorn_openerp',
+                            'cron_worker_openerp', 'upgrade_openerp',
+                            'python_openerp'))
+
+        self.make_recipe(version='local %s' % os.path.join(TEST_DIR, 'odoo80'),
+                         **{'import-index': 'true'})
+        self.recipe.version_detected = "8.0alpha"
+        server.ONE_PASS_SCRIPTS_HELPERS = orig_helpers + ('_not_there', )
+        try:
+            self.assertRaises(UserError, self.recipe._check_one_pass_scripts)
+        finally:
+            server.ONE_PASS_SCRIPTS_HELPERS = orig_helpers
+
+    def test_install_scripts_consolidated_site(self):
+        self.make_recipe(version='local %s' % os.path.join(TEST_DIR, 'odoo80'),
+                         gunicorn='direct',
+                         **{'consolidated-site': 'true'})
+        self.recipe.version_detected = "8.0alpha"
+        self.install_scripts()
+
+        site_dir = os.path.join(self.recipe.parts, 'openerp-site')
+        self.assertTrue(site_dir in self.recipe.openerp_installed)
+        self.assertTrue(os.path.islink(os.path.join(site_dir, 'gunicorn')))
+        self.assertTrue(os.path.islink(os.path.join(site_dir,
+                                                    'gunicorn.egg-info')))
+        path = self.read_script('start_openerp').split(
+            'sys.path[0:0] = [')[1].split(']')[0]
+        self.assertEqual(path.split()[0], repr(site_dir) + ',')
+        self.assertFalse(os.path.join(TEST_DIR, 'fake_gunicorn') in path)
+        self.assertFalse(os.path.exists(os.path.join(site_dir, 'setup.py')))
+
+        # rebuilt aside and renamed into place
+        self.recipe.scripts_path_setup = None
+        self.recipe._scripts_path_setup()
+        self.assertTrue(os.path.islink(os.path.join(site_dir, 'gunicorn')))
+        self.assertEqual([d for d in os.listdir(self.recipe.parts)
+                          if d.startswith('openerp-site')], ['openerp-site'])
+
+    def test_install_scripts_import_index(self):
+        self.make_recipe(version='local %s' % os.path.join(TEST_DIR, 'odoo80'),
+                         gunicorn='direct',
+                         **{'import-index': 'true'})
+        self.recipe.version_detected = "8.0alpha"
+        self.install_scripts()
+
+        index_path = os.path.join(self.recipe.etc, 'openerp.imports.json')
+        with open(index_path) as index_file:
+            modules = json.load(index_file)['modules']
+        self.assertEqual(modules['gunicorn'],
+                         os.path.realpath(
+                             os.path.join(TEST_DIR, 'fake_gunicorn')))
+        install_line = "import_index.install(%r)" % index_path
+        for name in ('start_openerp', 'upgrade_openerp', 'python_openerp',
+                     'gunicorn_openerp'):
+            self.assertTrue(install_line in self.read_script(name))
+        script = self.read_script('start_openerp')
+        self.assertTrue(script.index(install_line) <
+                        script.index('import anybox.recipe.odoo.runtime'
+                                     '.start_openerp'))
+
     def test_parse_openerp_scripts(self):
         self.make_recipe(
             version='local %s' % os.path.join(TEST_DIR, 'odoo80'),
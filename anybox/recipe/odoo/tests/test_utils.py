@@ -5,6 +5,7 @@ import os
 from datetime import timedelta
 
 from ..utils import working_directory_keeper, total_seconds
+from ..utils import link_farm
 
 
 class WorkingDirectoryTestCase(unittest.TestCase):
@@ -32,3 +33,64 @@ class VariousTestCase(unittest.TestCase):
         self.assertEqual(total_seconds(timedelta(1, 2)), 86402.0)
         self.assertEqual(total_seconds(timedelta(0, -3)), -3.0)
         self.assertEqual(total_seconds(timedelta(0, 12, 35000)), 12.035)
+
+
+class LinkFarmTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dirpath = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dirpath)
+
+    def make_files(self, *paths):
+        for path in paths:
+            path = os.path.join(self.dirpath, path)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, 'w') as f:
+                f.write(path)
+
+    def test_link_farm(self):
+        self.make_files('ns1.egg/ns/__init__.py',
+                        'ns1.egg/ns/one/__init__.py',
+                        'ns1.egg/EGG-INFO/PKG-INFO',
+                        'ns1.egg/mod.py',
+                        'ns2/ns/__init__.py',
+                        'ns2/ns/two/__init__.py',
+                        'ns2/mod.py',
+                        'zipped.egg')
+        site = os.path.join(self.dirpath, 'site')
+        os.mkdir(site)
+        locations = [os.path.join(self.dirpath, p)
+                     for p in ('ns1.egg', 'zipped.egg', 'ns2', 'missing')]
+        self.assertEqual(link_farm(site, locations), locations[1:2] + [
+            locations[3]])
+
+        self.assertEqual(sorted(os.listdir(site)),
+                         ['mod.py', 'ns', 'ns1.egg-info'])
+        # earlier locations take precedence
+        self.assertEqual(os.readlink(os.path.join(site, 'mod.py')),
+                         os.path.join(self.dirpath, 'ns1.egg', 'mod.py'))
+        # namespace packages are merged
+        self.assertFalse(os.path.islink(os.path.join(site, 'ns')))
+        self.assertEqual(sorted(os.listdir(os.path.join(site, 'ns'))),
+                         ['__init__.py', 'one', 'two'])
+        self.assertEqual(os.readlink(os.path.join(site, 'ns1.egg-info')),
+                         os.path.join(self.dirpath, 'ns1.egg', 'EGG-INFO'))
+
+    def test_link_farm_declared(self):
+        self.make_files('src/setup.py',
+                        'src/tests/test_foo.py',
+                        'src/foo/__init__.py',
+                        'src/bar.py',
+                        'src/bar.pyc',
+                        'src/foo.egg-info/top_level.txt')
+        with open(os.path.join(self.dirpath, 'src', 'foo.egg-info',
+                               'top_level.txt'), 'w') as f:
+            f.write('foo\nbar\n')
+        site = os.path.join(self.dirpath, 'site')
+        os.mkdir(site)
+        link_farm(site, [os.path.join(self.dirpath, 'src')])
+        self.assertEqual(sorted(os.listdir(site)),
+                         ['bar.py', 'bar.pyc', 'foo', 'foo.egg-info'])
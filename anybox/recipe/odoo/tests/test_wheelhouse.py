@@ -0,0 +1,122 @@
+import os
+import shutil
+import zipfile
+import tempfile
+import unittest
+
+from zc.buildout import UserError
+from .. import wheelhouse
+from ..wheelhouse import Wheelhouse
+
+
+def make_wheel(directory, name='fictive_wh', version='1.2'):
+    """Create a minimal pure Python wheel in directory, return its path."""
+    path = os.path.join(directory,
+                        '%s-%s-py2.py3-none-any.whl' % (name, version))
+    dist_info = '%s-%s.dist-info/' % (name, version)
+    with zipfile.ZipFile(path, 'w') as zf:
+        zf.writestr(name + '.py', 'VALUE = 1\n')
+        zf.writestr(dist_info + 'METADATA',
+                    'Metadata-Version: 2.0\nName: %s\nVersion: %s\n' % (
+                        name, version))
+        zf.writestr(dist_info + 'WHEEL',
+                    'Wheel-Version: 1.0\nRoot-Is-Purelib: true\n'
+                    'Tag: py2-none-any\nTag: py3-none-any\n')
+        zf.writestr(dist_info + 'RECORD', '')
+    return path
+
+
+class WheelhouseTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp('test_wheelhouse')
+        self.house = Wheelhouse(os.path.join(self.tmp_dir, 'wheelhouse'))
+        self.eggs_dir = os.path.join(self.tmp_dir, 'eggs')
+        os.mkdir(self.eggs_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_find(self):
+        fname = os.path.basename(make_wheel(self.house.path))
+        # not recorded: not trusted
+        self.assertIsNone(self.house.find('fictive-wh', '1.2'))
+
+        self.house.record_digest(fname)
+        self.assertEqual(self.house.find('fictive-wh', '1.2'),
+                         os.path.join(self.house.path, fname))
+        self.assertIsNone(self.house.find('fictive-wh', '1.3'))
+
+    def test_install_as_egg(self):
+        path = make_wheel(self.house.path)
+        self.house.record_digest(os.path.basename(path))
+        egg_path = self.house.install_as_egg(path, self.eggs_dir)
+        self.assertEqual(os.listdir(self.eggs_dir),
+                         [os.path.basename(egg_path)])
+        # already there
+        self.assertEqual(self.house.install_as_egg(path, self.eggs_dir),
+                         egg_path)
+
+        import pkg_resources
+        env = pkg_resources.Environment([self.eggs_dir])
+        dists = env['fictive-wh']
+        self.assertEqual(len(dists), 1)
+        self.assertEqual(dists[0].version, '1.2')
+
+    def test_install_as_egg_tampered(self):
+        path = make_wheel(self.house.path)
+        self.house.record_digest(os.path.basename(path))
+        with open(path, 'ab') as f:
+            f.write('tampered')
+        self.assertRaises(UserError,
+                          self.house.install_as_egg, path, self.eggs_dir)
+        self.assertEqual(os.listdir(self.eggs_dir), [])
+
+    def test_build(self):
+        calls = []
+
+        def call(cmd, env=None):
+            calls.append((cmd, env))
+            make_wheel(cmd[cmd.index('--wheel-dir') + 1])
+            return 0
+
+        orig_call = wheelhouse.subprocess.call
+        wheelhouse.subprocess.call = call
+        try:
+            path = self.house.build('fictive_wh', '1.2',
+                                    find_links=['/some/links'],
+                                    pythonpath=['/pip/egg', '/wheel/egg'])
+        finally:
+            wheelhouse.subprocess.call = orig_call
+
+        cmd, env = calls[0]
+        self.assertEqual(cmd[-3:],
+                         ['--find-links', '/some/links', 'fictive_wh==1.2'])
+        self.assertEqual(env['PYTHONPATH'],
+                         os.pathsep.join(('/pip/egg', '/wheel/egg')))
+        self.assertEqual(sorted(os.listdir(self.house.path)),
+                         [wheelhouse.MANIFEST, os.path.basename(path)])
+        self.assertEqual(self.house.find('fictive_wh', '1.2'), path)
+        self.house.verify(path)
+
+    def test_build_failure(self):
+        orig_call = wheelhouse.subprocess.call
+        wheelhouse.subprocess.call = lambda cmd, env=None: 1
+        try:
+            self.assertRaises(UserError, self.house.build, 'foo', '1.0')
+        finally:
+            wheelhouse.subprocess.call = orig_call
+        self.assertEqual(os.listdir(self.house.path), [])
+
+    def test_build_no_wheel(self):
+        orig_call = wheelhouse.subprocess.call
+        wheelhouse.subprocess.call = lambda cmd, env=None: 0
+        try:
+            self.house.build('foo', '1.0')
+        except UserError, exc:
+            self.assertTrue('foo==1.0' in str(exc))
+        else:
+            self.fail("Expected UserError")
+        finally:
+            wheelhouse.subprocess.call = orig_call
+        self.assertEqual(os.listdir(self.house.path), [])
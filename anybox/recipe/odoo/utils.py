@@ -1,9 +1,7 @@
 import os
 import sys
 import re
-import subprocess
 from contextlib import contextmanager
-from ConfigParser import DuplicateSectionError
 import logging
 logger = logging.getLogger(__name__)
 
@@ -122,6 +120,82 @@ def clean_object_files(directory):
                              "Proceeding anyway.", p)
 
 
+def link_farm(target, locations):
+    """Populate a directory with symbolic links to the contents of others.
+
+    This is meant to replace a long ``sys.path`` by a single directory.
+    As in ``sys.path``, entries of earlier locations take precedence, but
+    directories that appear in several locations (namespace packages)
+    are merged recursively. The ``EGG-INFO`` metadata directory of an egg
+    is linked as ``<egg name>.egg-info``, so that ``pkg_resources`` still
+    finds the distribution. Of source directories (develop eggs), only
+    what their metadata declare is linked (see :func:`declared_entries`).
+
+    :param target: an existing, empty directory
+    :param locations: paths, typically of eggs and source directories
+    :returns: those of the ``locations`` that can't be merged, because they
+              aren't directories (zipped eggs) or don't exist.
+    """
+    remaining = []
+    for location in locations:
+        if not os.path.isdir(location):
+            remaining.append(location)
+            continue
+        _link_entries(target, location, declared_entries(location))
+    return remaining
+
+
+def declared_entries(src_dir):
+    """Tell which top-level entries of a source directory are importable.
+
+    These are the egg-info directories, and the packages and modules
+    listed in their ``top_level.txt`` files, leaving out ``setup.py``,
+    tests, documentation etc.
+
+    :returns: a predicate on entry names, or ``None`` if ``src_dir`` is an
+              egg, or has no such metadata.
+    """
+    if src_dir.endswith('.egg'):
+        return None
+    egg_infos = set(name for name in os.listdir(src_dir)
+                    if name.endswith('.egg-info'))
+    top_level = set()
+    found = False
+    for egg_info in egg_infos:
+        path = os.path.join(src_dir, egg_info, 'top_level.txt')
+        if os.path.isfile(path):
+            found = True
+            with open(path) as top_level_file:
+                top_level.update(line.strip() for line in top_level_file
+                                 if line.strip())
+    if not found:
+        return None
+    return lambda name: (name in egg_infos or
+                         name.split('.', 1)[0] in top_level)
+
+
+def _link_entries(target, src_dir, declared=None):
+    for name in sorted(os.listdir(src_dir)):
+        if declared is not None and not declared(name):
+            continue
+        src = os.path.join(src_dir, name)
+        if name == 'EGG-INFO' and src_dir.endswith('.egg'):
+            name = os.path.basename(src_dir)[:-4] + '.egg-info'
+        dst = os.path.join(target, name)
+        if os.path.islink(dst):
+            existing = os.readlink(dst)
+            if os.path.isdir(existing) and os.path.isdir(src):
+                os.remove(dst)
+                os.mkdir(dst)
+                _link_entries(dst, existing)
+                _link_entries(dst, src)
+        elif os.path.isdir(dst):  # already merged
+            if os.path.isdir(src):
+                _link_entries(dst, src)
+        else:
+            os.symlink(src, dst)
+
+
 def check_output(*popenargs, **kwargs):
     r"""Backport of subprocess.check_output from python 2.7.
 
@@ -135,6 +209,7 @@ def check_output(*popenargs, **kwargs):
     The stdout argument is not allowed as it is used internally.
     To capture standard error in the result, use stderr=STDOUT.
 
+    >>> import subprocess
     >>> os.environ['LC_ALL'] = 'C'  # for uniformity of error msg
     >>> err = check_output(["/bin/sh", "-c",
     ...               "ls -l non_existent_file ; exit 0"],
@@ -142,7 +217,8 @@ def check_output(*popenargs, **kwargs):
     >>> err.strip().endswith("No such file or directory")
     True
     """
-
+    # imported here, as the runtime entry points import this module
+    import subprocess
     if sys.version >= (2, 7):
         return subprocess.check_output(*popenargs, **kwargs)
     if 'stdout' in kwargs:
@@ -261,7 +337,68 @@ def total_seconds(td):
 
 
 def conf_ensure_section(conf, section):
+    from ConfigParser import DuplicateSectionError
     try:
         conf.add_section(section)
     except DuplicateSectionError:
         pass
+
+
+def host_memory():
+    """Total physical memory of the host, in bytes, or ``None`` if unknown.
+    """
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+MB = 1024 * 1024
+
+USERS_PER_WORKER = 6
+"""Concurrent users a worker can serve, according to Odoo documentation."""
+
+
+def prefork_sizing(cpus, memory, concurrency=None, worker_memory=768 * MB,
+                   cron_threads=2, request_time=60):
+    """Compute the options of the Odoo prefork server (``--workers``).
+
+    :param cpus: number of CPUs available to Odoo
+    :param memory: memory available to Odoo, in bytes
+    :param concurrency: expected number of concurrent users. If ``None``,
+                        the number of workers is derived from ``cpus`` only.
+    :param worker_memory: expected memory footprint of a worker, in bytes
+    :param cron_threads: number of cron workers
+    :param request_time: duration of the longest legitimate requests,
+                         in CPU seconds
+    :returns: ``dict`` of Odoo configuration options
+
+    The number of workers is ``2 * cpus + 1``, lowered according to the
+    expected concurrency, and to what fits in memory, cron workers
+    included. Memory limits share the memory between all processes::
+
+      >>> sizing = prefork_sizing(4, 16 * 1024 * MB)
+      >>> sizing['workers'], sizing['max_cron_threads']
+      (9, 2)
+      >>> sizing['limit_memory_soft'] / MB, sizing['limit_memory_hard'] / MB
+      (1489, 1861)
+      >>> sizing['limit_time_cpu'], sizing['limit_time_real']
+      (60, 120)
+      >>> prefork_sizing(4, 16 * 1024 * MB, concurrency=20)['workers']
+      4
+      >>> prefork_sizing(16, 4 * 1024 * MB)['workers']
+      3
+      >>> prefork_sizing(1, 512 * MB)['workers']
+      1
+    """
+    workers = 2 * cpus + 1
+    if concurrency is not None:
+        workers = min(workers, -(-concurrency // USERS_PER_WORKER))
+    workers = max(min(workers, memory // worker_memory - cron_threads), 1)
+    soft = max(memory // (workers + cron_threads), worker_memory)
+    return dict(workers=workers,
+                max_cron_threads=cron_threads,
+                limit_memory_soft=soft,
+                limit_memory_hard=soft * 5 // 4,
+                limit_time_cpu=request_time,
+                limit_time_real=2 * request_time)
@@ -0,0 +1,186 @@
+"""A local wheelhouse for the requirements of Odoo.
+
+zc.buildout installs eggs, building them from source distributions, which
+for projects with C extensions (``psycopg2``, ``lxml``, ``Pillow``...) means
+compiling them on each host. A wheelhouse is a directory of wheels, that
+can be shared among hosts and buildouts: wheels are built once, then
+converted to eggs in the eggs directory, where zc.buildout finds them
+without any network access.
+
+The SHA-256 digests of the wheels are kept in a ``SHA256SUMS`` file, in the
+format of the ``sha256sum`` utility, and checked before any conversion.
+"""
+import os
+import sys
+import shutil
+import hashlib
+import logging
+import tempfile
+import subprocess
+
+from zc.buildout import UserError
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = 'SHA256SUMS'
+
+
+def file_digest(path):
+    """Return the SHA-256 hexadecimal digest of a file."""
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), ''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def same_project(name1, name2):
+    """Tell if two names designate the same project.
+
+    >>> same_project('python_dateutil', 'python-dateutil')
+    True
+    >>> same_project('Pillow', 'pillow')
+    True
+    """
+    from pkg_resources import safe_name
+    return safe_name(name1).lower() == safe_name(name2).lower()
+
+
+def wheel_class():
+    try:
+        from setuptools.wheel import Wheel
+    except ImportError:
+        raise UserError("Using a wheelhouse requires setuptools >= 38.2, "
+                        "to convert wheels to eggs")
+    return Wheel
+
+
+class Wheelhouse(object):
+    """A directory of wheels, with their digests.
+
+    :param path: the directory, created if needed
+    :param python: the interpreter to build wheels with
+    """
+
+    def __init__(self, path, python=sys.executable):
+        self.path = path
+        self.python = python
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.path, MANIFEST)
+
+    def read_digests(self):
+        """Return the recorded digests, as a dict indexed by file name."""
+        digests = {}
+        if not os.path.exists(self.manifest_path):
+            return digests
+        with open(self.manifest_path) as manifest:
+            for line in manifest:
+                line = line.strip()
+                if line:
+                    digest, fname = line.split(None, 1)
+                    digests[fname.lstrip('*')] = digest
+        return digests
+
+    def record_digest(self, fname):
+        with open(self.manifest_path, 'a') as manifest:
+            manifest.write('%s  %s\n' % (
+                file_digest(os.path.join(self.path, fname)), fname))
+
+    def find(self, project_name, version):
+        """Return the path of a compatible, recorded wheel, or ``None``.
+
+        Wheels that are not recorded in the manifest are ignored.
+        """
+        from pkg_resources import parse_version
+        Wheel = wheel_class()
+        digests = self.read_digests()
+        for fname in sorted(os.listdir(self.path)):
+            if not fname.endswith('.whl') or fname not in digests:
+                continue
+            try:
+                wheel = Wheel(fname)
+            except ValueError:
+                continue
+            if (same_project(wheel.project_name, project_name) and
+                    parse_version(wheel.version) == parse_version(version) and
+                    wheel.is_compatible()):
+                return os.path.join(self.path, fname)
+
+    def verify(self, path):
+        """Check a wheel against its recorded digest.
+
+        :raises: :class:`UserError` if it doesn't match
+        """
+        fname = os.path.basename(path)
+        expected = self.read_digests().get(fname)
+        if expected is None or file_digest(path) != expected:
+            raise UserError("Wheel %r does not match its digest in %r. "
+                            "Remove it from the wheelhouse to have it "
+                            "rebuilt." % (path, self.manifest_path))
+
+    def build(self, project_name, version, index=None, find_links=(),
+              pythonpath=()):
+        """Build a wheel with pip and add it to the wheelhouse.
+
+        :param pythonpath: paths to pip and its own requirements, that the
+                           interpreter may not have by itself.
+        :returns: the path of the new wheel.
+        """
+        req = '%s==%s' % (project_name, version)
+        logger.info("Building a wheel for %s in %r", req, self.path)
+        tmp_dir = tempfile.mkdtemp(dir=self.path)
+        try:
+            cmd = [self.python, '-m', 'pip', 'wheel', '--no-deps',
+                   '--wheel-dir', tmp_dir]
+            if index:
+                cmd.extend(('--index-url', index))
+            for link in find_links:
+                cmd.extend(('--find-links', link))
+            cmd.append(req)
+            env = dict(os.environ)
+            if pythonpath:
+                env['PYTHONPATH'] = os.pathsep.join(pythonpath)
+            if subprocess.call(cmd, env=env) != 0:
+                raise UserError("Could not build a wheel for %s "
+                                "(command was: %s)" % (req, ' '.join(cmd)))
+            wheels = os.listdir(tmp_dir)
+            if not wheels:
+                raise UserError("pip did not produce any wheel for %s "
+                                "(command was: %s)" % (req, ' '.join(cmd)))
+            fname = wheels[0]
+            os.rename(os.path.join(tmp_dir, fname),
+                      os.path.join(self.path, fname))
+        finally:
+            shutil.rmtree(tmp_dir)
+        self.record_digest(fname)
+        return os.path.join(self.path, fname)
+
+    def install_as_egg(self, path, eggs_dir):
+        """Verify a wheel, and convert it into an egg in ``eggs_dir``.
+
+        If the egg is already there, it is kept as is: conversions can't
+        leave incomplete eggs behind.
+
+        :returns: the path of the egg.
+        """
+        self.verify(path)
+        wheel = wheel_class()(path)
+        egg_path = os.path.join(eggs_dir, wheel.egg_name())
+        if os.path.exists(egg_path):
+            logger.info("%r is already installed", os.path.basename(egg_path))
+            return egg_path
+        logger.info("Installing %r from wheelhouse", os.path.basename(path))
+        # converting aside, so that an interrupted conversion can't be
+        # mistaken for an egg
+        tmp_dir = tempfile.mkdtemp(dir=eggs_dir)
+        try:
+            tmp_egg = os.path.join(tmp_dir, wheel.egg_name())
+            wheel.install_as_egg(tmp_egg)
+            os.rename(tmp_egg, egg_path)
+        finally:
+            shutil.rmtree(tmp_dir)
+        return egg_path
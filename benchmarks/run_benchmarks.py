@@ -0,0 +1,356 @@
+"""Benchmarks of the recipe itself, on synthetic buildouts.
+
+A sandbox is generated, with:
+
+* N local repositories of addons (git, hg and bzr, in a round-robin
+  fashion), referenced in the ``addons`` option with ``file://`` URLs,
+* a fake Odoo nightly tarball, served by a local HTTP server that stands
+  in for the nightly download site (``base_url`` option),
+* a fake Babel egg, so that no access to PyPI is needed.
+
+The recipe is used from a source checkout (``develop`` buildout option),
+by default the one containing this script. Each scenario runs
+``bin/buildout`` and is timed, several times:
+
+* ``cold_install``: from an empty buildout directory,
+* ``warm_update``: again, with everything already there,
+* ``offline_update``: again, in offline mode,
+* ``freeze_to``: the ``freeze-to`` option,
+* ``extract_downloads_to``: the ``extract-downloads-to`` option.
+
+Results are appended as a JSON line to a results file, so that versions
+of the recipe can be compared (see ``--help``).
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import tarfile
+import logging
+import threading
+import subprocess
+import SocketServer
+import SimpleHTTPServer
+from argparse import ArgumentParser
+from argparse import ArgumentDefaultsHelpFormatter
+from datetime import datetime
+from tempfile import mkdtemp
+
+logger = logging.getLogger('benchmarks')
+
+RECIPE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ODOO_VERSION = '20160101'
+ODOO_ARCHIVE = 'odoo_8.0.%s.tar.gz' % ODOO_VERSION
+
+FAKE_ODOO_FILES = {
+    'setup.py': (
+        "from setuptools import setup, find_packages\n"
+        "setup(name='odoo', version='8.0-%s', packages=find_packages())\n"
+        % ODOO_VERSION),
+    'openerp-server': "#!/usr/bin/env python\n",
+    'openerp/__init__.py': "",
+    'openerp/release.py': "version_info = (8, 0, 0, 'final', 0)\n",
+    'openerp/tools/__init__.py': "",
+    'openerp/tools/config.py': (
+        "class configmanager(object):\n"
+        "    def __init__(self, fname):\n"
+        "        self.rcfile = fname\n"
+        "\n"
+        "    def save(self):\n"
+        "        with open(self.rcfile, 'w') as f:\n"
+        "            f.write('[options]\\n')\n"),
+    'openerp/addons/__init__.py': "",
+    'openerp/addons/base/__init__.py': "",
+    'openerp/addons/base/__openerp__.py': "{'name': 'base'}\n",
+}
+"""Just enough of Odoo for the recipe to install it."""
+
+VCS_COMMANDS = {
+    'git': (('git', 'init', '-q'),
+            ('git', 'add', '.'),
+            ('git', 'commit', '-q', '-m', 'initial')),
+    'hg': (('hg', 'init'),
+           ('hg', 'commit', '-q', '-A', '-m', 'initial')),
+    'bzr': (('bzr', 'init', '-q'),
+            ('bzr', 'add', '-q'),
+            ('bzr', 'commit', '-q', '-m', 'initial')),
+}
+"""Commands to create a repository of each VCS type from files."""
+
+VCS_REVISIONS = dict(git='master', hg='default', bzr='last:1')
+
+VCS_ENV = dict(GIT_AUTHOR_NAME='Bench', GIT_AUTHOR_EMAIL='bench@example.org',
+               GIT_COMMITTER_NAME='Bench',
+               GIT_COMMITTER_EMAIL='bench@example.org',
+               HGUSER='Bench <bench@example.org>',
+               BZR_EMAIL='Bench <bench@example.org>')
+
+SCENARIOS = (
+    ('cold_install', ()),
+    ('warm_update', ()),
+    ('offline_update', ('-o', )),
+    ('freeze_to', ('-o', 'odoo:freeze-to=frozen.cfg')),
+    ('extract_downloads_to', ('-o',
+                              'odoo:extract-downloads-to=extracted')),
+)
+
+
+def write_files(base_dir, files):
+    for path, contents in files.items():
+        path = os.path.join(base_dir, path)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(contents)
+
+
+def make_odoo_archive(sandbox, target_dir):
+    """Create the fake Odoo nightly tarball in ``target_dir``."""
+    name = 'odoo-8.0-' + ODOO_VERSION
+    src = os.path.join(sandbox, name)
+    write_files(src, FAKE_ODOO_FILES)
+    tar = tarfile.open(os.path.join(target_dir, ODOO_ARCHIVE), 'w:gz')
+    tar.add(src, arcname=name)
+    tar.close()
+    shutil.rmtree(src)
+
+
+def make_babel_egg(sandbox, target_dir):
+    """Build the fake Babel egg of the tests in ``target_dir``."""
+    build_dir = os.path.join(sandbox, 'build')
+    subprocess.check_call(
+        [sys.executable, 'setup.py',
+         'build', '-b', build_dir,
+         'bdist_egg', '-d', target_dir, '-b', build_dir],
+        cwd=os.path.join(RECIPE_DIR, 'anybox', 'recipe', 'odoo', 'tests',
+                         'fake_babel'),
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+
+def make_repo(path, vcs_type, modules=3):
+    """Create a repository of addons, with a few modules."""
+    name = os.path.basename(path)
+    write_files(path, dict(
+        ('%s_mod%d/%s' % (name, i, fname), contents)
+        for i in range(modules)
+        for fname, contents in (
+            ('__init__.py', ''),
+            ('__openerp__.py', "{'name': 'Module %d of %s'}\n" % (i, name)),
+        )))
+    env = dict(os.environ, **VCS_ENV)
+    for cmd in VCS_COMMANDS[vcs_type]:
+        subprocess.check_call(cmd, cwd=path, env=env, stdout=subprocess.PIPE)
+
+
+class QuietHandler(SimpleHTTPServer.SimpleHTTPRequestHandler):
+
+    root = None
+
+    def translate_path(self, path):
+        return os.path.join(self.root, path.split('?', 1)[0].lstrip('/'))
+
+    def log_message(self, *args):
+        pass
+
+
+def serve_directory(root):
+    """Serve ``root`` over HTTP in a thread. Return the server."""
+    class Handler(QuietHandler):
+        pass
+    Handler.root = root
+    server = SocketServer.TCPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def make_sandbox(sandbox, repos, vcs_types, recipe_dir, base_url):
+    """Create the buildout directory, with all repositories and files.
+
+    :returns: the buildout directory
+    """
+    dists = os.path.join(sandbox, 'dists')
+    os.mkdir(dists)
+    make_babel_egg(sandbox, dists)
+
+    addons = []
+    for i in range(repos):
+        vcs_type = vcs_types[i % len(vcs_types)]
+        name = 'repo%d' % i
+        path = os.path.join(sandbox, 'repos', name)
+        make_repo(path, vcs_type)
+        addons.append('%s file://%s parts/%s %s' % (
+            vcs_type, path, name, VCS_REVISIONS[vcs_type]))
+
+    buildout_dir = os.path.join(sandbox, 'buildout')
+    os.mkdir(buildout_dir)
+    write_files(buildout_dir, {'buildout.cfg': '\n'.join((
+        "[buildout]",
+        "parts = odoo",
+        "develop = " + recipe_dir,
+        "find-links = " + dists,
+        "allow-hosts = 127.0.0.1",
+        "",
+        "[odoo]",
+        "recipe = anybox.recipe.odoo:server",
+        "version = nightly 8.0 " + ODOO_VERSION,
+        "base_url = " + base_url,
+        "addons = " + '\n    '.join(addons),
+        ""))})
+    return buildout_dir
+
+
+def clean_buildout(buildout_dir):
+    """Remove everything but the configuration from ``buildout_dir``."""
+    for name in os.listdir(buildout_dir):
+        if name == 'buildout.cfg':
+            continue
+        path = os.path.join(buildout_dir, name)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.unlink(path)
+
+
+def run_buildout(buildout, buildout_dir, args):
+    """Run buildout once, return its duration in seconds."""
+    log_path = os.path.join(os.path.dirname(buildout_dir), 'buildout.log')
+    with open(log_path, 'a') as log_file:
+        log_file.write('===== buildout %s =====\n' % ' '.join(args))
+        log_file.flush()
+        start = time.time()
+        status = subprocess.call([buildout] + list(args), cwd=buildout_dir,
+                                 stdout=log_file, stderr=subprocess.STDOUT)
+        duration = time.time() - start
+    if status:
+        raise RuntimeError("buildout %s failed, see %s" % (
+            ' '.join(args), log_path))
+    return duration
+
+
+def run_scenarios(buildout, buildout_dir, repeat):
+    """Run all scenarios ``repeat`` times.
+
+    :returns: a dict associating scenario names with lists of durations.
+    """
+    durations = dict((name, []) for name, args in SCENARIOS)
+    for i in range(repeat):
+        clean_buildout(buildout_dir)
+        for name, args in SCENARIOS:
+            if name == 'extract_downloads_to':
+                shutil.rmtree(os.path.join(buildout_dir, 'extracted'),
+                              ignore_errors=True)
+            duration = run_buildout(buildout, buildout_dir, args)
+            logger.info("Run %d, %s: %.2f seconds", i + 1, name, duration)
+            durations[name].append(duration)
+    return durations
+
+
+def summarize(durations):
+    summary = {}
+    for name, values in durations.items():
+        values = sorted(values)
+        summary[name] = dict(min=values[0], median=values[len(values) // 2],
+                             runs=values)
+    return summary
+
+
+def recipe_version(recipe_dir):
+    """Version of the recipe, read from its ``setup.py``."""
+    output = subprocess.Popen([sys.executable, 'setup.py', '--version'],
+                              cwd=recipe_dir, stdout=subprocess.PIPE,
+                              stderr=subprocess.PIPE).communicate()[0]
+    return output.strip().splitlines()[-1]
+
+
+def previous_result(results_path, params):
+    """Latest result in ``results_path`` obtained with the same ``params``.
+    """
+    if not os.path.exists(results_path):
+        return None
+    previous = None
+    with open(results_path) as results_file:
+        for line in results_file:
+            result = json.loads(line)
+            if result['params'] == params:
+                previous = result
+    return previous
+
+
+def print_report(result, previous=None, output=sys.stdout):
+    output.write("Recipe %s, %d repositories (%s)\n" % (
+        result['label'], result['params']['repos'],
+        ', '.join(result['params']['vcs'])))
+    if previous is not None:
+        output.write("Compared to %s (%s)\n" % (
+            previous['label'], previous['date']))
+    for name, args in SCENARIOS:
+        stats = result['results'][name]
+        line = "  %-22s min %7.2fs  median %7.2fs" % (name, stats['min'],
+                                                      stats['median'])
+        if previous is not None:
+            before = previous['results'][name]['min']
+            line += "  %+6.1f%%" % (100.0 * (stats['min'] - before) / before)
+        output.write(line + '\n')
+
+
+def main():
+    parser = ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter,
+                            description=__doc__.split('\n')[0])
+    parser.add_argument('-n', '--repos', type=int, default=10,
+                        help="Number of addons repositories")
+    parser.add_argument('--vcs', default='git,hg,bzr',
+                        help="Comma-separated VCS types of repositories")
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help="Number of runs of each scenario")
+    parser.add_argument('--recipe-dir', default=RECIPE_DIR,
+                        help="Source checkout of the recipe to benchmark")
+    parser.add_argument('--buildout', default='buildout',
+                        help="buildout executable to use")
+    parser.add_argument('--label',
+                        help="Label of the results (default: recipe version)")
+    parser.add_argument('--results', default='benchmark_results.json',
+                        help="File to append results to, and to compare "
+                        "them with")
+    parser.add_argument('--keep', action='store_true',
+                        help="Keep the sandbox, for inspection")
+    arguments = parser.parse_args()
+    logging.basicConfig(level=logging.INFO,
+                        format="%(asctime)s %(levelname)s  %(message)s")
+
+    recipe_dir = os.path.abspath(arguments.recipe_dir)
+    params = dict(repos=arguments.repos,
+                  vcs=arguments.vcs.split(','),
+                  repeat=arguments.repeat)
+    sandbox = mkdtemp('anybox_recipe_odoo_bench')
+    http_root = os.path.join(sandbox, 'http')
+    os.mkdir(http_root)
+    server = serve_directory(http_root)
+    try:
+        make_odoo_archive(sandbox, http_root)
+        buildout_dir = make_sandbox(
+            sandbox, arguments.repos, params['vcs'], recipe_dir,
+            'http://127.0.0.1:%d/' % server.server_address[1])
+        logger.info("Sandbox ready in %s", sandbox)
+        durations = run_scenarios(arguments.buildout, buildout_dir,
+                                  arguments.repeat)
+    finally:
+        server.shutdown()
+        if not arguments.keep:
+            shutil.rmtree(sandbox)
+
+    result = dict(label=arguments.label or recipe_version(recipe_dir),
+                  date=datetime.utcnow().isoformat(),
+                  python=sys.version.split()[0],
+                  params=params,
+                  results=summarize(durations))
+    print_report(result, previous_result(arguments.results, params))
+    with open(arguments.results, 'a') as results_file:
+        results_file.write(json.dumps(result, sort_keys=True) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -9,7 +9,8 @@ if sys.version_info < (2, 6):
                      "Yours is " + sys.version + os.linesep)
     sys.exit(1)
 
-# a sufficient version of pip is needed to parse Odoo requirement file
+# pip is not needed to parse Odoo requirement files any more, but it
+# builds the wheels of the 'requirements-wheelhouse' option
 # version 1.4.1 is the one required by reportlab anyway
 requires = ['setuptools', 'zc.recipe.egg', 'zc.buildout>=2.2.0', 'pip>=1.4.1']
 
@@ -31,3 +31,41 @@ class SessionTestCase(TestCase):
         self.session.install_modules(['web_tests'])
         self.assertTrue(self.session.env.context.get('tz'))
         self.session.close()
+
+    def test_install_modules_already_installed(self):
+        self.open_session()
+        registry = self.session._registry
+        self.assertEqual(self.session.modules_to_install(['base']), [])
+        self.session.install_modules(['base'])
+        # no registry reload occurred
+        self.assertIs(self.session._registry, registry)
+        self.assertAdminPresentWithV8API()
+        self.session.close()
+
+    def test_update_changed_modules(self):
+        self.open_session()
+        self.session.update_changed_modules()
+        # nothing changed since the previous call
+        self.assertEqual(self.session.changed_modules(), [])
+        self.assertEqual(self.session.update_changed_modules(), [])
+        self.session.close()
+
+    def test_checkpoint(self):
+        self.open_session()
+        self.session.clear_checkpoints()
+        calls = []
+        self.assertEqual(self.session.checkpoint('step1', calls.append, 1),
+                         None)
+        self.assertEqual(calls, [1])
+        self.assertEqual(self.session.done_checkpoints, ['step1'])
+
+        # rerun: skipped
+        self.session.checkpoint('step1', calls.append, 1)
+        self.session.checkpoint('step2', calls.append, 2)
+        self.assertEqual(calls, [1, 2])
+        self.assertEqual(self.session.done_checkpoints, ['step1', 'step2'])
+
+        self.session.clear_checkpoints()
+        self.assertEqual(self.session.done_checkpoints, [])
+        self.session.cr.commit()
+        self.session.close()